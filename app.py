@@ -10,8 +10,10 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 # Import the correct functions
 from multi_med import get_model_config # Still needed for config
-from multi_med.agents_1 import process_single_case_streaming # Import the streaming function
+from multi_med.agents import process_single_case_streaming # Import the streaming function
 from multi_med.llm_config import MODEL_CONFIGS # Import model configs to get keys
+from multi_med.storage import connect, DEFAULT_DB_PATH
+from multi_med.results_api import query_results, iter_results, results_etag, FILTER_FIELDS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 # TODO: Import necessary function to call LLM directly if available
 # from multi_med.some_module import call_llm_directly
@@ -21,6 +23,10 @@ app = Flask(__name__)
 # Configuration - Get model names directly from the config keys
 MODELS = list(MODEL_CONFIGS.keys())
 CASES_DIR = 'cases'
+# Pause between streamed conversation messages, for readability in the UI (set to 0 for load testing)
+SSE_MESSAGE_DELAY = float(os.getenv('SSE_MESSAGE_DELAY', '0.5'))
+# Results database served by /api/results (opened read-only)
+RESULTS_DB = os.getenv('RESULTS_DB', DEFAULT_DB_PATH)
 
 def get_cases_files():
     """Lists available .jsonl files in the cases directory."""
@@ -54,6 +60,61 @@ def methodology():
     """Serves the Methodology page."""
     return render_template('methodology.html')
 
+@app.route('/api/results')
+def api_results():
+    """
+    Stored case results, filtered by llm/presentation/notes (each may repeat).
+
+    format=json (default) returns {"results": [...], "next_after": id}: pass next_after
+    as `after` to get the next page, until it is null. limit sets the page size.
+    format=ndjson streams every matching result after `after` (up to limit), one JSON
+    object per line. include=log adds each result's conversation_log. Responses carry
+    an ETag; a request with a matching If-None-Match gets 304 without reading any
+    result.
+    """
+    try:
+        after = int(request.args.get('after', 0))
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        return jsonify({"error": "after and limit must be integers"}), 400
+    output = request.args.get('format', 'json')
+    if output not in ('json', 'ndjson'):
+        return jsonify({"error": "format must be json or ndjson"}), 400
+    if limit is not None and limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+    if not os.path.exists(RESULTS_DB):
+        return jsonify({"error": f"Results database {RESULTS_DB} not found"}), 404
+
+    filters = {name: request.args.getlist(name) for name in FILTER_FIELDS}
+    include_log = 'log' in request.args.getlist('include')
+    conn = connect(RESULTS_DB, readonly=True)
+    etag = results_etag(conn, request.query_string.decode())
+    if request.if_none_match.contains(etag):
+        conn.close()
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    if output == 'ndjson':
+        def generate_ndjson():
+            try:
+                for result in iter_results(conn, filters, after, limit, include_log):
+                    yield json.dumps(result) + "\n"
+            finally:
+                conn.close()
+        response = Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+    else:
+        limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        try:
+            results = query_results(conn, filters, after, limit, include_log)
+        finally:
+            conn.close()
+        response = jsonify({"results": results, "next_after": results[-1]['id'] if len(results) == limit else None})
+    response.set_etag(etag)
+    # Clients may cache, but must revalidate with If-None-Match every time
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/chat', methods=['POST'])
 def handle_chat():
     """Handles post-simulation chat requests."""
@@ -132,6 +193,7 @@ def handle_chat():
 @app.route('/run')
 def run_simulation():
     doctor_model_name = request.args.get('doctor_model', 'gemini-2.0-flash')
+    other_model_name = request.args.get('other_model', 'gemini-2.0-flash')
     case_file_name = request.args.get('case_file')
 
     if not case_file_name:
@@ -146,8 +208,8 @@ def run_simulation():
 
     try:
         doctor_config = get_model_config(doctor_model_name)
-        # Use a default for other models for now, or allow selection later
-        other_config = get_model_config("gemini-2.0-flash")
+        # Patient, MeasurementAssistant and Grader model (e.g. local-stub for load testing)
+        other_config = get_model_config(other_model_name)
     except ValueError as e:
         def error_stream(): yield f"data: ERROR:{str(e)}\n\n"
         return Response(stream_with_context(error_stream()), mimetype='text/event-stream')
@@ -195,7 +257,7 @@ def run_simulation():
 
                             # Check if it's a structured conversation message (yielded as dict)
                             if isinstance(message, dict) and message.get("type") == "conversation":
-                                time.sleep(0.5) # Add 0.5 second delay
+                                time.sleep(SSE_MESSAGE_DELAY) # Pause between messages
                                 yield f"data: CONVERSATION:{json.dumps(message)}\n\n"
                             # Check for string markers for final results or filtered INFO
                             elif isinstance(message, str):
@@ -0,0 +1,18 @@
+import argparse
+from multi_med.storage import open_db
+from multi_med.turns import backfill_turns
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill the turns table from existing case_results conversation logs')
+    parser.add_argument('--db', type=str, default='medical_cases.db', help='Results database')
+    args = parser.parse_args()
+
+    conn = open_db(args.db)
+    try:
+        count = backfill_turns(conn)
+    finally:
+        conn.close()
+    print(f"Backfilled turns for {count} cases")
+
+if __name__ == "__main__":
+    main()
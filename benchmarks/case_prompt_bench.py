@@ -0,0 +1,76 @@
+"""
+Token savings of the compact case prompt rendering, per case.
+
+For every case, counts the tokens of the Patient section (Patient_Actor) and the
+MeasurementAssistant sections (Physical_Examination_Findings and Test_Results) in
+the raw rendering of earlier runs and in the compact one. These sections are resent
+with every reply of their agent, so the saving per case is this difference times
+the agent's number of replies. Also times rendering a case cold and from the cache.
+
+    python benchmarks/case_prompt_bench.py --model gpt-4o-mini --per-case
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from multi_med.case_prompts import render_case, _render_case
+from multi_med.tokens import get_encoder, count_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare raw and compact case prompt renderings')
+    parser.add_argument('--cases-glob', type=str, default='cases/*_all_cases.jsonl')
+    parser.add_argument('--model', type=str, default='gpt-4o-mini', help='Model whose tokenizer counts the tokens')
+    parser.add_argument('--per-case', action='store_true', help='Print every case, not only the totals')
+    args = parser.parse_args()
+
+    cases = []
+    for path in sorted(glob.glob(args.cases_glob)):
+        with open(path, 'r') as f:
+            cases.extend((os.path.basename(path), index, json.loads(line)) for index, line in enumerate(f) if line.strip())
+    if not cases:
+        sys.exit(f"No cases match {args.cases_glob}")
+
+    encoder = get_encoder(args.model)
+    totals = {'patient_raw': 0, 'patient_compact': 0, 'measurement_raw': 0, 'measurement_compact': 0}
+    for presentation, index, test_case in cases:
+        raw, compact = render_case(test_case, 'raw'), render_case(test_case, 'compact')
+        # The raw rendering must be exactly what the prompts interpolated before
+        for name, text in raw.items():
+            assert text == str(test_case["OSCE_Examination"].get(name)), (presentation, index, name)
+        counts = {
+            'patient_raw': count_tokens(encoder, raw['Patient_Actor']),
+            'patient_compact': count_tokens(encoder, compact['Patient_Actor']),
+            'measurement_raw': count_tokens(encoder, raw['Physical_Examination_Findings']) + count_tokens(encoder, raw['Test_Results']),
+            'measurement_compact': count_tokens(encoder, compact['Physical_Examination_Findings']) + count_tokens(encoder, compact['Test_Results']),
+        }
+        for key, value in counts.items():
+            totals[key] += value
+        if args.per_case:
+            print(f"{presentation} case {index + 1}: Patient {counts['patient_raw']} -> {counts['patient_compact']}, "
+                  f"MeasurementAssistant {counts['measurement_raw']} -> {counts['measurement_compact']} tokens per reply")
+
+    for agent in ('patient', 'measurement'):
+        raw, compact = totals[f'{agent}_raw'], totals[f'{agent}_compact']
+        print(f"{agent}: {raw} -> {compact} tokens per reply over {len(cases)} cases ({100 * (raw - compact) / raw:.0f}% saved)")
+
+    _render_case.cache_clear()
+    started = time.perf_counter()
+    for _, _, test_case in cases:
+        render_case(test_case, 'compact')
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    for _, _, test_case in cases:
+        render_case(test_case, 'compact')
+    warm = time.perf_counter() - started
+    print(f"Rendering: {cold / len(cases) * 1e6:.0f} us per case cold, {warm / len(cases) * 1e6:.0f} us from the cache")
+
+
+if __name__ == "__main__":
+    main()
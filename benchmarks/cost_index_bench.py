@@ -0,0 +1,50 @@
+"""
+Benchmark of the fuzzy-match index over INVESTIGATION_COSTS.
+
+Matches every line of the unknown_investigations.txt backlog (repeated to a target
+size) against the index, first with an empty match cache and then warm, and prints
+how many lines the exact lookup (get_investigation_cost) and the index resolve.
+
+    python benchmarks/cost_index_bench.py --lines 5000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from investigation_costs import get_investigation_cost
+from multi_med.cost_index import best_match, match_investigations, read_unknown_investigations, MIN_SCORE
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the investigation cost fuzzy-match index')
+    parser.add_argument('--path', type=str, default='unknown_investigations.txt', help='Backlog of unknown investigations')
+    parser.add_argument('--lines', type=int, default=5000, help='Repeat the backlog up to this many lines')
+    parser.add_argument('--min-score', type=float, default=MIN_SCORE, help='Lowest score accepted as a match')
+    args = parser.parse_args()
+
+    backlog = read_unknown_investigations(args.path)
+    if not backlog:
+        sys.exit(f"No investigations in {args.path}")
+    lines = (backlog * (args.lines // len(backlog) + 1))[:max(args.lines, len(backlog))]
+
+    exact = sum(1 for line in backlog if get_investigation_cost(line))
+    best_match.cache_clear()
+    started = time.perf_counter()
+    matches = match_investigations(backlog, args.min_score)
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    match_investigations(lines, args.min_score)
+    warm = time.perf_counter() - started
+
+    matched = sum(1 for match in matches if match['investigation'])
+    print(f"{len(backlog)} distinct lines: {exact} exact matches, {matched} index matches (score >= {args.min_score})")
+    print(f"Cold: {cold * 1000:.1f} ms ({cold / len(backlog) * 1e6:.1f} us/line)")
+    print(f"{len(lines)} lines: {warm * 1000:.1f} ms ({warm / len(lines) * 1e6:.1f} us/line)")
+
+
+if __name__ == "__main__":
+    main()
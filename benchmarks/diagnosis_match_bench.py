@@ -0,0 +1,69 @@
+"""
+Check the local diagnosis matcher against the Grader LLM verdicts stored in
+medical_cases.db, and time it.
+
+For every stored case it reports whether match_diagnosis would have graded the case
+locally, and whether the Grader LLM marked those cases correct too. Cases the matcher
+leaves to the Grader are not counted either way.
+
+    python benchmarks/diagnosis_match_bench.py --db medical_cases.db --show
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from multi_med.diagnosis_match import match_diagnosis, diagnosis_names
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark local diagnosis matching against stored Grader verdicts')
+    parser.add_argument('--db', type=str, default='medical_cases.db', help='Results database with graded cases')
+    parser.add_argument('--repeat', type=int, default=20, help='Passes over all cases for the timing')
+    parser.add_argument('--show', action='store_true', help='Print the cases matched locally that the Grader marked incorrect')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    rows = conn.execute('SELECT correct_diagnosis, doctor_diagnosis, is_correct FROM case_results WHERE doctor_diagnosis IS NOT NULL').fetchall()
+    conn.close()
+    if not rows:
+        sys.exit(f"No graded cases in {args.db}")
+
+    counts = Counter()
+    disagreements = []
+    for correct, doctor, is_correct in rows:
+        match = match_diagnosis(doctor, correct)
+        if match is None:
+            counts['grader'] += 1
+            continue
+        counts[match['rule']] += 1
+        if is_correct:
+            counts['agree'] += 1
+        else:
+            disagreements.append((doctor, correct, match))
+
+    local = counts['exact'] + counts['alias']
+    print(f"{len(rows)} cases: {local} matched locally ({counts['exact']} exact, {counts['alias']} alias), "
+          f"{counts['grader']} left to the Grader")
+    if local:
+        print(f"Grader LLM agreed on {counts['agree']}/{local} local matches ({100 * counts['agree'] / local:.1f}%)")
+    if args.show:
+        for doctor, correct, match in disagreements:
+            print(f"  {doctor[:80]!r} vs {correct!r}: {match['rule']} on '{match['alias']}'")
+
+    diagnosis_names.cache_clear()
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for correct, doctor, _ in rows:
+            match_diagnosis(doctor, correct)
+    elapsed = (time.perf_counter() - started) / (args.repeat * len(rows))
+    print(f"{elapsed * 1e6:.1f} us per case")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Compare the single-pass event extractor with the log scanning it replaced, over the
+conversation logs stored in medical_cases.db.
+
+    old  build the log with +=, run extract_diagnosis on every Doctor turn, then
+         extract_investigation_costs: split into lines, uncompiled re.search per line
+         and a 15-line rescan for every test request (with its DEBUG prints)
+    new  build the log with join, one EventExtractor pass over the turns, summarise_events
+
+Both paths start from the turns (parsed from the stored log outside the timing), so
+the numbers match what summarise_consultation does at the end of a run.
+
+    python benchmarks/event_bench.py --db medical_cases.db --repeat 5
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import re
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from multi_med.agents import extract_diagnosis
+from multi_med.events import extract_events, parse_conversation_log, summarise_events
+from multi_med.log_store import iter_conversation_logs
+
+
+def legacy_extract_investigation_costs(conversation_log: str) -> tuple:
+    """extract_investigation_costs as it was before the event extractor."""
+    total_cost = 0.0
+    unknown_investigations = []
+    cost_matches = re.findall(r'COST:\s*\$(\d+\.?\d*)', conversation_log, re.IGNORECASE)
+    for cost_str in cost_matches:
+        try:
+            cost = float(cost_str)
+            total_cost += cost
+            print(f"DEBUG: Found cost ${cost:.2f}")
+        except ValueError:
+            continue
+    lines = conversation_log.split('\n')
+    for i, line in enumerate(lines):
+        test_match = re.search(r'REQUEST TESTS:\s*([^.\n]+)', line, re.IGNORECASE)
+        if test_match:
+            test_name = test_match.group(1).strip()
+            print(f"DEBUG: Found test request: '{test_name}'")
+            cost_found = False
+            for j in range(i + 1, min(i + 15, len(lines))):
+                cost_match = re.search(r'COST:\s*\$(\d+\.?\d*)', lines[j], re.IGNORECASE)
+                if cost_match:
+                    cost = float(cost_match.group(1))
+                    print(f"DEBUG: Found cost ${cost:.2f} for test '{test_name}'")
+                    cost_found = True
+                    if cost == 0.0 and test_name not in unknown_investigations:
+                        unknown_investigations.append(test_name)
+                        print(f"DEBUG: Found unknown test: {test_name} (cost: $0.00)")
+                    break
+            if not cost_found:
+                print(f"DEBUG: No cost found for test '{test_name}'")
+    return total_cost, unknown_investigations
+
+
+def run_old(turns):
+    conversation_log = ""
+    doctor_diagnosis = None
+    is_correct = False
+    for message in turns:
+        sender = message.get("name", "Unknown")
+        content = message.get("content", "")
+        conversation_log += f"{sender}: {content}\n\n"
+        if sender == "Doctor":
+            extracted_diagnosis = extract_diagnosis(content)
+            if extracted_diagnosis:
+                doctor_diagnosis = extracted_diagnosis
+        if sender == "Grader":
+            is_correct = "YES" in content.upper() and doctor_diagnosis is not None
+    total_cost, unknown = legacy_extract_investigation_costs(conversation_log)
+    return doctor_diagnosis, is_correct, total_cost, unknown
+
+
+def run_new(turns):
+    conversation_log = "".join(f"{message.get('name', 'Unknown')}: {message.get('content', '')}\n\n" for message in turns)
+    summary = summarise_events(extract_events(turns))
+    return summary['doctor_diagnosis'], summary['is_correct'], summary['quoted_cost'], summary['zero_cost_requests']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark conversation event extraction')
+    parser.add_argument('--db', type=str, default='medical_cases.db', help='Results database with stored conversation logs')
+    parser.add_argument('--repeat', type=int, default=5, help='Passes over all stored logs per path')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    logs = [log for _, log in iter_conversation_logs(conn)]
+    conn.close()
+    if not logs:
+        sys.exit(f"No conversation logs in {args.db}")
+
+    started = time.perf_counter()
+    cases = [parse_conversation_log(log) for log in logs]
+    parse_time = time.perf_counter() - started
+    turns = sum(len(case) for case in cases)
+    print(f"{len(cases)} logs, {turns} turns (parsing the stored logs took {parse_time * 1000:.1f} ms)")
+
+    timings = {}
+    for name, run in (('old', run_old), ('new', run_new)):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                results = [run(case) for case in cases]
+            timings[name] = (time.perf_counter() - started) / args.repeat
+        timings[name + '_results'] = results
+        print(f"{name}: {timings[name] * 1000:.1f} ms per pass, {timings[name] / len(cases) * 1e6:.1f} us per case")
+
+    differences = sum(1 for old, new in zip(timings['old_results'], timings['new_results']) if old != new)
+    print(f"Speedup: {timings['old'] / timings['new']:.1f}x; {differences} cases with different results")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Micro-benchmark of per-turn history handling in the consultation engine.
+
+Compares rebuilding the role-mapped history for the next speaker from the whole
+conversation on every turn (the previous streaming path) with the incrementally
+maintained per-agent histories of Consultation. Agents reply instantly, so only the
+orchestration cost is measured; with rebuilding, the cost per turn grows with the
+length of the conversation.
+
+    python benchmarks/history_bench.py --turns 10 50 200
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from multi_med.orchestrator import Consultation, OPENING_MESSAGE, select_next_speaker
+
+REPLY = "It started a few days ago and it has been getting a bit worse, mostly in the evenings."
+
+
+class InstantAgent:
+    """Agent that replies immediately; the Doctor diagnoses after a set number of questions."""
+
+    def __init__(self, name: str, questions: int):
+        self.name = name
+        self.questions = questions
+        self.turns = 0
+
+    def generate_reply(self, messages=None, **kwargs):
+        self.turns += 1
+        if self.name == "Grader":
+            return "YES.\nTERMINATE"
+        if self.name == "Doctor":
+            return "DIAGNOSIS READY: Migraine" if self.turns > self.questions else "Can you describe the pain?"
+        return REPLY
+
+
+def make_agents(questions: int):
+    return {name: InstantAgent(name, questions) for name in ("Doctor", "Patient", "MeasurementAssistant", "Grader")}
+
+
+def run_rebuilding(questions: int) -> int:
+    """The previous streaming loop: rebuild the next speaker's history from all messages each turn."""
+    agents = make_agents(questions)
+    messages = [{"name": "Doctor", "content": OPENING_MESSAGE}]
+    while True:
+        speaker = select_next_speaker(messages[-1]["name"], messages[-1]["content"])
+        if speaker is None:
+            return len(messages) - 1
+        formatted_messages = []
+        for msg in messages:
+            role = "assistant" if msg.get('name') == speaker else "user"
+            formatted_messages.append({"role": role, "content": msg.get('content', '')})
+        reply = agents[speaker].generate_reply(messages=formatted_messages)
+        messages.append({"name": speaker, "content": reply})
+
+
+def run_incremental(questions: int) -> int:
+    consultation = Consultation(make_agents(questions), max_turns=10 * questions + 10)
+    for _ in consultation.run():
+        pass
+    return len(consultation.messages) - 1
+
+
+def time_per_turn(runner, questions: int, repeats: int) -> float:
+    started = time.perf_counter()
+    turns = sum(runner(questions) for _ in range(repeats))
+    return 1e6 * (time.perf_counter() - started) / turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmark of per-turn history handling')
+    parser.add_argument('--turns', type=int, nargs='+', default=[10, 50, 200], help='Doctor questions per consultation (about two turns each)')
+    parser.add_argument('--repeats', type=int, default=200, help='Consultations per measurement')
+    args = parser.parse_args()
+
+    print(f"{'turns':>6} {'rebuild us/turn':>16} {'incremental us/turn':>20} {'speedup':>8}")
+    for questions in args.turns:
+        rebuild = time_per_turn(run_rebuilding, questions, args.repeats)
+        incremental = time_per_turn(run_incremental, questions, args.repeats)
+        print(f"{2 * questions + 2:>6} {rebuild:>16.2f} {incremental:>20.2f} {rebuild / incremental:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
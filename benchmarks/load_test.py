@@ -0,0 +1,151 @@
+"""
+Load test the batch runner or the app.py /run SSE stream against the local stand-in server.
+
+Start the stand-in server first:
+    python -m multi_med.stub_server --latency-dist lognormal --latency-mean 0.5 --tokens-per-second 80
+
+Batch runner, 300 cases with 200 in flight:
+    python benchmarks/load_test.py batch --cases-count 300 --concurrency 200
+
+app.py /run SSE stream, 50 concurrent clients (start app.py with SSE_MESSAGE_DELAY=0):
+    python benchmarks/load_test.py sse --concurrency 50 --app-url http://127.0.0.1:5000
+
+Each run appends its throughput to --history and is compared with the best previous run
+of the same mode, so throughput regressions show up as a negative delta.
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_batch(args):
+    """Drive run_jobs with local-stub models and report cases per second."""
+    from multi_med.runner import load_jobs, run_jobs
+
+    cases_files = sorted(glob.glob(args.cases))
+    jobs = load_jobs(cases_files, [args.model])
+    jobs = (jobs * (args.cases_count // max(1, len(jobs)) + 1))[:args.cases_count]
+    # Completion times are measured from the start of the run
+    latencies = []
+    turns = []
+    started = {}
+
+    def on_result(job, result):
+        latencies.append(time.time() - started['t'])
+        turns.append(result['conversation_log'].count('\n\n'))
+
+    started['t'] = time.time()
+    counts = asyncio.run(run_jobs(jobs, args.model, on_result, max_concurrent_cases=args.concurrency))
+    elapsed = time.time() - started['t']
+    return {
+        'cases': counts['completed'],
+        'failed': counts['failed'],
+        'elapsed': elapsed,
+        'cases_per_second': counts['completed'] / elapsed if elapsed else 0.0,
+        'turns_per_second': sum(turns) / elapsed if elapsed else 0.0,
+        'p50_completion_s': percentile(latencies, 0.5),
+        'p95_completion_s': percentile(latencies, 0.95),
+    }
+
+
+def run_sse(args):
+    """Open concurrent /run SSE streams on app.py and count streamed conversation events."""
+    case_files = [os.path.basename(path) for path in sorted(glob.glob(args.cases))]
+    events = []
+    durations = []
+    errors = []
+    lock = threading.Lock()
+
+    def client(i):
+        query = urllib.parse.urlencode({
+            'doctor_model': args.model,
+            'other_model': args.model,
+            'case_file': case_files[i % len(case_files)],
+        })
+        t = time.time()
+        count = 0
+        try:
+            with urllib.request.urlopen(f"{args.app_url}/run?{query}", timeout=args.timeout) as response:
+                for raw in response:
+                    line = raw.decode('utf-8').strip()
+                    if line.startswith('data: CONVERSATION:'):
+                        count += 1
+                    elif line.startswith('data: ERROR:'):
+                        with lock:
+                            errors.append(line)
+                    elif line == 'data: SIMULATION_COMPLETE':
+                        break
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+        with lock:
+            events.append(count)
+            durations.append(time.time() - t)
+
+    started = time.time()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+    return {
+        'streams': len(durations),
+        'errors': len(errors),
+        'elapsed': elapsed,
+        'events_per_second': sum(events) / elapsed if elapsed else 0.0,
+        'p50_stream_s': percentile(durations, 0.5),
+        'mean_events_per_stream': statistics.mean(events) if events else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test against the local stand-in LLM server')
+    parser.add_argument('mode', choices=['batch', 'sse'])
+    parser.add_argument('--cases', type=str, default='cases/*_all_cases.jsonl', help='Glob of case files to draw cases from')
+    parser.add_argument('--cases-count', type=int, default=300, help='Number of cases to run (batch mode)')
+    parser.add_argument('--concurrency', type=int, default=100, help='Cases (batch) or SSE clients (sse) in flight')
+    parser.add_argument('--model', type=str, default='local-stub', help='MODEL_CONFIGS entry pointing at the stand-in server')
+    parser.add_argument('--app-url', type=str, default='http://127.0.0.1:5000', help='Base URL of app.py (sse mode)')
+    parser.add_argument('--timeout', type=float, default=600, help='Per-stream timeout in seconds (sse mode)')
+    parser.add_argument('--history', type=str, default='benchmarks/load_history.jsonl', help='File that throughput results are appended to')
+    args = parser.parse_args()
+
+    report = run_batch(args) if args.mode == 'batch' else run_sse(args)
+    report.update({'mode': args.mode, 'concurrency': args.concurrency, 'timestamp': time.time()})
+
+    for key, value in report.items():
+        print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+
+    metric = 'cases_per_second' if args.mode == 'batch' else 'events_per_second'
+    previous = []
+    if os.path.exists(args.history):
+        with open(args.history) as f:
+            previous = [json.loads(line) for line in f if line.strip()]
+    best = max((entry[metric] for entry in previous if entry.get('mode') == args.mode and entry.get('concurrency') == args.concurrency), default=None)
+    if best:
+        print(f"{metric} vs best previous run: {100 * (report[metric] - best) / best:+.1f}%")
+    with open(args.history, 'a') as f:
+        f.write(json.dumps(report) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Compare the Consultation state machine with the autogen GroupChat/GroupChatManager
+orchestration it replaced.
+
+Both paths use the same MedicalAgents, driven by a scripted transport, so no LLM is
+called and the numbers measure orchestration overhead only:
+    setup     time to build the agents (plus GroupChat and GroupChatManager for the old path)
+    per turn  CPU time per reply once the consultation is running
+
+    python benchmarks/orchestrator_bench.py --cases 200 --questions 20
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import autogen
+
+from multi_med.agents import create_agents
+from multi_med.llm_config import get_model_config
+from multi_med.orchestrator import Consultation, OPENING_MESSAGE, select_next_speaker
+
+
+class ScriptedTransport:
+    """Replaying transport that serves a fixed consultation script instead of a recording."""
+
+    replaying = True
+
+    def __init__(self, questions: int):
+        self.questions = questions
+        self.doctor_turns = 0
+
+    def next_reply(self, agent: str, request: str) -> str:
+        if agent == "Patient":
+            return "It started a few days ago and it has been getting a bit worse."
+        if agent == "MeasurementAssistant":
+            return "Haemoglobin 135 g/L, white cell count 7.2. COST: $16.95"
+        if agent == "Grader":
+            return "YES. The diagnoses match.\nTERMINATE"
+        self.doctor_turns += 1
+        if self.doctor_turns <= self.questions:
+            return f"Question {self.doctor_turns}: can you tell me more about your symptoms?"
+        if self.doctor_turns == self.questions + 1:
+            return "REQUEST TESTS: Full Blood Count"
+        return "DIAGNOSIS READY: Tension-type headache\nReasoning: consistent with the history."
+
+
+def build_groupchat(agents):
+    """The GroupChat/GroupChatManager setup used before the Consultation engine."""
+    def speaker_selection(last_speaker, groupchat):
+        last = groupchat.messages[-1] if groupchat.messages else None
+        name = select_next_speaker(last_speaker.name if last else None, last.get("content", "") if last else "")
+        return groupchat.agent_by_name(name) if name else None
+
+    groupchat = autogen.GroupChat(
+        agents=list(agents.values()),
+        messages=[],
+        allow_repeat_speaker=False,
+        max_round=1000,
+        speaker_selection_method=speaker_selection
+    )
+    manager = autogen.GroupChatManager(groupchat=groupchat, llm_config=agents["Patient"].llm_config)
+    return groupchat, manager
+
+
+def run_groupchat(test_case, config, questions):
+    started = time.perf_counter()
+    agents = create_agents(test_case, "You are Dr Agent.", config, config, ScriptedTransport(questions))
+    groupchat, manager = build_groupchat(agents)
+    setup = time.perf_counter() - started
+    agents["Doctor"].initiate_chat(manager, message=OPENING_MESSAGE)
+    return setup, time.perf_counter() - started - setup, len(groupchat.messages) - 1
+
+
+def run_consultation(test_case, config, questions):
+    started = time.perf_counter()
+    agents = create_agents(test_case, "You are Dr Agent.", config, config, ScriptedTransport(questions))
+    consultation = Consultation(agents, max_turns=1000)
+    setup = time.perf_counter() - started
+    for _ in consultation.run():
+        pass
+    return setup, time.perf_counter() - started - setup, len(consultation.messages) - 1
+
+
+def measure(runner, test_cases, config, questions):
+    setup_total = turns_total = run_total = 0.0
+    # autogen prints every GroupChat message; keep the console out of the timings of both paths
+    with contextlib.redirect_stdout(io.StringIO()):
+        for test_case in test_cases:
+            setup, run, turns = runner(test_case, config, questions)
+            setup_total += setup
+            run_total += run
+            turns_total += turns
+    return {
+        'setup_ms_per_case': 1000 * setup_total / len(test_cases),
+        'us_per_turn': 1e6 * run_total / turns_total,
+        'turns_per_case': turns_total / len(test_cases),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark consultation orchestration overhead')
+    parser.add_argument('--cases-glob', type=str, default='cases/*_all_cases.jsonl')
+    parser.add_argument('--cases', type=int, default=100, help='Number of cases to run per path')
+    parser.add_argument('--questions', type=int, default=10, help='History questions the scripted Doctor asks')
+    parser.add_argument('--model', type=str, default='local-stub', help='MODEL_CONFIGS entry used to build the agents (never called)')
+    args = parser.parse_args()
+
+    test_cases = []
+    for path in sorted(glob.glob(args.cases_glob)):
+        with open(path) as f:
+            test_cases.extend(json.loads(line) for line in f if line.strip())
+    test_cases = (test_cases * (args.cases // max(1, len(test_cases)) + 1))[:args.cases]
+    config = get_model_config(args.model)
+
+    results = {
+        'groupchat': measure(run_groupchat, test_cases, config, args.questions),
+        'consultation': measure(run_consultation, test_cases, config, args.questions),
+    }
+    for name, result in results.items():
+        print(f"{name:>12}: setup {result['setup_ms_per_case']:.2f} ms/case, "
+              f"{result['us_per_turn']:.1f} us/turn, {result['turns_per_case']:.0f} turns/case")
+    old, new = results['groupchat'], results['consultation']
+    print(f"speedup: setup x{old['setup_ms_per_case'] / new['setup_ms_per_case']:.2f}, "
+          f"per turn x{old['us_per_turn'] / new['us_per_turn']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark of result writes with a concurrent reader.
+
+Writes the case results stored in medical_cases.db (each with its turns) into a scratch
+database, while a reader thread keeps running a per-model accuracy query against the
+same file, like the Flask app would:
+
+    old      rollback journal, one commit per case (the previous init_db/save path)
+    new      open_db (WAL, migrated schema) with BatchedCommits
+    threads  --workers threads, each with its own WAL connection committing per case
+    writer   --workers threads handing their cases to one ResultWriter
+
+and prints write throughput, how many reads completed, the slowest read and how many
+reads or writes failed with "database is locked".
+
+    python benchmarks/storage_bench.py --db medical_cases.db --cases 2000 --workers 16
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from multi_med.events import parse_conversation_log
+from multi_med.log_store import iter_conversation_logs
+from multi_med.storage import connect, open_db, migrate, save_case_result, BatchedCommits
+from multi_med.result_writer import ResultWriter
+from multi_med.turns import build_turn_rows
+
+READ_QUERY = 'SELECT llm, presentation, COUNT(*), AVG(is_correct) FROM case_results GROUP BY llm, presentation'
+
+
+def load_results(db_path: str, count: int) -> list:
+    conn = sqlite3.connect(db_path)
+    logs = dict(iter_conversation_logs(conn))
+    rows = [(llm, presentation, correct, doctor, is_correct, logs[rowid], cost) for rowid, llm, presentation, correct, doctor, is_correct, cost in
+            conn.execute('SELECT rowid, llm, presentation, correct_diagnosis, doctor_diagnosis, is_correct, total_investigation_cost FROM case_results')
+            if rowid in logs]
+    conn.close()
+    results = []
+    for llm, presentation, correct, doctor, is_correct, log, cost in (rows * (count // max(len(rows), 1) + 1))[:count]:
+        results.append((llm, presentation, {'correct_diagnosis': correct, 'doctor_diagnosis': doctor, 'is_correct': bool(is_correct),
+                                            'conversation_log': log, 'total_investigation_cost': cost or 0.0,
+                                            'turns': build_turn_rows(parse_conversation_log(log))}))
+    return results
+
+
+def reader(path: str, stop: threading.Event, stats: dict, readonly: bool):
+    conn = connect(path, readonly=True) if readonly else sqlite3.connect(path)
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            conn.execute(READ_QUERY).fetchall()
+            stats['reads'] += 1
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            stats['locked'] += 1
+        stats['slowest'] = max(stats['slowest'], time.perf_counter() - started)
+    conn.close()
+
+
+def write_threaded(path: str, results: list, workers: int, flush_interval: float, use_writer: bool) -> int:
+    """Write results from several threads; returns how many writes failed with "database is locked"."""
+    writer = ResultWriter(path, flush_interval) if use_writer else None
+    locked = [0]
+
+    def work(share):
+        conn = None if writer else connect(path)
+        for llm, presentation, result in share:
+            if writer:
+                writer.submit(save_case_result, llm, presentation, result, 'storage bench', commit=False)
+                continue
+            try:
+                save_case_result(conn, llm, presentation, result, 'storage bench')
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                conn.rollback()
+                locked[0] += 1
+        if conn:
+            conn.close()
+
+    threads = [threading.Thread(target=work, args=(results[i::workers],)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if writer:
+        writer.close()
+    return locked[0]
+
+
+def run(name: str, results: list, flush_interval: float, workers: int) -> None:
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    if name == 'old':
+        conn = sqlite3.connect(path)
+        # Same tables as the new path, but left in the default rollback journal mode
+        migrate(conn)
+        conn.execute('PRAGMA journal_mode=DELETE')
+        commits = None
+    else:
+        conn = open_db(path)
+        commits = BatchedCommits(conn, flush_interval)
+
+    stats = {'reads': 0, 'locked': 0, 'slowest': 0.0}
+    stop = threading.Event()
+    thread = threading.Thread(target=reader, args=(path, stop, stats, name != 'old'))
+    thread.start()
+    started = time.perf_counter()
+    locked_writes = 0
+    if name in ('threads', 'writer'):
+        locked_writes = write_threaded(path, results, workers, flush_interval, name == 'writer')
+    else:
+        for llm, presentation, result in results:
+            save_case_result(conn, llm, presentation, result, 'storage bench', commit=commits is None)
+            if commits:
+                commits.written()
+        if commits:
+            commits.flush()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    thread.join()
+    conn.close()
+
+    print(f"{name}: {len(results) / elapsed:.0f} cases/s ({elapsed:.2f}s), {locked_writes} writes 'database is locked'; "
+          f"reader: {stats['reads']} queries, slowest {stats['slowest'] * 1000:.1f} ms, {stats['locked']} 'database is locked'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark result writes with a concurrent reader')
+    parser.add_argument('--db', type=str, default='medical_cases.db', help='Results database to take the case results from')
+    parser.add_argument('--cases', type=int, default=2000, help='Case results to write per path')
+    parser.add_argument('--flush-interval', type=float, default=1.0, help='Seconds between commits on the new and writer paths')
+    parser.add_argument('--workers', type=int, default=16, help='Writing threads on the threads and writer paths')
+    args = parser.parse_args()
+
+    results = load_results(args.db, args.cases)
+    if not results:
+        sys.exit(f"No case results in {args.db}")
+    print(f"Writing {len(results)} case results ({sum(len(r[2]['turns']) for r in results)} turns) per path")
+    for name in ('old', 'new', 'threads', 'writer'):
+        run(name, results, args.flush_interval, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark of score reports from case_summary against a full GROUP BY over case_results.
+
+Copies the case_results rows of medical_cases.db into a scratch database (migrated, so
+the summary triggers run on every insert) until it holds --rows rows, then
+
+- checks that case_scores matches the same numbers computed with GROUP BY over
+  case_results;
+- times the per-(llm, presentation) accuracy report both ways;
+- times inserting the rows with and without the triggers, to show their write cost.
+
+    python benchmarks/summary_bench.py --db medical_cases.db --rows 50000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from multi_med.storage import open_db
+
+GROUP_BY_QUERY = '''SELECT COALESCE(llm, ''), COALESCE(presentation, ''), COALESCE(notes, ''), COUNT(*), COUNT(is_correct),
+                           TOTAL(COALESCE(is_correct, 0)), AVG(COALESCE(total_investigation_cost, 0)), AVG(turn_count), AVG(total_tokens)
+                    FROM case_results GROUP BY 1, 2, 3 ORDER BY 1, 2, 3'''
+SUMMARY_QUERY = '''SELECT llm, presentation, notes, cases, graded, correct, mean_cost, mean_turns, mean_tokens
+                   FROM case_scores ORDER BY 1, 2, 3'''
+
+COPIED_COLUMNS = 'llm, presentation, correct_diagnosis, doctor_diagnosis, is_correct, total_investigation_cost, notes, unknown_investigations, turn_count, total_tokens'
+
+
+def fill(path: str, rows: list, count: int, triggers: bool) -> float:
+    """Insert count rows (cycling through rows) in batches; returns the seconds taken."""
+    conn = open_db(path)
+    if not triggers:
+        for name in ('case_summary_insert', 'case_summary_update', 'case_summary_delete'):
+            conn.execute(f'DROP TRIGGER {name}')
+    placeholders = ', '.join('?' * len(COPIED_COLUMNS.split(',')))
+    started = time.perf_counter()
+    for start in range(0, count, 1000):
+        batch = [rows[i % len(rows)] for i in range(start, min(count, start + 1000))]
+        conn.executemany(f'INSERT INTO case_results ({COPIED_COLUMNS}) VALUES ({placeholders})', batch)
+        conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed
+
+
+def timed(conn, query: str, repeat: int) -> tuple:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        rows = conn.execute(query).fetchall()
+    return rows, (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark score reports from case_summary against GROUP BY')
+    parser.add_argument('--db', type=str, default='medical_cases.db', help='Results database to take the case results from')
+    parser.add_argument('--rows', type=int, default=50000, help='case_results rows in the scratch database')
+    parser.add_argument('--repeat', type=int, default=20, help='Times each report query is run')
+    args = parser.parse_args()
+
+    source = sqlite3.connect(args.db)
+    columns = [row[1] for row in source.execute('PRAGMA table_info(case_results)')]
+    # Older databases lack the count columns; copy NULLs like their unmigrated rows would have
+    select = ', '.join(name if name in columns else 'NULL' for name in COPIED_COLUMNS.split(', '))
+    rows = source.execute(f'SELECT {select} FROM case_results').fetchall()
+    source.close()
+    if not rows:
+        sys.exit(f"No case results in {args.db}")
+
+    directory = tempfile.mkdtemp()
+    without = fill(os.path.join(directory, 'plain.db'), rows, args.rows, triggers=False)
+    path = os.path.join(directory, 'summary.db')
+    with_triggers = fill(path, rows, args.rows, triggers=True)
+    print(f"Inserting {args.rows} rows: {args.rows / without:.0f} rows/s without triggers, {args.rows / with_triggers:.0f} rows/s with them")
+
+    conn = sqlite3.connect(path)
+    full, full_time = timed(conn, GROUP_BY_QUERY, args.repeat)
+    summary, summary_time = timed(conn, SUMMARY_QUERY, args.repeat)
+    mismatches = sum(1 for a, b in zip(full, summary)
+                     if a[:6] != b[:6] or any(x != y and (x is None or y is None or abs(x - y) > 1e-9) for x, y in zip(a[6:], b[6:])))
+    mismatches += abs(len(full) - len(summary))
+    print(f"GROUP BY over case_results: {full_time * 1000:.2f} ms; case_scores: {summary_time * 1000:.3f} ms "
+          f"({full_time / summary_time:.0f}x faster), {len(summary)} groups, {mismatches} mismatches")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
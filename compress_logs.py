@@ -0,0 +1,33 @@
+import argparse
+import os
+from multi_med.storage import open_db
+from multi_med.log_store import train_from_stored_logs, compress_stored_logs
+
+def main():
+    parser = argparse.ArgumentParser(description='Compress the conversation logs in a results database')
+    parser.add_argument('--db', type=str, default='medical_cases.db', help='Results database')
+    parser.add_argument('--train', action='store_true', help='Train a new dictionary on the stored logs and recompress every log with it')
+    parser.add_argument('--vacuum', action='store_true', help='Rebuild the database file afterwards to give the freed pages back')
+    args = parser.parse_args()
+
+    size = os.path.getsize(args.db) if os.path.exists(args.db) else 0
+    # Opening the database migrates it, which compresses any logs still stored as text
+    conn = open_db(args.db)
+    try:
+        if args.train:
+            dictionary_id = train_from_stored_logs(conn)
+            conn.commit()
+            if dictionary_id is None:
+                print("Too few stored logs to train a dictionary")
+            else:
+                print(f"Trained dictionary {dictionary_id}")
+        count = compress_stored_logs(conn, recompress=args.train)
+        print(f"Compressed {count} conversation logs")
+        if args.vacuum:
+            conn.execute('VACUUM')
+    finally:
+        conn.close()
+    print(f"{args.db}: {size / 1e6:.2f} MB -> {os.path.getsize(args.db) / 1e6:.2f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import argparse
+from multi_med.storage import open_db
+from multi_med.parquet_export import export_parquet, EXPORT_BATCH
+
+def main():
+    parser = argparse.ArgumentParser(description='Append new results, turns and events to partitioned Parquet datasets')
+    parser.add_argument('--db', type=str, default='medical_cases.db', help='Results database')
+    parser.add_argument('--out', type=str, default='exports/parquet', help='Output directory')
+    parser.add_argument('--batch', type=int, default=EXPORT_BATCH, help='Cases per part file')
+    parser.add_argument('--limit', type=int, default=None, help='Export at most this many new cases')
+    args = parser.parse_args()
+
+    conn = open_db(args.db)
+    try:
+        counts = export_parquet(conn, args.out, args.batch, args.limit)
+    finally:
+        conn.close()
+    print(f"Exported {counts['results']} results, {counts['turns']} turns and {counts['events']} events to {args.out}"
+          f" ({counts['held_back']} cases held back until graded)")
+
+if __name__ == "__main__":
+    main()
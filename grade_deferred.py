@@ -0,0 +1,23 @@
+import argparse
+from multi_med.storage import open_db
+from multi_med.batch_grading import grade_pending, BATCH_SIZE
+
+def main():
+    parser = argparse.ArgumentParser(description='Grade the cases queued by --grading deferred in batches and fill in is_correct')
+    parser.add_argument('--db', type=str, default='medical_cases.db', help='Results database')
+    parser.add_argument('--model', type=str, default='gemini-2.5-flash', help='Model that grades the queued cases (local-stub for the stand-in server)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Diagnosis pairs graded per LLM call')
+    parser.add_argument('--limit', type=int, default=None, help='Grade at most this many queued cases')
+    args = parser.parse_args()
+
+    conn = open_db(args.db)
+    try:
+        counts = grade_pending(conn, args.model, args.batch_size, args.limit)
+    finally:
+        conn.close()
+    print(f"Graded {counts['graded']} cases ({counts['correct']} correct) in {counts['calls']} LLM calls")
+    if counts['ungraded']:
+        print(f"{counts['ungraded']} cases had no verdict in the reply and are still queued")
+
+if __name__ == "__main__":
+    main()
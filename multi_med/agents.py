@@ -1,8 +1,18 @@
-import autogen
 from typing import Dict, Any, Optional
 import re
 from investigation_costs import get_investigation_cost, get_investigation_details, get_total_cost, INVESTIGATION_COSTS
-import tiktoken
+from .llm_agent import MedicalAgent
+from .orchestrator import Consultation
+from .tokens import TurnTokenCounter, get_encoder, count_tokens
+from .cost_retrieval import cost_prompt_mode, extract_test_requests, find_cost_candidates, format_cost_entries, NO_MATCHING_COSTS
+from .cost_resolver import resolve_test_request
+from .cost_index import fill_unresolved, fuzzy_cost
+from .events import EventExtractor, extract_events, parse_conversation_log, summarise_events
+from .turns import build_turn_rows
+from .case_prompts import render_case, case_prompt_mode, case_prompt_savings
+from .context import context_policies, context_savings
+from .diagnosis_match import grading_mode, match_diagnosis, local_grade_reply, grader_path
+from .batch_grading import grading_request
 
 def extract_diagnosis(content: str) -> Optional[str]:
     """
@@ -28,56 +38,20 @@ def extract_diagnosis(content: str) -> Optional[str]:
 
 def extract_investigation_costs(conversation_log: str) -> tuple[float, list[str]]:
     """
-    Extract total investigation costs and unknown investigations from conversation log.
-    
+    Extract the costs quoted by the MeasurementAssistant from a stored conversation log.
+
+    Live runs cost tests from the resolved REQUEST TESTS records instead; this reads
+    the "COST: $x" lines of logs written before that.
+
     Args:
         conversation_log: The full conversation log as a string
         
     Returns:
-        Tuple of (total_cost, unknown_investigations_list)
+        Tuple of (total_cost, unknown_investigations_list), where unknown investigations
+        are test requests whose first quoted cost was $0.00
     """
-    total_cost = 0.0
-    unknown_investigations = []
-    
-    # Extract all costs using regex
-    cost_pattern = r'COST:\s*\$(\d+\.?\d*)'
-    cost_matches = re.findall(cost_pattern, conversation_log, re.IGNORECASE)
-    
-    for cost_str in cost_matches:
-        try:
-            cost = float(cost_str)
-            total_cost += cost
-            print(f"DEBUG: Found cost ${cost:.2f}")
-        except ValueError:
-            continue
-    
-    # Find tests that were requested but have $0.00 cost (unknown to MeasurementAssistant)
-    # We need to match test requests with their corresponding cost responses
-    lines = conversation_log.split('\n')
-    for i, line in enumerate(lines):
-        # Look for test requests - improved regex to handle various formats
-        test_match = re.search(r'REQUEST TESTS:\s*([^.\n]+)', line, re.IGNORECASE)
-        if test_match:
-            test_name = test_match.group(1).strip()
-            print(f"DEBUG: Found test request: '{test_name}'")
-            
-            # Look for the corresponding cost response in the next few lines
-            cost_found = False
-            for j in range(i+1, min(i+15, len(lines))):  # Check next 15 lines (increased from 10)
-                cost_match = re.search(r'COST:\s*\$(\d+\.?\d*)', lines[j], re.IGNORECASE)
-                if cost_match:
-                    cost = float(cost_match.group(1))
-                    print(f"DEBUG: Found cost ${cost:.2f} for test '{test_name}'")
-                    cost_found = True
-                    if cost == 0.0 and test_name not in unknown_investigations:
-                        unknown_investigations.append(test_name)
-                        print(f"DEBUG: Found unknown test: {test_name} (cost: $0.00)")
-                    break
-            
-            if not cost_found:
-                print(f"DEBUG: No cost found for test '{test_name}'")
-    
-    return total_cost, unknown_investigations
+    summary = summarise_events(extract_events(parse_conversation_log(conversation_log)))
+    return summary['quoted_cost'], summary['zero_cost_requests']
 
 def write_unknown_investigations(unknown_investigations: list[str], case_info: str = ""):
     """
@@ -109,41 +83,22 @@ def generate_cost_list() -> str:
     
     return ", ".join(cost_items)
 
-def process_single_case(test_case: Dict[str, Any], doctor_config: Dict[str, Any], other_config: Dict[str, Any]) -> Dict[str, Any]:
+def build_measurement_system_message(test_case: Dict[str, Any], cost_list: str) -> str:
     """
-    Process a single medical case using multiple AI agents.
-    
+    Build the MeasurementAssistant system message.
+
     Args:
         test_case: Dictionary containing the medical case information
-        doctor_config: Configuration for the doctor agent
-        other_config: Configuration for other agents
-        
-    Returns:
-        Dictionary containing the case results
-    """
-    doctor_system_message = f"""
-    You are a doctor named Dr Agent, working-up a patient with the goal of finding the diagnosis. You can only respond in dialogue (text, no additional formatting)
-    Each turn, you can do only ONE of the following:
-    1. Ask a question to the patient for any relevant history. (only one question at a time)
-    2. request to perform a specific examination and elicit signs using the format "REQUEST EXAMINATION FINDING: [specific examination]". For example, "REQUEST EXAMINATION FINDING: assess the JVP".
-    3. request to perform specific imaging or laboratory tests using the format "REQUEST TESTS: [test]". For example, "REQUEST TESTS: chest x-ray". If a result is not available continue the consult without this information.
-    4. If you have gathered all the information you need, output "DIAGNOSIS READY: [diagnosis here]". Be confident and provide a specific diagnosis. Explain your reasoning for the diagnosis.
-    """
+        cost_list: Priced investigations to quote, as returned by generate_cost_list
 
-    patient_system_message = f"""
-    Act as a patient who is being assessed by a doctor. Answer questions you are asked based on the following information:
-    {test_case["OSCE_Examination"]["Patient_Actor"]}
-    Respond in colloquial, non-jargon language that a non-medical person will speak in. 
-    Your answer should be a direct response to the question you have been asked. Do not volunteer any additional information.
+    Returns:
+        The system message
     """
-
-    # Generate the cost list dynamically from investigation_costs.py
-    cost_list = generate_cost_list()
-    
-    measurement_system_message = f"""
+    sections = render_case(test_case)
+    return f"""
     You are a clinical assistant who responds in dialogue to the doctor's request for information. Below are all the patient's physical examination findings and test results you have: 
-    {test_case["OSCE_Examination"]["Physical_Examination_Findings"]}
-    {test_case["OSCE_Examination"]["Test_Results"]}
+    {sections["Physical_Examination_Findings"]}
+    {sections["Test_Results"]}
     
     COST TRACKING: When the doctor requests tests using "REQUEST TESTS: [test name]", you should:
     1. Provide the test results as usual if available
@@ -161,6 +116,33 @@ def process_single_case(test_case: Dict[str, Any], doctor_config: Dict[str, Any]
     Otherwise, respond with "NO INFORMATION"
     """
 
+def create_agents(test_case: Dict[str, Any], doctor_system_message: str, doctor_config: Dict[str, Any], other_config: Dict[str, Any], transport=None) -> Dict[str, MedicalAgent]:
+    """
+    Create the Doctor, Patient, MeasurementAssistant and Grader for a case.
+
+    Args:
+        test_case: Dictionary containing the medical case information
+        doctor_system_message: System message for the doctor agent
+        doctor_config: Configuration for the doctor agent
+        other_config: Configuration for other agents
+        transport: Optional CaseTransport that records or replays the case's LLM calls
+
+    Returns:
+        Dictionary of agents keyed by name
+    """
+    # Case sections are rendered once per case (see case_prompts.py)
+    patient_system_message = f"""
+    Act as a patient who is being assessed by a doctor. Answer questions you are asked based on the following information:
+    {render_case(test_case)["Patient_Actor"]}
+    Respond in colloquial, non-jargon language that a non-medical person will speak in. 
+    Your answer should be a direct response to the question you have been asked. Do not volunteer any additional information.
+    """
+
+    # Generate the cost list dynamically from investigation_costs.py, or leave it out when
+    # only the entries matching each test request are injected (see cost_retrieval.py)
+    cost_list = NO_MATCHING_COSTS if cost_prompt_mode() == 'retrieval' else generate_cost_list()
+    measurement_system_message = build_measurement_system_message(test_case, cost_list)
+
     grader_system_message = f"""
     The correct diagnosis is:
     {test_case["OSCE_Examination"]["Correct_Diagnosis"]}
@@ -176,126 +158,144 @@ def process_single_case(test_case: Dict[str, Any], doctor_config: Dict[str, Any]
     grader_description = "Grader - Evaluator who only speaks after the doctor makes a diagnosis with 'DIAGNOSIS READY:'."
 
     # Create the agents
-    doctor = autogen.AssistantAgent(
+    doctor = MedicalAgent(
         name="Doctor",
         system_message=doctor_system_message,
         description=doctor_description,
-        llm_config=doctor_config
+        llm_config=doctor_config,
+        transport=transport
     )
 
-    patient = autogen.AssistantAgent(
+    patient = MedicalAgent(
         name="Patient",
         system_message=patient_system_message,
         description=patient_description,
-        llm_config=other_config
+        llm_config=other_config,
+        transport=transport
     )
 
-    measurement_assistant = autogen.AssistantAgent(
+    measurement_assistant = MedicalAgent(
         name="MeasurementAssistant",
         system_message=measurement_system_message,
         description=measurement_description,
-        llm_config=other_config
+        llm_config=other_config,
+        transport=transport
     )
 
-    grader = autogen.AssistantAgent(
+    grader = MedicalAgent(
         name="Grader",
         system_message=grader_system_message,
         description=grader_description,
         llm_config=other_config,
-        is_termination_msg=lambda msg: "TERMINATE" in msg.get("content", "").upper()
+        is_termination_msg=lambda msg: "TERMINATE" in msg.get("content", "").upper(),
+        transport=transport
     )
 
-    # Define a custom speaker selection function that follows our conversation flow
-    def custom_speaker_selection(last_speaker, groupchat):
-        messages = groupchat.messages
-        if not messages or len(messages) == 0:
-            return groupchat.agent_by_name("Patient")
-        
-        # Get the last message - in autogen format
-        last_message = messages[-1]
-        # The sender is passed as the last_speaker parameter
-        sender_name = last_speaker.name if last_speaker else "None"
-        # Content is directly in the message
-        message_text = last_message.get("content", "")
-        
-        # Check for termination conditions
-        if "TERMINATE" in message_text.upper() or message_text.lower().strip() == "exit":
-            return None
-        
-        # Handle special examination or test requests
-        if "REQUEST EXAMINATION FINDING:" in message_text or "REQUEST TESTS:" in message_text:
-            return groupchat.agent_by_name("MeasurementAssistant")
-        
-        # Diagnosis handling - must be exact format
-        if "DIAGNOSIS READY:" in message_text and sender_name == "Doctor":
-            return groupchat.agent_by_name("Grader")
-        
-        # After grader speaks
-        if sender_name == "Grader":
-            return None
-        
-        # Normal conversation flow
-        if sender_name == "Doctor":
-            return groupchat.agent_by_name("Patient")
-        elif sender_name == "Patient":
-            return groupchat.agent_by_name("Doctor")
-        elif sender_name == "MeasurementAssistant":
-            return groupchat.agent_by_name("Doctor")
-        
-        return None
-
-    # Create the group chat
-    groupchat = autogen.GroupChat(
-        agents=[doctor, patient, measurement_assistant, grader],
-        messages=[],
-        allow_repeat_speaker=False,
-        max_round=50,
-        speaker_selection_method=custom_speaker_selection
-    )
+    return {agent.name: agent for agent in (doctor, patient, measurement_assistant, grader)}
 
-    # Create the manager
-    manager = autogen.GroupChatManager(
-        groupchat=groupchat,
-        llm_config=other_config
-    )
+def start_consultation(test_case: Dict[str, Any], agents: Dict[str, MedicalAgent], grading: Optional[str] = None) -> tuple[Consultation, Optional[Dict[str, int]]]:
+    """
+    Set up the Consultation for a case, resolving test costs and, if enabled, injecting them.
+
+    Before each MeasurementAssistant turn the Doctor's REQUEST TESTS lines are resolved
+    locally (see cost_resolver.py, with cost_index.py as a fuzzy fallback) and the cost
+    records are attached to the Doctor's message as message['investigations']. In retrieval mode the MeasurementAssistant
+    system message is also rebuilt with only the resolved entries, plus the closest
+    matches for anything that did not resolve. Each agent is sent the part of the
+    conversation its context policy allows (see context.py). In local and deferred
+    grading modes a diagnosis that clearly matches the correct one is graded without
+    calling the Grader (see diagnosis_match.py); in deferred mode the consultation
+    otherwise stops before the Grader's turn (see batch_grading.py).
 
-    # Start the conversation
-    doctor.initiate_chat(
-        manager,
-        message="Hello, I'm Dr. Agent. What can I do to help you today?",
-    )
+    Args:
+        test_case: Dictionary containing the medical case information
+        agents: Agents returned by create_agents
+        grading: Grading mode; defaults to grading_mode()
+
+    Returns:
+        Tuple of (consultation, cost prompt statistics or None in full mode)
+    """
+    retrieval = cost_prompt_mode() == 'retrieval'
+    stats = {'mode': 'retrieval', 'turns': 0, 'test_requests': 0, 'full_list_tokens': 0, 'injected_tokens': 0}
+    full_list = generate_cost_list() if retrieval else None
+    full_list_tokens = {}
+
+    grading = grading or grading_mode()
+    local_grading = grading in ('local', 'deferred')
+
+    def grade_locally(consultation):
+        match = match_diagnosis(extract_diagnosis(consultation.messages[-1]['content']),
+                                test_case["OSCE_Examination"]["Correct_Diagnosis"])
+        return local_grade_reply(match) if match else None
+
+    def before_reply(speaker, consultation):
+        if speaker == "Grader":
+            return grade_locally(consultation) if local_grading else None
+        resolve_costs(speaker, consultation)
+
+    def resolve_costs(speaker, consultation):
+        if speaker != "MeasurementAssistant":
+            return
+        turn = len(consultation.messages) - 1
+        message = consultation.messages[turn]
+        requests = extract_test_requests(message['content']) if message['name'] == "Doctor" else []
+        records = fill_unresolved([record for request in requests for record in resolve_test_request(request, turn)])
+        if records:
+            message['investigations'] = records
+        if not retrieval:
+            return
+
+        agent = consultation.agents[speaker]
+        names = list(dict.fromkeys(record['investigation'] for record in records if record['investigation']))
+        for record in records:
+            if record['investigation'] is None:
+                candidates = ([record['fuzzy']['investigation']] if record.get('fuzzy') else []) + find_cost_candidates(record['request'])
+                names.extend(name for name in candidates if name not in names)
+        cost_list = format_cost_entries(names) if names else NO_MATCHING_COSTS
+        agent.update_system_message(build_measurement_system_message(test_case, cost_list))
+
+        encoder = get_encoder(agent.model_name())
+        if 'tokens' not in full_list_tokens:
+            full_list_tokens['tokens'] = count_tokens(encoder, full_list)
+        stats['turns'] += 1
+        stats['test_requests'] += len(requests)
+        stats['full_list_tokens'] += full_list_tokens['tokens']
+        stats['injected_tokens'] += count_tokens(encoder, cost_list)
+
+    consultation = Consultation(agents, on_request=before_reply, context=context_policies(),
+                                stop_before=("Grader",) if grading == 'deferred' else ())
+    return consultation, stats if retrieval else None
+
+def summarise_consultation(test_case: Dict[str, Any], messages: list[Dict[str, str]], events: Optional[list[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Build the case result from a finished consultation.
 
+    Args:
+        test_case: Dictionary containing the medical case information
+        messages: The consultation messages as {"name", "content"} dicts, with resolved
+            test costs in "investigations" on the Doctor's REQUEST TESTS messages
+        events: The consultation's events if they were extracted during the run
+
+    Returns:
+        Dictionary containing the case results
+    """
     # Format conversation and extract results
-    conversation_log = ""
-    doctor_diagnosis = None
-    is_correct = False
-
-    for message in groupchat.messages:
-        sender = message.get("name", "Unknown")
-        content = message.get("content", "")
-        conversation_log += f"{sender}: {content}\n\n"
-        
-        # Extract doctor's diagnosis with improved safety
-        if sender == "Doctor":
-            extracted_diagnosis = extract_diagnosis(content)
-            if extracted_diagnosis:
-                doctor_diagnosis = extracted_diagnosis
-        
-        # Check if diagnosis was correct with improved safety
-        if sender == "Grader":
-            is_correct = "YES" in content.upper() and doctor_diagnosis is not None
+    conversation_log = "".join(f"{message.get('name', 'Unknown')}: {message.get('content', '')}\n\n" for message in messages)
+    if events is None:
+        events = extract_events(messages)
+    summary = summarise_events(events)
+    doctor_diagnosis = summary['doctor_diagnosis']
+    is_correct = summary['is_correct']
 
     # Validate the results before returning
     if not doctor_diagnosis:
         print("Warning: No valid diagnosis was extracted from the conversation")
         doctor_diagnosis = "NO DIAGNOSIS PROVIDED"
 
-    # Extract total investigation costs
-    total_investigation_cost, unknown_investigations = extract_investigation_costs(conversation_log)
-    
-    # Debug: Print the extracted cost
-    print(f"DEBUG: Extracted total investigation cost: ${total_investigation_cost:.2f}")
-    print(f"DEBUG: Conversation log contains 'COST:' {conversation_log.count('COST:')} times")
+    # Total the costs resolved for each REQUEST TESTS turn
+    investigations = [record for message in messages for record in message.get("investigations", [])]
+    total_investigation_cost = sum(record['cost'] for record in investigations)
+    unknown_investigations = list(dict.fromkeys(record['request'] for record in investigations if record['investigation'] is None))
 
     write_unknown_investigations(unknown_investigations, case_info=test_case["OSCE_Examination"]["Patient_Actor"])
 
@@ -305,10 +305,84 @@ def process_single_case(test_case: Dict[str, Any], doctor_config: Dict[str, Any]
         'is_correct': is_correct,
         'conversation_log': conversation_log,
         'total_investigation_cost': total_investigation_cost,
-        'unknown_investigations': unknown_investigations
+        'fuzzy_investigation_cost': fuzzy_cost(investigations),
+        'unknown_investigations': unknown_investigations,
+        'investigations': investigations,
+        'events': events,
+        'grader': grader_path(messages)
     }
 
-def process_single_case_streaming(test_case: Dict[str, Any], doctor_config: Dict[str, Any], other_config: Dict[str, Any]):
+def consultation_result(test_case: Dict[str, Any], agents: Dict[str, MedicalAgent], consultation: Consultation,
+                        tokens: TurnTokenCounter, extractor: EventExtractor, cost_prompt: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    """
+    The case result of a finished run, with its token, turn and prompt-savings statistics.
+
+    Shared by process_single_case and process_single_case_streaming.
+
+    Args:
+        test_case: Dictionary containing the medical case information
+        agents: The case's agents by name
+        consultation: The consultation after its run
+        tokens: Token counter fed every turn of the run
+        extractor: Event extractor fed every message of the run
+        cost_prompt: Cost prompt statistics from start_consultation, if any
+
+    Returns:
+        Dictionary containing the case results
+    """
+    result = summarise_consultation(test_case, consultation.messages, extractor.events)
+    result['turn_tokens'] = tokens.turns
+    result['turns'] = build_turn_rows(consultation.messages, extractor.events, tokens.turns)
+    if cost_prompt:
+        result['cost_prompt'] = cost_prompt
+    if case_prompt_mode() == 'compact':
+        agent_turns = {name: sum(1 for message in consultation.messages[1:] if message['name'] == name) for name in agents}
+        result['case_prompt'] = case_prompt_savings(test_case, agent_turns, get_encoder(agents['Patient'].model_name()))
+    context = context_savings(tokens.turns, consultation.context)
+    if context:
+        result['context'] = context
+    return result
+
+def process_single_case(test_case: Dict[str, Any], doctor_config: Dict[str, Any], other_config: Dict[str, Any], transport=None) -> Dict[str, Any]:
+    """
+    Process a single medical case using multiple AI agents.
+    
+    Args:
+        test_case: Dictionary containing the medical case information
+        doctor_config: Configuration for the doctor agent
+        other_config: Configuration for other agents
+        transport: Optional CaseTransport that records or replays the case's LLM calls
+        
+    Returns:
+        Dictionary containing the case results
+    """
+    doctor_system_message = f"""
+    You are a doctor named Dr Agent, working-up a patient with the goal of finding the diagnosis. You can only respond in dialogue (text, no additional formatting)
+    Each turn, you can do only ONE of the following:
+    1. Ask a question to the patient for any relevant history. (only one question at a time)
+    2. request to perform a specific examination and elicit signs using the format "REQUEST EXAMINATION FINDING: [specific examination]". For example, "REQUEST EXAMINATION FINDING: assess the JVP".
+    3. request to perform specific imaging or laboratory tests using the format "REQUEST TESTS: [test]". For example, "REQUEST TESTS: chest x-ray". If a result is not available continue the consult without this information.
+    4. If you have gathered all the information you need, output "DIAGNOSIS READY: [diagnosis here]". Be confident and provide a specific diagnosis. Explain your reasoning for the diagnosis.
+    """
+
+    agents = create_agents(test_case, doctor_system_message, doctor_config, other_config, transport)
+    consultation, cost_prompt = start_consultation(test_case, agents)
+    tokens = TurnTokenCounter()
+    extractor = EventExtractor()
+    for message in consultation.run():
+        extractor.feed(message['name'], message['content'])
+        if len(consultation.messages) > 1 and not message.get('local'):
+            tokens.record(agents[message['name']], consultation.messages, consultation.sent_view)
+
+    result = consultation_result(test_case, agents, consultation, tokens, extractor, cost_prompt)
+    if consultation.stopped_before == "Grader":
+        # Graded after the run, in a batch (see batch_grading.py)
+        result['is_correct'] = None
+        result['grader'] = 'deferred'
+        result['grading_request'] = grading_request(test_case, consultation.messages, result['doctor_diagnosis'])
+    return result
+
+def process_single_case_streaming(test_case: Dict[str, Any], doctor_config: Dict[str, Any], other_config: Dict[str, Any], transport=None):
     """
     Process a single medical case using multiple AI agents, yielding messages as they occur.
     
@@ -316,9 +390,11 @@ def process_single_case_streaming(test_case: Dict[str, Any], doctor_config: Dict
         test_case: Dictionary containing the medical case information
         doctor_config: Configuration for the doctor agent
         other_config: Configuration for other agents
+        transport: Optional CaseTransport that records or replays the case's LLM calls
         
     Yields:
-        str: Formatted messages from the agent conversation
+        dict: {"type": "conversation", "name", "content"} for each message of the consultation
+        str: "INFO:...", "ERROR:..." and "FINAL_...:" markers, then "CASE_PROCESSING_COMPLETE"
     """
     doctor_system_message = f"""
     You are Dr. Agent, a medical doctor working to diagnose a patient based on the information provided by the Patient Agent and the Measurement Assistant. Your objective is to gather relevant history, perform necessary examinations, and request tests to reach a confident, specific diagnosis.
@@ -351,282 +427,31 @@ def process_single_case_streaming(test_case: Dict[str, Any], doctor_config: Dict
     Your goal is to reach a clear, specific, and **correct** diagnosis through careful questioning, examination, and testing.
     """
 
-    patient_system_message = f"""
-    Act as a patient who is being assessed by a doctor. Answer questions you are asked based on the following information:
-    {test_case["OSCE_Examination"]["Patient_Actor"]}
-    Respond in colloquial, non-jargon language that a non-medical person will speak in. 
-    Your answer should be a direct response to the question you have been asked. Do not volunteer any additional information.
-    """
-
-    measurement_system_message = f"""
-    You are a clinical assistant who responds in dialogue to the doctor's request for information. Below are all the patient's physical examination findings and test results you have: 
-    {test_case["OSCE_Examination"]["Physical_Examination_Findings"]}
-    {test_case["OSCE_Examination"]["Test_Results"]}
-    
-    COST TRACKING: When the doctor requests tests using "REQUEST TESTS: [test name]", you should:
-    1. Provide the test results as usual if available
-    2. ALWAYS include the Medicare cost for the test in your response using the format: "COST: $[amount]"
-    3. Use these exact costs: {generate_cost_list()}
-    4. If the test is not in the list above, use "COST: $0.00"
-    5. Even if you respond with "NO INFORMATION" because the test result is not available, you MUST still include the cost information
-    
-    IMPORTANT: 
-    - You MUST include the cost information in EVERY test response (REQUEST TESTS), even if the test result is not available.
-    - Do NOT include cost information for examination findings (REQUEST EXAMINATION FINDING) as these are free.
-    
-    Respond in simple text format. Do not use json or other data structures.
-    Do not volunteer any additional information that the doctor has not asked for.
-    Otherwise, respond with "NO INFORMATION"
-    """
-
-    grader_system_message = f"""
-    The correct diagnosis is:
-    {test_case["OSCE_Examination"]["Correct_Diagnosis"]}
-    Is this the same as the doctor's diagnosis? Please respond with "YES" or "NO". Explain your reasoning. 
-    If the doctor's diagnosis is more specific than the correct diagnosis, consider it correct.
-    After your output, please respond with "TERMINATE"
-    """
-
-    doctor_description = "Doctor - Medical professional who asks the patient questions, requests examinations and tests, and makes a diagnosis."
-    patient_description = "Patient - Person with medical concerns who answers the doctor's questions about symptoms and history."
-    measurement_description = "MeasurementAssistant - Clinical assistant who provides examination findings and test results when requested."
-    grader_description = "Grader - Evaluator who only speaks after the doctor makes a diagnosis with 'DIAGNOSIS READY:'."
+    agents = create_agents(test_case, doctor_system_message, doctor_config, other_config, transport)
+    # The stream reports the verdict at the end of the case, so grading is never deferred here
+    grading = 'local' if grading_mode() == 'deferred' else None
+    consultation, cost_prompt = start_consultation(test_case, agents, grading)
+    tokens = TurnTokenCounter()
+    extractor = EventExtractor()
 
-    doctor = autogen.AssistantAgent(
-        name="Doctor",
-        system_message=doctor_system_message,
-        description=doctor_description,
-        llm_config=doctor_config
-    )
-
-    patient = autogen.AssistantAgent(
-        name="Patient",
-        system_message=patient_system_message,
-        description=patient_description,
-        llm_config=other_config
-    )
-
-    measurement_assistant = autogen.AssistantAgent(
-        name="MeasurementAssistant",
-        system_message=measurement_system_message,
-        description=measurement_description,
-        llm_config=other_config
-    )
-
-    grader = autogen.AssistantAgent(
-        name="Grader",
-        system_message=grader_system_message,
-        description=grader_description,
-        llm_config=other_config,
-        is_termination_msg=lambda msg: "TERMINATE" in msg.get("content", "").upper()
-    )
-
-    def custom_speaker_selection_streaming(last_speaker, groupchat):
-        messages = groupchat.messages
-        if not messages or len(messages) == 0:
-            return groupchat.agent_by_name("Patient")
-        
-        last_message = messages[-1]
-        sender_name = last_speaker.name if last_speaker else "None"
-        message_text = last_message.get("content", "")
-        
-        if "TERMINATE" in message_text.upper() or message_text.lower().strip() == "exit":
-            return None
-        
-        if "REQUEST EXAMINATION FINDING:" in message_text or "REQUEST TESTS:" in message_text:
-            return groupchat.agent_by_name("MeasurementAssistant")
-        
-        if "DIAGNOSIS READY:" in message_text and sender_name == "Doctor":
-            return groupchat.agent_by_name("Grader")
-        
-        if sender_name == "Grader":
-            return None
-        
-        if sender_name == "Doctor":
-            return groupchat.agent_by_name("Patient")
-        elif sender_name == "Patient":
-            return groupchat.agent_by_name("Doctor")
-        elif sender_name == "MeasurementAssistant":
-            return groupchat.agent_by_name("Doctor")
-        
-        return None
-
-    groupchat = autogen.GroupChat(
-        agents=[doctor, patient, measurement_assistant, grader],
-        messages=[],
-        allow_repeat_speaker=False,
-        max_round=50,
-        speaker_selection_method=custom_speaker_selection_streaming
-    )
-
-    manager = autogen.GroupChatManager(
-        groupchat=groupchat,
-        llm_config=other_config
-    )
-
-    current_speaker = doctor
-    message_content = "Hello, I'm Dr. Agent. What can I do to help you today?"
-    initial_message = {"name": current_speaker.name, "content": message_content}
-    groupchat.messages.append(initial_message)
-    # Yield the initial message in the standard dictionary format
-    yield {"type": "conversation", "name": initial_message['name'], "content": initial_message['content']}
-
-    max_turns = 50
-    for i in range(max_turns):
-        print(f"\n--- Turn {i+1} ---") # DEBUG
-        print(f"Current Speaker: {current_speaker.name}") # DEBUG
-        print(f"Groupchat Messages ({len(groupchat.messages)}): {groupchat.messages[-3:]}") # DEBUG: Show last few messages
-        
-        next_speaker = custom_speaker_selection_streaming(current_speaker, groupchat)
-        print(f"Selected Next Speaker: {next_speaker.name if next_speaker else 'None'}") # DEBUG
-        
-        if next_speaker is None:
-            # Yield simulation end reason as INFO
-            yield "INFO:Simulation ended by speaker selection."
-            break
-        
-        # Let the next speaker generate a reply
-        try:
-            print(f"Generating reply from: {next_speaker.name}") # DEBUG
-            
-            # Convert messages to the expected format for generate_reply
-            # Map current speaker to 'user' and next speaker (recipient) to 'assistant' from POV of next_speaker
-            formatted_messages = []
-            for msg in groupchat.messages:
-                sender_name = msg.get('name')
-                content = msg.get('content', '')
-                
-                if sender_name == next_speaker.name:
-                    # Messages from the agent *about to speak* are considered 'assistant' in its history
-                    role = "assistant"
-                else:
-                    # Messages from other agents are considered 'user' input to the agent about to speak
-                    role = "user"
-                    
-                formatted_messages.append({"role": role, "content": content})
-            
-            print(f"Formatted messages for {next_speaker.name}: {formatted_messages[-3:]}") # DEBUG
-            
-            # --- TOKEN LOGGING START ---
-            # Use tiktoken to count tokens for the input prompt
-            model_name = None
-            if hasattr(next_speaker, 'llm_config') and next_speaker.llm_config:
-                config_list = next_speaker.llm_config.get('config_list', [])
-                if config_list and 'model' in config_list[0]:
-                    model_name = config_list[0]['model']
-            if not model_name:
-                model_name = 'gpt-3.5-turbo'  # fallback
-            try:
-                enc = tiktoken.encoding_for_model(model_name)
-            except Exception:
-                enc = tiktoken.get_encoding('cl100k_base')
-            # Compose the input as a list of dicts (OpenAI format)
-            input_token_count = 0
-            all_input_tokens = []
-            for m in formatted_messages:
-                tokens = enc.encode(m['content'])
-                input_token_count += len(tokens)
-                all_input_tokens.extend(tokens)
-            print(f"[TOKENS] {next_speaker.name} INPUT TOKENS: {input_token_count} (model: {model_name})")
-            print(f"[TOKENS] {next_speaker.name} INPUT TOKEN IDS: {all_input_tokens}")
-            print(f"[TOKENS] {next_speaker.name} INPUT DECODED: {enc.decode(all_input_tokens)}")
-            # --- TOKEN LOGGING END ---
-            
-            # Explicitly pass the *formatted* message history to the agent
-            # We don't need the 'sender' argument if history is formatted correctly with user/assistant roles
-            reply = next_speaker.generate_reply(messages=formatted_messages)
-            print(f"Raw Reply from {next_speaker.name}: {reply}") # DEBUG
-            # --- TOKEN LOGGING OUTPUT ---
-            reply_content = reply.get('content', '') if isinstance(reply, dict) else (reply if isinstance(reply, str) else '')
-            output_tokens = enc.encode(reply_content)
-            output_token_count = len(output_tokens)
-            print(f"[TOKENS] {next_speaker.name} OUTPUT TOKENS: {output_token_count} (model: {model_name})")
-            print(f"[TOKENS] {next_speaker.name} OUTPUT TOKEN IDS: {output_tokens}")
-            print(f"[TOKENS] {next_speaker.name} OUTPUT DECODED: {enc.decode(output_tokens)}")
-            # --- END TOKEN LOGGING OUTPUT ---
-        except Exception as e:
-            print(f"ERROR during generate_reply: {e}") # DEBUG
-            yield f"ERROR:Error generating reply from {next_speaker.name}: {e}"
-            # yield "[Simulation finished.]" # Redundant with CASE_PROCESSING_COMPLETE
-            break # Stop simulation on error
-        
-        if reply is None: # Could happen if agent decides not to reply
-             yield f"INFO:{next_speaker.name} did not provide a reply. Ending simulation."
-             break
-
-        # Store and yield the reply
-        # Autogen typically returns dict or string, need to handle both
-        if isinstance(reply, dict):
-            reply_content = reply.get("content", "")
-            reply_message = {"name": next_speaker.name, "content": reply_content}
-        elif isinstance(reply, str):
-            reply_content = reply
-            reply_message = {"name": next_speaker.name, "content": reply_content}
-        else:
-            print(f"Unexpected reply format: {type(reply)}") # DEBUG
-            yield f"ERROR:Unexpected reply format from {next_speaker.name}. Ending simulation."
-            break
-            
-        groupchat.messages.append(reply_message)
-        # Yield structured data instead of pre-formatted HTML
-        yield {"type": "conversation", "name": reply_message['name'], "content": reply_message['content']}
-
-        # Update current speaker
-        current_speaker = next_speaker
-
-        # Check for termination condition from Grader
-        if current_speaker.name == "Grader" and "TERMINATE" in reply_content.upper():
-             yield "INFO:Grader signaled termination."
-             break
+    try:
+        for message in consultation.run():
+            extractor.feed(message['name'], message['content'])
+            if len(consultation.messages) > 1 and not message.get('local'):
+                tokens.record(agents[message['name']], consultation.messages, consultation.sent_view)
+            yield {"type": "conversation", "name": message['name'], "content": message['content']}
+    except Exception as e:
+        print(f"Error generating reply from {consultation.speaker}: {e}")
+        yield f"ERROR:Error generating reply from {consultation.speaker}: {e}"
     else:
-        yield "INFO:Simulation reached maximum turns."
-
-    doctor_diagnosis = None
-    is_correct = False
-    correct_diagnosis_text = test_case["OSCE_Examination"]["Correct_Diagnosis"]
-
-    for message in groupchat.messages:
-        sender = message.get("name", "Unknown")
-        content = message.get("content", "")
-        if sender == "Doctor":
-            extracted_diagnosis = extract_diagnosis(content)
-            if extracted_diagnosis:
-                doctor_diagnosis = extracted_diagnosis
-        if sender == "Grader":
-            if doctor_diagnosis and "YES" in content.upper(): 
-                is_correct = True
+        yield f"INFO:{consultation.stop_reason}"
 
-    if not doctor_diagnosis:
-        doctor_diagnosis = "NO DIAGNOSIS PROVIDED"
+    result = consultation_result(test_case, agents, consultation, tokens, extractor, cost_prompt)
+    if result['doctor_diagnosis'] == "NO DIAGNOSIS PROVIDED":
         yield "INFO:Warning: No valid diagnosis was extracted."
-        is_correct = False # Ensure correctness is False if no diagnosis
-
-    # Extract total investigation costs from the conversation
-    conversation_log = ""
-    for message in groupchat.messages:
-        sender = message.get("name", "Unknown")
-        content = message.get("content", "")
-        conversation_log += f"{sender}: {content}\n\n"
-    
-    total_investigation_cost, unknown_investigations = extract_investigation_costs(conversation_log)
-    
-    # Debug: Print the extracted cost
-    print(f"DEBUG: Extracted total investigation cost: ${total_investigation_cost:.2f}")
-    print(f"DEBUG: Conversation log contains 'COST:' {conversation_log.count('COST:')} times")
-
-    write_unknown_investigations(unknown_investigations, case_info=test_case["OSCE_Examination"]["Patient_Actor"])
-
-    return {
-        'correct_diagnosis': correct_diagnosis_text,
-        'doctor_diagnosis': doctor_diagnosis,
-        'is_correct': is_correct,
-        'conversation_log': conversation_log,
-        'total_investigation_cost': total_investigation_cost,
-        'unknown_investigations': unknown_investigations
-    }
 
     # Yield final results with specific prefixes for parsing
-    yield f"FINAL_CORRECT_DIAGNOSIS:{correct_diagnosis_text}"
-    yield f"FINAL_DOCTOR_DIAGNOSIS:{doctor_diagnosis}"
-    yield f"FINAL_IS_CORRECT:{is_correct}"
-    yield "CASE_PROCESSING_COMPLETE" # Signal end of processing for this case 
\ No newline at end of file
+    yield f"FINAL_CORRECT_DIAGNOSIS:{result['correct_diagnosis']}"
+    yield f"FINAL_DOCTOR_DIAGNOSIS:{result['doctor_diagnosis']}"
+    yield f"FINAL_IS_CORRECT:{result['is_correct']}"
+    yield "CASE_PROCESSING_COMPLETE"
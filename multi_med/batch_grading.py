@@ -0,0 +1,155 @@
+"""
+Deferred batch grading.
+
+With MULTI_MED_GRADING=deferred (or --grading deferred on run_benchmark.py) a live
+consultation ends at the Doctor's DIAGNOSIS READY message instead of asking the
+Grader. Clear matches are still graded locally (see diagnosis_match.py). Each other
+case is stored with is_correct NULL and a row in grading_queue holding what the
+Grader would have seen: the correct diagnosis, the doctor's diagnosis and the
+doctor's reasoning. Grading then leaves the critical path of every case.
+
+The queue is graded later, BATCH_SIZE pairs per LLM call, and is_correct is filled in
+on case_results:
+
+    python grade_deferred.py --db medical_cases.db --model gemini-2.5-flash --batch-size 20
+
+Any model in llm_config.py can grade, including the "local-stub" stand-in server.
+Pairs without a verdict in the reply stay queued for the next pass.
+"""
+
+import re
+from typing import Dict, Any, List, Optional
+
+from .llm_agent import MedicalAgent
+from .llm_config import get_model_config
+
+# Pairs graded per LLM call
+BATCH_SIZE = 20
+
+# Reasoning longer than this is cut in the batch prompt
+MAX_REASONING_CHARS = 1500
+
+BATCH_GRADER_SYSTEM_MESSAGE = """
+    You grade numbered pairs of diagnoses. For each pair you are given the correct diagnosis, the doctor's diagnosis and the doctor's reasoning.
+    Is the doctor's diagnosis the same as the correct diagnosis? If the doctor's diagnosis is more specific than the correct diagnosis, consider it correct.
+    Answer every pair on its own line in the format "<number>: YES" or "<number>: NO", followed by a one-sentence reason.
+    """
+
+_VERDICT = re.compile(r'^\W*(\d+)\s*[:.)\-]\s*\**\s*(YES|NO)\b.*$', re.IGNORECASE | re.MULTILINE)
+
+
+def init_grading_queue(conn):
+    """Create the grading_queue table if it does not exist."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS grading_queue
+                    (result_id INTEGER PRIMARY KEY,
+                     correct_diagnosis TEXT,
+                     doctor_diagnosis TEXT,
+                     reasoning TEXT,
+                     is_correct INTEGER,
+                     grader_model TEXT,
+                     grader_reply TEXT)''')
+    conn.commit()
+
+
+def grading_request(test_case: Dict[str, Any], messages: List[Dict[str, Any]], doctor_diagnosis: str) -> Dict[str, str]:
+    """
+    What the Grader would have been sent for a consultation that stopped before it.
+
+    Args:
+        test_case: Dictionary containing the medical case information
+        messages: The consultation messages, ending with the Doctor's DIAGNOSIS READY message
+        doctor_diagnosis: The extracted diagnosis
+
+    Returns:
+        {"correct_diagnosis", "doctor_diagnosis", "reasoning"}
+    """
+    return {'correct_diagnosis': test_case["OSCE_Examination"]["Correct_Diagnosis"],
+            'doctor_diagnosis': doctor_diagnosis,
+            'reasoning': messages[-1]['content'] if messages else ''}
+
+
+def queue_grading(conn, result_id: int, request: Dict[str, str]):
+    """
+    Queue a case for deferred grading. Does not commit; the caller commits together with the result row.
+
+    Args:
+        conn: Open sqlite3 connection
+        result_id: rowid of the case's case_results row
+        request: The case's grading_request
+    """
+    conn.execute('INSERT OR REPLACE INTO grading_queue (result_id, correct_diagnosis, doctor_diagnosis, reasoning) VALUES (?, ?, ?, ?)',
+                 (result_id, request['correct_diagnosis'], request['doctor_diagnosis'], request['reasoning']))
+
+
+def build_batch_prompt(pairs: List[Dict[str, Any]]) -> str:
+    """The user message grading a batch of queued pairs, numbered from 1."""
+    entries = []
+    for number, pair in enumerate(pairs, 1):
+        reasoning = (pair['reasoning'] or '').strip()
+        if len(reasoning) > MAX_REASONING_CHARS:
+            reasoning = reasoning[:MAX_REASONING_CHARS] + "..."
+        entries.append(f"{number}. Correct diagnosis: {pair['correct_diagnosis']}\n"
+                       f"Doctor's diagnosis: {pair['doctor_diagnosis']}\n"
+                       f"Doctor's reasoning: {reasoning}")
+    return "\n\n".join(entries)
+
+
+def parse_batch_verdicts(reply: str, count: int) -> Dict[int, Dict[str, Any]]:
+    """
+    Verdicts of a batch reply, keyed by pair number (1-based).
+
+    Numbers outside 1..count are ignored, and the first verdict given for a pair counts.
+
+    Returns:
+        {"correct", "line"} per pair number, where line is the reply line with the verdict
+    """
+    verdicts = {}
+    for match in _VERDICT.finditer(reply or ''):
+        number = int(match.group(1))
+        if 1 <= number <= count and number not in verdicts:
+            verdicts[number] = {'correct': match.group(2).upper() == 'YES', 'line': match.group(0).strip()}
+    return verdicts
+
+
+def grade_pending(conn, model: str, batch_size: int = BATCH_SIZE, limit: Optional[int] = None) -> Dict[str, int]:
+    """
+    Grade the queued cases in batches and fill in is_correct on case_results.
+
+    Each batch is committed as soon as it is graded, so an interrupted pass keeps its
+    progress.
+
+    Args:
+        conn: Open sqlite3 connection
+        model: Model in llm_config.py to grade with
+        batch_size: Pairs per LLM call
+        limit: Grade at most this many queued cases
+
+    Returns:
+        {"graded", "correct", "ungraded", "calls"}; ungraded pairs had no verdict in the reply
+    """
+    init_grading_queue(conn)
+    query = 'SELECT result_id, correct_diagnosis, doctor_diagnosis, reasoning FROM grading_queue WHERE is_correct IS NULL ORDER BY result_id'
+    rows = conn.execute(query + (' LIMIT ?' if limit else ''), (limit,) if limit else ()).fetchall()
+    pending = [{'result_id': r[0], 'correct_diagnosis': r[1], 'doctor_diagnosis': r[2], 'reasoning': r[3]} for r in rows]
+
+    grader = MedicalAgent(name="BatchGrader", system_message=BATCH_GRADER_SYSTEM_MESSAGE, llm_config=get_model_config(model))
+    counts = {'graded': 0, 'correct': 0, 'ungraded': 0, 'calls': 0}
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        reply = grader.generate_reply(messages=[{"role": "user", "content": build_batch_prompt(batch)}])
+        counts['calls'] += 1
+        content = reply.get("content") if isinstance(reply, dict) else reply
+        verdicts = parse_batch_verdicts(content or '', len(batch))
+        for number, pair in enumerate(batch, 1):
+            if number not in verdicts:
+                counts['ungraded'] += 1
+                continue
+            is_correct = 1 if verdicts[number]['correct'] else 0
+            conn.execute('UPDATE grading_queue SET is_correct = ?, grader_model = ?, grader_reply = ? WHERE result_id = ?',
+                         (is_correct, model, verdicts[number]['line'], pair['result_id']))
+            conn.execute("UPDATE case_results SET is_correct = ?, grader = 'batch' WHERE rowid = ?", (is_correct, pair['result_id']))
+            counts['graded'] += 1
+            counts['correct'] += is_correct
+        conn.commit()
+        print(f"Graded {min(start + batch_size, len(pending))}/{len(pending)} queued cases")
+    return counts
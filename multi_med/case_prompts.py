@@ -0,0 +1,163 @@
+"""
+Compact rendering of case data into agent prompts.
+
+The Patient and MeasurementAssistant system messages used to interpolate the case's
+Patient_Actor, Physical_Examination_Findings and Test_Results dicts as Python reprs,
+full of quotes, braces and keys such as 'Secondary_Symptoms': [...]. System messages
+are resent on every turn, so that noise is paid for many times per case. In "compact"
+mode each section is rendered as labelled plain text instead:
+
+    Vital Signs: Temperature: 37.8°C (100.0°F); Blood Pressure: 118/76 mmHg
+    Abdominal Examination:
+     Inspection: Abdomen is flat. No visible scars, distension, hernias, or skin changes.
+     Palpation: Soft. Tenderness in the right lower quadrant.
+    Secondary Symptoms: Mild nausea (no vomiting); Reduced appetite
+
+The rendering is done once per case and cached, so every doctor model run on the same
+case reuses it. Select the mode with the MULTI_MED_CASE_PROMPT environment variable
+("compact" or "raw"), or --case-prompt on run_benchmark.py. "raw", the default,
+reproduces the prompts of earlier runs, so compact prompts are opt-in. Each case
+reports the prompt tokens saved against the raw rendering.
+"""
+
+import json
+import os
+from functools import lru_cache
+from typing import Dict, Any, Optional
+
+from .tokens import count_tokens
+
+CASE_PROMPT_MODES = ('compact', 'raw')
+
+# Case sections interpolated into agent prompts
+CASE_SECTIONS = ('Patient_Actor', 'Physical_Examination_Findings', 'Test_Results')
+
+# Indentation per nesting level of the compact rendering (one space costs fewer tokens than two)
+INDENT = " "
+
+
+def case_prompt_mode() -> str:
+    """The configured case prompt mode ("raw" unless MULTI_MED_CASE_PROMPT says otherwise)."""
+    mode = os.getenv('MULTI_MED_CASE_PROMPT', 'raw')
+    if mode not in CASE_PROMPT_MODES:
+        raise ValueError(f"Unknown MULTI_MED_CASE_PROMPT {mode}, expected one of {', '.join(CASE_PROMPT_MODES)}")
+    return mode
+
+
+def _label(key: str) -> str:
+    return key.replace('_', ' ').strip()
+
+
+def _is_nested(value: Any) -> bool:
+    return isinstance(value, dict) or (isinstance(value, list) and any(isinstance(entry, (dict, list)) for entry in value))
+
+
+def _render_lines(value: Any, depth: int, lines: list):
+    prefix = INDENT * depth
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if isinstance(item, dict) and not any(_is_nested(entry) for entry in item.values()):
+                # A dict of plain values (vital signs, a blood panel) goes on one line
+                lines.append(f"{prefix}{_label(key)}: " + "; ".join(f"{_label(name)}: {_render_inline(entry)}" for name, entry in item.items()))
+            elif _is_nested(item):
+                lines.append(f"{prefix}{_label(key)}:")
+                _render_lines(item, depth + 1, lines)
+            else:
+                lines.append(f"{prefix}{_label(key)}: {_render_inline(item)}")
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, (dict, list)):
+                lines.append(f"{prefix}-")
+                _render_lines(item, depth + 1, lines)
+            else:
+                lines.append(f"{prefix}- {_render_inline(item)}")
+    else:
+        lines.append(f"{prefix}{_render_inline(value)}")
+
+
+def _render_inline(value: Any) -> str:
+    if isinstance(value, list):
+        return "; ".join(_render_inline(item) for item in value)
+    if value is None:
+        return "none"
+    return str(value)
+
+
+def render_section(value: Any) -> str:
+    """
+    Render one case section as labelled plain text.
+
+    Dict keys become labels ("Past_Medical_History" -> "Past Medical History"). Dicts of
+    plain values are written on one line, deeper dicts are indented under their label,
+    and lists of plain values are joined with "; ".
+    """
+    lines = []
+    _render_lines(value, 0, lines)
+    return "\n".join(lines)
+
+
+@lru_cache(maxsize=4096)
+def _render_case(sections_json: str, mode: str) -> Dict[str, str]:
+    sections = json.loads(sections_json)
+    if mode == 'raw':
+        # Exactly what the f-strings interpolated before: the Python repr of each section
+        return {name: str(sections.get(name)) for name in CASE_SECTIONS}
+    return {name: render_section(sections.get(name)) for name in CASE_SECTIONS}
+
+
+def render_case(test_case: Dict[str, Any], mode: Optional[str] = None) -> Dict[str, str]:
+    """
+    Render the prompt sections of a case, cached per case content and mode.
+
+    Args:
+        test_case: Dictionary containing the medical case information
+        mode: "compact" or "raw"; defaults to case_prompt_mode()
+
+    Returns:
+        The rendered Patient_Actor, Physical_Examination_Findings and Test_Results, keyed by section name
+    """
+    osce = test_case["OSCE_Examination"]
+    # Keyed on the content, so the same case loaded again for another doctor model is a cache hit
+    # (key order is kept, since the raw rendering depends on it)
+    sections_json = json.dumps({name: osce.get(name) for name in CASE_SECTIONS}, ensure_ascii=False)
+    return _render_case(sections_json, mode or case_prompt_mode())
+
+
+def case_prompt_savings(test_case: Dict[str, Any], agent_turns: Dict[str, int], encoder) -> Dict[str, Any]:
+    """
+    Case-data tokens a case sent in its system messages, against the raw rendering.
+
+    Args:
+        test_case: Dictionary containing the medical case information
+        agent_turns: Number of replies by each agent; each reply resends its system message
+        encoder: Encoder from tokens.get_encoder for the Patient/MeasurementAssistant model
+
+    Returns:
+        {"mode", "cases", "raw_tokens", "sent_tokens"}
+    """
+    raw, sent = render_case(test_case, 'raw'), render_case(test_case)
+    sections = {'Patient': ('Patient_Actor',), 'MeasurementAssistant': ('Physical_Examination_Findings', 'Test_Results')}
+    stats = {'mode': case_prompt_mode(), 'cases': 1, 'raw_tokens': 0, 'sent_tokens': 0}
+    for agent, names in sections.items():
+        turns = agent_turns.get(agent, 0)
+        if turns:
+            stats['raw_tokens'] += turns * sum(count_tokens(encoder, raw[name]) for name in names)
+            stats['sent_tokens'] += turns * sum(count_tokens(encoder, sent[name]) for name in names)
+    return stats
+
+
+def add_case_prompt_savings(totals: Dict[str, int], result: Dict[str, Any]):
+    """Add one case's case prompt statistics (result['case_prompt']) to run totals."""
+    stats = result.get('case_prompt')
+    if not stats:
+        return
+    for key in ('cases', 'raw_tokens', 'sent_tokens'):
+        totals[key] = totals.get(key, 0) + stats[key]
+
+
+def format_case_prompt_savings(totals: Dict[str, int]) -> str:
+    """One-line summary of the case prompt tokens saved in a run."""
+    raw, sent = totals.get('raw_tokens', 0), totals.get('sent_tokens', 0)
+    share = 100 * (raw - sent) / raw if raw else 0.0
+    return (f"Case prompt (compact): {raw - sent} case-data tokens saved over {totals.get('cases', 0)} cases "
+            f"({share:.0f}% of {raw})")
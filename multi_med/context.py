@@ -0,0 +1,96 @@
+"""
+Per-role context policies for the consultation.
+
+By default every agent is sent the whole conversation on every turn, although the
+Patient never needs the MeasurementAssistant's results and the Grader only compares one
+diagnosis. A context policy limits what one role is sent:
+
+    all    the whole conversation (the behaviour of earlier runs)
+    own    only the messages it sent or that were addressed to it: for the Patient, the
+           Doctor-Patient exchanges
+    last   only the message it is replying to: for the Grader, the DIAGNOSIS READY turn
+
+and an optional sliding window keeps only its last N messages ("all:20", "own:10").
+
+By default every role sees everything, so results stay comparable with earlier runs.
+Limit roles per run with the MULTI_MED_CONTEXT environment variable
+("Patient=own,Grader=last" sends each of them only what it needs) or --context on
+run_benchmark.py. Each case reports its input tokens with and without the
+policies, and the runners print the totals.
+"""
+
+import os
+from typing import Dict, Any, Optional
+
+CONTEXT_VIEWS = ('all', 'own', 'last')
+
+# Policies applied without MULTI_MED_CONTEXT; none, so every role sees the whole conversation
+DEFAULT_CONTEXT = {}
+
+
+def parse_context_policy(value: str) -> tuple:
+    """
+    Parse one ROLE=VIEW[:WINDOW] setting, e.g. "Patient=own:20".
+
+    Returns:
+        (role, {"view", "window"}) with window None when not given
+    """
+    role, _, policy = value.partition('=')
+    view, _, window = policy.partition(':')
+    if not role or view not in CONTEXT_VIEWS or (window and (not window.isdigit() or int(window) < 1)):
+        raise ValueError(f"Invalid context policy '{value}', expected ROLE=VIEW[:WINDOW] with VIEW one of {', '.join(CONTEXT_VIEWS)}")
+    return role.strip(), {'view': view, 'window': int(window) if window else None}
+
+
+def context_policies() -> Dict[str, Dict[str, Any]]:
+    """The configured policies: DEFAULT_CONTEXT updated with the settings in MULTI_MED_CONTEXT."""
+    policies = {role: dict(policy) for role, policy in DEFAULT_CONTEXT.items()}
+    for setting in os.getenv('MULTI_MED_CONTEXT', '').split(','):
+        if setting.strip():
+            role, policy = parse_context_policy(setting.strip())
+            policies[role] = policy
+    # Roles that see everything need no policy
+    return {role: policy for role, policy in policies.items() if policy['view'] != 'all' or policy['window']}
+
+
+def format_context_policies(policies: Dict[str, Dict[str, Any]]) -> str:
+    """Policies in MULTI_MED_CONTEXT form, or "all" when no role is limited."""
+    settings = [f"{role}={policy['view']}" + (f":{policy['window']}" if policy['window'] else '') for role, policy in sorted(policies.items())]
+    return ','.join(settings) or 'all'
+
+
+def context_savings(turns: list, policies: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Input tokens of a case with and without its context policies.
+
+    Args:
+        turns: TurnTokenCounter.turns, whose "omitted_tokens" are the message tokens left out
+        policies: The policies the case ran with
+
+    Returns:
+        {"policy", "cases", "full_input_tokens", "input_tokens"}, or None without policies
+    """
+    if not policies:
+        return None
+    input_tokens = sum(turn['input_tokens'] for turn in turns)
+    omitted = sum(turn.get('omitted_tokens', 0) for turn in turns)
+    return {'policy': format_context_policies(policies), 'cases': 1,
+            'full_input_tokens': input_tokens + omitted, 'input_tokens': input_tokens}
+
+
+def add_context_savings(totals: Dict[str, Any], result: Dict[str, Any]):
+    """Add one case's context statistics (result['context']) to run totals."""
+    stats = result.get('context')
+    if not stats:
+        return
+    totals['policy'] = stats['policy']
+    for key in ('cases', 'full_input_tokens', 'input_tokens'):
+        totals[key] = totals.get(key, 0) + stats[key]
+
+
+def format_context_savings(totals: Dict[str, Any]) -> str:
+    """One-line summary of the input tokens saved by the context policies in a run."""
+    full, sent = totals.get('full_input_tokens', 0), totals.get('input_tokens', 0)
+    share = 100 * (full - sent) / full if full else 0.0
+    return (f"Context ({totals.get('policy')}): {sent} input tokens over {totals.get('cases', 0)} cases, "
+            f"{full} with the full conversation ({share:.0f}% saved)")
@@ -0,0 +1,229 @@
+"""
+Fuzzy-match index over INVESTIGATION_COSTS.
+
+get_investigation_cost and the alias lookup in cost_resolver.py only find names they
+know exactly (after normalisation), so "CT scan of the head with contrast to rule out
+a mass" or a misspelt "haemoglobin A1C" miss. This index is built once at import and
+scores a free-text name against every known name by shared words and shared character
+trigrams, after expanding abbreviations (FBC, U&E, ESR, CRP, ...). A name only
+matches one that names the same imaging modality and the same body sites, so
+"x-ray lumbar spine" never takes the price of a cervical spine x-ray and "CT head
+and cervical spine" never takes the price of a CT head alone.
+
+Entries that share an MBS item number and cost (for example "Full Blood Count" and
+"Complete Blood Count", or the chemistry tests under item 66500) form one group. A
+match reports the best matching name and every name in its group.
+
+    match_investigation("CT scan of the head")
+    -> {'query': ..., 'investigation': 'CT Head', 'item_number': '56001', 'cost': 211.35,
+        'score': 1.0, 'group': ['CT Head']}
+
+A fuzzy match is a guess, so fill_unresolved does not price the request with it: the
+record stays unresolved (cost 0.0) and the match is attached as record["fuzzy"].
+Case totals therefore only count exactly resolved investigations, and the runners
+report the fuzzy matches' cost separately.
+"""
+
+from functools import lru_cache
+from typing import Dict, Any, List
+
+from investigation_costs import INVESTIGATION_COSTS
+from .cost_resolver import ALIAS_INDEX, normalize_investigation
+
+# Lowest score accepted as a match; below it match_investigation returns no investigation
+MIN_SCORE = 0.8
+
+# Weight of word overlap against character trigram overlap in the score
+WORD_WEIGHT = 0.5
+
+# Imaging modalities; a query and a name only match if they name the same modality (or none)
+MODALITIES = {'ct', 'mri', 'xray', 'ultrasound', 'doppler', 'pet', 'mrv', 'mra'}
+
+# Body sites and specimens (expanded words) by region; a query and a name only match if they name the same regions
+BODY_SITES = {
+    'head': 'head', 'brain': 'head', 'skull': 'head',
+    'neck': 'cervical', 'cervical': 'cervical', 'thoracic': 'thoracic', 'lumbar': 'lumbar',
+    'sacral': 'sacral', 'sacrum': 'sacral', 'spine': 'spine', 'spinal': 'spine',
+    'chest': 'chest', 'thorax': 'chest', 'lung': 'chest', 'abdomen': 'abdomen', 'abdominal': 'abdomen',
+    'pelvis': 'pelvis', 'pelvic': 'pelvis', 'adrenal': 'adrenal', 'kidney': 'kidney',
+    'renal': 'kidney', 'liver': 'liver', 'hepatic': 'liver', 'sinus': 'sinus',
+    'orbit': 'orbit', 'knee': 'knee', 'hip': 'hip', 'shoulder': 'shoulder', 'ankle': 'ankle', 'wrist': 'wrist',
+    'elbow': 'elbow', 'hand': 'hand', 'foot': 'foot', 'csf': 'csf', 'urine': 'urine', 'urinary': 'urine',
+    'stool': 'stool', 'sputum': 'sputum',
+}
+
+# Abbreviations expanded word by word before scoring (keys are normalised words)
+ABBREVIATIONS = {
+    "fbc": "full blood count",
+    "fbe": "full blood count",
+    "cbc": "complete blood count",
+    "ue": "urea electrolytes",
+    "uec": "urea electrolytes",
+    "eucs": "urea electrolytes",
+    "lft": "liver function",
+    "lfts": "liver function",
+    "esr": "erythrocyte sedimentation rate",
+    "crp": "c reactive protein",
+    "bmp": "basic metabolic panel",
+    "cmp": "comprehensive metabolic panel",
+    "tft": "thyroid function",
+    "tfts": "thyroid function",
+    "tsh": "tsh quantitation",
+    "hba1c": "hba1c",
+    "ecg": "electrocardiography",
+    "ekg": "electrocardiography",
+    "electrocardiogram": "electrocardiography",
+    "cxr": "chest xray",
+    "lp": "lumbar puncture",
+    "csf": "csf",
+    "mra": "mra magnetic resonance angiography",
+    "mrv": "mrv magnetic resonance venography",
+    "venogram": "venography",
+    "angiogram": "angiography",
+    "cta": "ct angiography",
+    "radiograph": "xray",
+    "ua": "urinalysis",
+    "msu": "urine culture",
+    "haemoglobin": "hemoglobin",
+    "brain": "head brain",
+    "head": "head brain",
+}
+
+
+def _expand(key: str) -> List[str]:
+    """Words of a normalised key with abbreviations expanded."""
+    words = []
+    for word in key.split():
+        words.extend(ABBREVIATIONS.get(word, word).split())
+    return sorted(set(words))
+
+
+def _trigrams(words: List[str]) -> frozenset:
+    text = f" {' '.join(words)} "
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def _sites(words: frozenset) -> frozenset:
+    """The BODY_SITES regions named by some expanded words."""
+    return frozenset(BODY_SITES[word] for word in words if word in BODY_SITES)
+
+
+def _build_index():
+    # One group of entry names per (item number, cost)
+    groups, group_of, group_by_name = [], {}, {}
+    for name, details in INVESTIGATION_COSTS.items():
+        if not isinstance(details.get("cost"), (int, float)):
+            continue
+        key = (details.get("item_number"), details["cost"])
+        if key not in group_of:
+            group_of[key] = len(groups)
+            groups.append([])
+        groups[group_of[key]].append(name)
+        group_by_name[name] = group_of[key]
+
+    # One document per known spelling; composite aliases (several entries) are left to cost_resolver
+    documents, by_trigram, seen = [], {}, set()
+    for key, names in ALIAS_INDEX.items():
+        if len(names) != 1:
+            continue
+        words = _expand(key)
+        if (tuple(words), names[0]) in seen:
+            continue
+        seen.add((tuple(words), names[0]))
+        trigrams = _trigrams(words)
+        for trigram in trigrams:
+            by_trigram.setdefault(trigram, []).append(len(documents))
+        documents.append((frozenset(words), trigrams, names[0]))
+    return groups, group_by_name, documents, by_trigram
+
+
+GROUPS, GROUP_BY_NAME, DOCUMENTS, TRIGRAM_INDEX = _build_index()
+
+
+@lru_cache(maxsize=8192)
+def best_match(key: str) -> tuple:
+    """(entry name, score) of the best scoring document for a normalised key, or (None, 0.0)."""
+    words = _expand(key)
+    if not words:
+        return None, 0.0
+    query_words, query_trigrams = frozenset(words), _trigrams(words)
+    query_modalities = query_words & MODALITIES
+    query_sites = _sites(query_words)
+
+    shared_trigrams = {}
+    for trigram in query_trigrams:
+        for doc in TRIGRAM_INDEX.get(trigram, ()):
+            shared_trigrams[doc] = shared_trigrams.get(doc, 0) + 1
+
+    # Ties go to the earlier document: entry names in INVESTIGATION_COSTS order, then aliases
+    best_name, best_score = None, 0.0
+    for doc in sorted(shared_trigrams):
+        doc_words, doc_trigrams, name = DOCUMENTS[doc]
+        if query_modalities != doc_words & MODALITIES or query_sites != _sites(doc_words):
+            continue
+        trigram_score = 2 * shared_trigrams[doc] / (len(query_trigrams) + len(doc_trigrams))
+        word_score = 2 * len(query_words & doc_words) / (len(query_words) + len(doc_words))
+        score = WORD_WEIGHT * word_score + (1 - WORD_WEIGHT) * trigram_score
+        if score > best_score:
+            best_name, best_score = name, score
+    return best_name, round(best_score, 3)
+
+
+def match_investigation(text: str, min_score: float = MIN_SCORE) -> Dict[str, Any]:
+    """
+    Find the INVESTIGATION_COSTS entry best matching a free-text investigation name.
+
+    Args:
+        text: Investigation name as written, e.g. "CT scan of the head"
+        min_score: Lowest score (0 to 1) accepted as a match
+
+    Returns:
+        {"query", "investigation", "item_number", "cost", "score", "group"}. Below min_score,
+        investigation and item_number are None, cost is 0.0 and group is empty; score is
+        still the best score found.
+    """
+    name, score = best_match(normalize_investigation(text))
+    if name is None or score < min_score:
+        return {'query': text, 'investigation': None, 'item_number': None, 'cost': 0.0, 'score': score, 'group': []}
+    details = INVESTIGATION_COSTS[name]
+    return {'query': text, 'investigation': name, 'item_number': details.get('item_number'),
+            'cost': float(details['cost']), 'score': score, 'group': list(GROUPS[GROUP_BY_NAME[name]])}
+
+
+def match_investigations(texts: List[str], min_score: float = MIN_SCORE) -> List[Dict[str, Any]]:
+    """
+    Match many investigation names at once, e.g. the unknown_investigations.txt backlog.
+
+    Repeated names are scored once. Results are in the order of texts.
+    """
+    return [match_investigation(text, min_score) for text in texts]
+
+
+def fill_unresolved(records: List[Dict[str, Any]], min_score: float = MIN_SCORE) -> List[Dict[str, Any]]:
+    """
+    Attach fuzzy matches to cost records from cost_resolver.resolve_test_request that did not resolve.
+
+    Unresolved records (investigation None) whose request matches with at least
+    min_score get record["fuzzy"] = {"investigation", "item_number", "cost", "score"}.
+    They stay unresolved with cost 0.0, so a fuzzy price never enters a case total;
+    see fuzzy_cost. Records are updated in place and returned.
+    """
+    for record in records:
+        if record['investigation'] is None:
+            match = match_investigation(record['request'], min_score)
+            if match['investigation']:
+                record['fuzzy'] = {'investigation': match['investigation'], 'item_number': match['item_number'],
+                                   'cost': match['cost'], 'score': match['score']}
+    return records
+
+
+def fuzzy_cost(records: List[Dict[str, Any]]) -> float:
+    """Summed cost of the fuzzy matches attached by fill_unresolved, reported apart from the resolved total."""
+    return sum(record['fuzzy']['cost'] for record in records if record.get('fuzzy'))
+
+
+def read_unknown_investigations(path: str = 'unknown_investigations.txt') -> List[str]:
+    """Investigation names logged by write_unknown_investigations, without case headers and totals."""
+    with open(path, 'r') as f:
+        return [line.strip() for line in f
+                if line.strip() and not line.startswith('---') and not line.startswith('Total unknown investigations:')]
@@ -0,0 +1,292 @@
+"""
+Deterministic cost resolution for REQUEST TESTS turns.
+
+The orchestrator parses each REQUEST TESTS line itself instead of trusting the
+MeasurementAssistant to quote a cost and scanning the conversation log for it afterwards.
+A request is split into its individual investigations ("complete blood count (CBC) and
+basic metabolic panel" -> two parts), each part is normalised (case, punctuation,
+plurals, filler words such as "scan" or "level", "x ray" spellings, "without contrast")
+and looked up in an alias index built from INVESTIGATION_COSTS names, their
+parenthesised abbreviations and the ALIASES table below. Every part yields one cost
+record, resolved or not, and case totals are summed from those records.
+"""
+
+import re
+from typing import Dict, Any, List, Optional
+
+from investigation_costs import INVESTIGATION_COSTS
+
+# Common names and abbreviations for priced INVESTIGATION_COSTS entries
+ALIASES = {
+    "cbc": "Complete Blood Count",
+    "fbc": "Full Blood Count",
+    "fbe": "Full Blood Count",
+    "full blood examination": "Full Blood Count",
+    "bmp": "Basic Metabolic Panel",
+    "cmp": "comprehensive metabolic panel",
+    "metabolic panel": "Basic Metabolic Panel",
+    "glucose": "Blood Glucose",
+    "blood sugar": "Blood Glucose",
+    "fasting glucose": "Blood Glucose",
+    "creatinine": "serum creatinine",
+    "urea": "serum urea",
+    "bun": "serum urea",
+    "blood urea nitrogen": "serum urea",
+    "ue": "U&E",
+    "uec": "Urea and Electrolytes",
+    "eucs": "Urea and Electrolytes",
+    "serum electrolytes": "Electrolytes",
+    # Liver function tests are billed as a multiple chemistry panel (item 66512)
+    "lft": "comprehensive metabolic panel",
+    "lfts": "comprehensive metabolic panel",
+    "liver function": "comprehensive metabolic panel",
+    "liver function tests": "comprehensive metabolic panel",
+    "liver panel": "comprehensive metabolic panel",
+    "hepatic function panel": "comprehensive metabolic panel",
+    "lipid profile": "Lipid Panel (Lipid Studies)",
+    "lipids": "Lipid Panel (Lipid Studies)",
+    "fasting lipids": "Lipid Panel (Lipid Studies)",
+    "hemoglobin a1c": "HbA1c",
+    "glycated hemoglobin": "HbA1c",
+    "blood cultures": "Blood Culture",
+    "sed rate": "erythrocyte sedimentation rate (ESR)",
+    "tft": "thyroid function tests",
+    "tfts": "thyroid function tests",
+    "tsh": "TSH quantitation",
+    "thyroid stimulating hormone": "TSH quantitation",
+    "aldosterone": "serum aldosterone",
+    "renin": "plasma renin activity",
+    "acth": "ACTH Quantitation",
+    "igf1": "IGF-1 (Somatomedin C)",
+    "cortisol": "serum/morning cortisol levels",
+    "serum cortisol": "serum/morning cortisol levels",
+    "morning cortisol": "serum/morning cortisol levels",
+    "am cortisol": "serum/morning cortisol levels",
+    "24 hour urine free cortisol": "24 hours urinary free cortisol",
+    "urinary free cortisol": "24 hours urinary free cortisol",
+    "ct brain": "CT Head",
+    "head ct": "CT Head",
+    "ct brain with contrast": "CT Head with contrast",
+    "mri head": "MRI Brain",
+    "brain mri": "MRI Brain",
+    "mrv": "MRV (Magnetic Resonance Venography) of the Brain",
+    "mr venogram": "MRV (Magnetic Resonance Venography) of the Brain",
+    "magnetic resonance venography": "MRV (Magnetic Resonance Venography) of the Brain",
+    "cta head": "CT Angiography of the Head",
+    "ct angiogram head": "CT Angiography of the Head",
+    "ct angiogram": "CT Angiography of the Head",
+    "cxr": "Chest X-ray",
+    "chest radiograph": "Chest X-ray",
+    "c spine xray": "cervical spine X-ray",
+    "neck xray": "cervical spine X-ray",
+    "sinus ct": "CT scan of sinuses",
+    "ct sinus": "CT scan of sinuses",
+    "adrenal ct": "Adrenal CT Scan",
+    "lp": "Lumbar Puncture",
+    "spinal tap": "Lumbar Puncture",
+    "ua": "Urinalysis",
+    "urine analysis": "Urinalysis",
+    "urine dipstick": "Urinalysis",
+    "urine microscopy": "Urinalysis",
+    "msu": "Urine Culture",
+    "urine mcs": "Urine Culture",
+    "urine culture and sensitivity": "Urine Culture",
+    "urine culture and sensitivities": "Urine Culture",
+    "blood culture and sensitivity": "Blood Culture",
+    "ct thorax": "CT Chest",
+    "hiv": "HIV Test",
+    "hiv serology": "HIV Test",
+    "syphilis serology": "Syphilis Test",
+    "rpr": "Syphilis Test",
+    "vdrl": "Syphilis Test",
+    "visual fields": "visual field testing (perimetry)",
+    "orthostatic blood pressure": "measure blood pressure and check for orthostatic hypotension",
+    "postural blood pressure": "measure blood pressure and check for orthostatic hypotension",
+    "refraction": "refraction test to assess for any refractive errors",
+    "ecg": "12-lead electrocardiography",
+    "ekg": "12-lead electrocardiography",
+    "12 lead ecg": "12-lead electrocardiography",
+    "electrocardiogram": "12-lead electrocardiography",
+    "sleep study": "sleep study (polysomnography)",
+    "overnight sleep study": "sleep study (polysomnography)",
+    "overnight polysomnography": "sleep study (polysomnography)",
+}
+
+# Entries without a single price that stand for several priced services
+COMPOSITES = {
+    "Lumbar Puncture with CSF Analysis": ["Lumbar Puncture", "CSF Culture", "CSF Protein", "CSF Glucose", "CSF Cell Count"],
+    "csf analysis": ["CSF Culture", "CSF Protein", "CSF Glucose", "CSF Cell Count"],
+    "mri brain with contrast": ["MRI Brain", "MRI/MRA Contrast Agent (Modifier)"],
+}
+
+# Words that do not change which investigation is meant
+FILLER_WORDS = {'a', 'an', 'the', 'of', 'scan', 'level', 'levels', 'test', 'tests', 'testing', 'measurement',
+                'please', 'stat', 'urgent', 'repeat', 'some', 'also', 'order', 'perform', 'obtain', 'get'}
+
+# Specimen words dropped as a last resort ("serum electrolytes" -> "electrolytes")
+SPECIMEN_WORDS = {'serum', 'plasma', 'blood'}
+
+# Separators between investigations, applied outside parentheses. A comma or semicolon
+# always separates; "and" and the like only between two known investigations (see split_test_request)
+_LIST_SEPARATOR = re.compile(r'\s*[,;]\s*(?:(?:and|plus)\s+)?|\s+(?:and|plus|as well as|&)\s+', re.IGNORECASE)
+
+# Trailing explanations ("... to evaluate for sinusitis")
+_TRAILING_CLAUSE = re.compile(r'\s+(?:to|for|looking|checking|assessing|given|because|if|which)\s.*$', re.IGNORECASE)
+
+_PARENTHETICAL = re.compile(r'\(([^()]*)\)')
+
+
+def _singular(word: str) -> str:
+    if len(word) > 4 and word.endswith('ses'):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def normalize_investigation(text: str) -> str:
+    """
+    Normalise an investigation name into an alias index key.
+
+    The key is the sorted set of significant words, so word order, case, punctuation
+    and plurals do not matter: "MRI of the brain", "brain MRI" and "MRI Brain" share a key.
+    """
+    text = text.lower()
+    text = re.sub(r'x[\s-]?rays?', 'xray', text)
+    text = re.sub(r'with\s*(?:and|/)\s*without contrast|w/wo contrast', 'with contrast', text)
+    text = re.sub(r'without contrast|non[\s-]?contrast|unenhanced|plain', ' ', text)
+    words = {_singular(word) for word in re.findall(r'[a-z0-9]+', text) if word not in FILLER_WORDS}
+    return ' '.join(sorted(words))
+
+
+def _build_alias_index() -> Dict[str, List[str]]:
+    index = {}
+
+    def add(alias, names):
+        key = normalize_investigation(alias)
+        if key:
+            index.setdefault(key, names)
+
+    priced = {name for name, details in INVESTIGATION_COSTS.items() if isinstance(details.get("cost"), (int, float))}
+    for name in INVESTIGATION_COSTS:
+        names = [name] if name in priced else COMPOSITES.get(name)
+        if not names:
+            continue
+        add(name, names)
+        add(_PARENTHETICAL.sub(' ', name), names)
+        for inner in _PARENTHETICAL.findall(name):
+            # "(ESR)", "(Lipid Studies)" and "(perimetry)" name the entry; "(Modifier)" does not
+            if inner.lower() != 'modifier':
+                add(inner, names)
+    for alias, name in ALIASES.items():
+        add(alias, [name])
+    for alias, names in COMPOSITES.items():
+        add(alias, names)
+    return index
+
+
+ALIAS_INDEX = _build_alias_index()
+
+
+def _known_name(text: str) -> bool:
+    """Whether text, as written, is a name in the alias index."""
+    return normalize_investigation(text) in ALIAS_INDEX
+
+
+def lookup_investigation(text: str) -> Optional[List[str]]:
+    """
+    Resolve one investigation name to the INVESTIGATION_COSTS entries it stands for.
+
+    Tries the name as written, then without a trailing explanation, then its
+    parenthesised abbreviation or the text outside the parentheses, and finally
+    without specimen words such as "serum".
+
+    Returns:
+        Entry names (several for composite services), or None if the name is not known
+    """
+    attempts = [text, _TRAILING_CLAUSE.sub('', text)]
+    for candidate in list(attempts):
+        attempts.append(_PARENTHETICAL.sub(' ', candidate))
+        attempts.extend(_PARENTHETICAL.findall(candidate))
+    for candidate in attempts:
+        names = ALIAS_INDEX.get(normalize_investigation(candidate))
+        if names:
+            return names
+    for candidate in attempts:
+        key = ' '.join(word for word in normalize_investigation(candidate).split() if word not in SPECIMEN_WORDS)
+        if key in ALIAS_INDEX:
+            return ALIAS_INDEX[key]
+    return None
+
+
+def split_test_request(request: str) -> List[str]:
+    """
+    Split a REQUEST TESTS line into individual investigations.
+
+    Splits on commas and semicolons outside parentheses. "and", "plus", "as well as" and
+    "&" only split when the text on both sides resolves on its own: "CBC and ESR" is
+    two investigations, "CT abdomen and pelvis" and "urine culture and sensitivity" are
+    one. Neighbouring parts are joined back together whenever the joined name is itself
+    known ("Urea and Electrolytes", "measure blood pressure and check for orthostatic
+    hypotension").
+    """
+    # "with and without contrast" is one modifier, not two investigations
+    request = re.sub(r'with\s+and\s+without', 'with/without', request.strip().rstrip('.').strip(), flags=re.IGNORECASE)
+    if not request:
+        return []
+    if _known_name(request):
+        return [request]
+
+    # Split outside parentheses only: "viral PCR (influenza A/B, RSV and SARS-CoV-2)" is one part
+    pieces, depth, start = [], 0, 0
+    for match in re.finditer(r'[()]|' + _LIST_SEPARATOR.pattern, request, re.IGNORECASE):
+        token = match.group(0)
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth = max(0, depth - 1)
+        elif depth == 0:
+            pieces.append((request[start:match.start()], token))
+            start = match.end()
+    pieces.append((request[start:], ''))
+
+    parts = []
+    joined, separator = pieces[0]
+    for text, next_separator in pieces[1:]:
+        candidate = joined + separator + text
+        conjunction = not re.search(r'[,;]', separator)
+        if _known_name(candidate) or (conjunction and not (lookup_investigation(joined) and lookup_investigation(text))):
+            joined = candidate
+        else:
+            if joined.strip():
+                parts.append(joined.strip())
+            joined = text
+        separator = next_separator
+    if joined.strip():
+        parts.append(joined.strip())
+    return parts
+
+
+def resolve_test_request(request: str, turn: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Resolve a REQUEST TESTS line into structured cost records.
+
+    Args:
+        request: The text after "REQUEST TESTS:"
+        turn: Index of the Doctor's message in the consultation, stored with each record
+
+    Returns:
+        One record per investigation: {"turn", "request", "investigation", "item_number", "cost"}.
+        Unknown investigations have investigation None and cost 0.0.
+    """
+    records = []
+    for part in split_test_request(request):
+        names = lookup_investigation(part)
+        if not names:
+            records.append({'turn': turn, 'request': part, 'investigation': None, 'item_number': None, 'cost': 0.0})
+            continue
+        for name in names:
+            details = INVESTIGATION_COSTS[name]
+            records.append({'turn': turn, 'request': part, 'investigation': name,
+                            'item_number': details.get('item_number'), 'cost': float(details['cost'])})
+    return records
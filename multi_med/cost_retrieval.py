@@ -0,0 +1,110 @@
+"""
+Retrieval-based cost injection for the MeasurementAssistant.
+
+By default the MeasurementAssistant system message lists every INVESTIGATION_COSTS
+entry (see generate_cost_list in agents.py), and that prompt is resent on every
+MeasurementAssistant turn. In "retrieval" mode the full list is left out; before each
+MeasurementAssistant turn the orchestrator looks up the entries that match the Doctor's
+REQUEST TESTS line and puts only those into the system message for that turn.
+
+Select the mode with the MULTI_MED_COST_PROMPT environment variable ("full" or
+"retrieval"), or --cost-prompt on run_benchmark.py. Each case reports how many cost-list
+tokens it sent and would have sent in full mode, and the runners print the savings for
+the run.
+"""
+
+import math
+import os
+import re
+from typing import Dict, Any, List
+
+from investigation_costs import INVESTIGATION_COSTS
+
+COST_PROMPT_MODES = ('full', 'retrieval')
+
+# Most entries injected for one request; compound requests ("FBC, CRP and ESR") need several
+MAX_CANDIDATES = 8
+
+# Shown in place of the cost list when nothing matches (and before the first test request)
+NO_MATCHING_COSTS = "none of the listed tests match this request"
+
+# Words that say nothing about which investigation is meant
+STOP_WORDS = {'a', 'an', 'and', 'the', 'of', 'for', 'to', 'with', 'or', 'on', 'in', 'test', 'tests',
+              'level', 'levels', 'please', 'check', 'request', 'scan', 'study'}
+
+
+def _words(text: str) -> set:
+    return {word for word in re.findall(r'[a-z0-9]+', text.lower()) if len(word) > 1 and word not in STOP_WORDS}
+
+
+# Name words of every priced entry, and how rare each word is across entries
+_ENTRIES = [(name, details, _words(name)) for name, details in INVESTIGATION_COSTS.items()
+            if isinstance(details.get("cost"), (int, float))]
+_IDF = {}
+for _, _, _entry_words in _ENTRIES:
+    for _word in _entry_words:
+        _IDF[_word] = _IDF.get(_word, 0) + 1
+_IDF = {word: math.log(1 + len(_ENTRIES) / count) for word, count in _IDF.items()}
+
+
+def cost_prompt_mode() -> str:
+    """The configured cost prompt mode ("full" unless MULTI_MED_COST_PROMPT says otherwise)."""
+    mode = os.getenv('MULTI_MED_COST_PROMPT', 'full')
+    if mode not in COST_PROMPT_MODES:
+        raise ValueError(f"Unknown MULTI_MED_COST_PROMPT {mode}, expected one of {', '.join(COST_PROMPT_MODES)}")
+    return mode
+
+
+def extract_test_requests(content: str) -> List[str]:
+    """Return the text after every "REQUEST TESTS:" in a message (usually one)."""
+    return [request.strip() for request in re.findall(r'REQUEST TESTS:\s*([^\n]+)', content, re.IGNORECASE)]
+
+
+def find_cost_candidates(request: str, limit: int = MAX_CANDIDATES) -> List[str]:
+    """
+    Rank the INVESTIGATION_COSTS entries that may be meant by a test request.
+
+    Entries are scored by the summed rarity (IDF) of the name words they share with the
+    request, so "CT head with contrast" ranks "CT Head with contrast" above "CT Chest".
+
+    Args:
+        request: The text of the REQUEST TESTS line
+        limit: Maximum number of entries to return
+
+    Returns:
+        Entry names, best match first
+    """
+    request_words = _words(request)
+    scored = []
+    for name, _, entry_words in _ENTRIES:
+        shared = request_words & entry_words
+        if shared:
+            scored.append((-sum(_IDF[word] for word in shared), name))
+    scored.sort()
+    return [name for _, name in scored[:limit]]
+
+
+def format_cost_entries(names: List[str]) -> str:
+    """Format entries the same way as generate_cost_list: "Test Name ($cost), ..."."""
+    if not names:
+        return NO_MATCHING_COSTS
+    return ", ".join(f"{name} (${INVESTIGATION_COSTS[name]['cost']:.2f})" for name in names)
+
+
+def add_cost_savings(totals: Dict[str, int], result: Dict[str, Any]):
+    """Add one case's cost prompt statistics (result['cost_prompt']) to run totals."""
+    stats = result.get('cost_prompt')
+    if not stats:
+        return
+    for key in ('turns', 'test_requests', 'full_list_tokens', 'injected_tokens'):
+        totals[key] = totals.get(key, 0) + stats[key]
+
+
+def format_cost_savings(totals: Dict[str, int]) -> str:
+    """One-line summary of the cost-list tokens saved in a run."""
+    full, injected = totals.get('full_list_tokens', 0), totals.get('injected_tokens', 0)
+    saved = full - injected
+    share = 100 * saved / full if full else 0.0
+    return (f"Cost prompt (retrieval): {totals.get('test_requests', 0)} test requests over "
+            f"{totals.get('turns', 0)} MeasurementAssistant turns, {saved} cost-list tokens saved "
+            f"({share:.0f}% of {full})")
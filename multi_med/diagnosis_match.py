@@ -0,0 +1,239 @@
+"""
+Local diagnosis matching before the Grader.
+
+Every case used to end with a Grader LLM call, although many doctor diagnoses are the
+correct diagnosis with different case, spelling or qualifiers:
+
+    Giant cell arteritis            giant cell arteritis (temporal arteritis)
+    Acute appendicitis              Acute appendicitis (non-perforated)
+    Infective endocarditis          Infection: Infective endocarditis
+    UTI                             Urinary tract infection
+    Subarachnoid haemorrhage        subarachnoid hemorrhage
+
+match_diagnosis decides these clear matches locally. Both diagnoses are normalized
+(case, punctuation, British spellings, a category prefix such as "Infection: "), and
+abbreviations and synonyms are rewritten to one name (SYNONYMS). The doctor's whole
+diagnosis then has to equal the correct diagnosis without its parentheticals, or one
+of its parenthetical names. A diagnosis that only contains the correct one is left to
+the Grader: "Costochondritis rather than acute coronary syndrome" contains "acute
+coronary syndrome" but is wrong. So is any diagnosis line with a hedging or negation
+cue (AMBIGUOUS_WORDS: "rather", "instead", "less likely", "considered", "not", ...)
+outside the matched name, even in trailing reasoning. The matcher only ever answers
+YES; everything else goes to the Grader LLM.
+
+Select the grading with the MULTI_MED_GRADING environment variable or --grading on
+run_benchmark.py: "llm" (the default) always calls the Grader as earlier runs did,
+"local" tries the matcher first, and "deferred" tries the matcher and queues the rest
+for batch grading after the run (see batch_grading.py). The Grader's reply says which path
+graded the case, and the runners print how many cases each path graded.
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+
+GRADING_MODES = ('local', 'llm', 'deferred')
+
+# British spellings rewritten to American ones, as substrings of words
+SPELLINGS = (
+    ('haem', 'hem'), ('aemia', 'emia'), ('oedem', 'edem'), ('oesophag', 'esophag'),
+    ('ischaem', 'ischem'), ('tumour', 'tumor'), ('oea', 'ea'), ('coeliac', 'celiac'),
+    ('paed', 'ped'), ('oestr', 'estr'), ('ageing', 'aging'), ('foet', 'fet'),
+    ('gynaec', 'gynec'), ('aetiolog', 'etiolog'), ('caec', 'cec'),
+)
+
+# Abbreviations and synonyms, in normalized form, rewritten to one name
+SYNONYMS = {
+    'temporal arteritis': 'giant cell arteritis',
+    'gca': 'giant cell arteritis',
+    'benign intracranial hypertension': 'idiopathic intracranial hypertension',
+    'pseudotumor cerebri': 'idiopathic intracranial hypertension',
+    'iih': 'idiopathic intracranial hypertension',
+    'tension headache': 'tension type headache',
+    'migraine headache': 'migraine',
+    'heart attack': 'myocardial infarction',
+    'mi': 'myocardial infarction',
+    'acs': 'acute coronary syndrome',
+    'chf': 'congestive heart failure',
+    'af': 'atrial fibrillation',
+    'afib': 'atrial fibrillation',
+    'pe': 'pulmonary embolism',
+    'dvt': 'deep vein thrombosis',
+    'deep venous thrombosis': 'deep vein thrombosis',
+    'aaa': 'abdominal aortic aneurysm',
+    'copd': 'chronic obstructive pulmonary disease',
+    'uti': 'urinary tract infection',
+    'uri': 'upper respiratory infection',
+    'urti': 'upper respiratory infection',
+    'upper respiratory tract infection': 'upper respiratory infection',
+    'gord': 'gastroesophageal reflux disease',
+    'gerd': 'gastroesophageal reflux disease',
+    'ibs': 'irritable bowel syndrome',
+    'ibd': 'inflammatory bowel disease',
+    'aki': 'acute kidney injury',
+    'ckd': 'chronic kidney disease',
+    'bph': 'benign prostatic hyperplasia',
+    'pid': 'pelvic inflammatory disease',
+    'bv': 'bacterial vaginosis',
+    'vaginal thrush': 'vulvovaginal candidiasis',
+    'tia': 'transient ischemic attack',
+    'sah': 'subarachnoid hemorrhage',
+    'bppv': 'benign paroxysmal positional vertigo',
+    'dka': 'diabetic ketoacidosis',
+    'sle': 'systemic lupus erythematosus',
+    'ms': 'multiple sclerosis',
+    'glandular fever': 'infectious mononucleosis',
+    'shingles': 'herpes zoster',
+    'whooping cough': 'pertussis',
+    'gallstones': 'cholelithiasis',
+    'addison disease': 'primary adrenal insufficiency',
+}
+
+# Words on the doctor's diagnosis line that leave the case to the Grader: hedging,
+# negation, ranking against other diagnoses, differentials, several diagnoses and
+# causes that change what is being diagnosed
+AMBIGUOUS_WORDS = frozenset((
+    'not', 'no', 'non', 'without', 'vs', 'versus', 'or', 'unlikely', 'exclude', 'excluded',
+    'rule', 'ruled', 'differential', 'differentials', 'ddx', 'possible', 'possibly', 'probable',
+    'probably', 'maybe', 'query', 'suspected', 'rather', 'than', 'instead', 'less', 'more',
+    'likely', 'considered', 'consider', 'considering', 'favour', 'favor', 'favoured', 'favored',
+    'over', 'alternatively', 'pseudo', 'post', 'mimic', 'mimicking', 'secondary', 'due',
+    'caused', 'causing', 'complicated', 'complicating', 'history', 'and', 'superimposed',
+))
+
+# Category prefixes of Correct_Diagnosis in the case files ("Infection: Pneumonia")
+CATEGORY_PREFIXES = (
+    'infection', 'cardiovascular', 'vascular', 'other', 'spondyloarthropathy', 'rarity',
+    'neoplasia', 'tumour/cancer', 'trauma', 'pulmonary cause', 'drugs', 'metabolic disturbance',
+    'interstitial lung disease', 'stis/pid', 'vaginitis', 'vaginiti',
+)
+
+# Words that make a parenthetical a qualifier ("(left)", "(early stage ...)") rather
+# than another name for the diagnosis
+QUALIFIER_WORDS = frozenset((
+    'left', 'right', 'bilateral', 'acute', 'chronic', 'subacute', 'small', 'moderate', 'mild',
+    'severe', 'early', 'late', 'male', 'female', 'elderly', 'children', 'childhood', 'adult',
+    'specifically', 'stage', 'grade', 'type', 'variant', 'phase', 'presentation', 'positive',
+    'negative', 'newly', 'persistent', 'pre', 'presenting', 'leading', 'contributing',
+    'consistent', 'suspicious', 'multifactorial', 'underlying', 'approximately', 'retained',
+))
+
+_CATEGORY_PREFIX = re.compile(r'^(?:' + '|'.join(re.escape(prefix) for prefix in CATEGORY_PREFIXES) + r')\s*:\s*')
+_POSSESSIVE = re.compile(r"['’]s\b")
+_ALIAS_LEAD = re.compile(r'^(?:i e|e g|ie|eg|aka|also known as|most likely|likely|probably)(?: |$)')
+_PARENTHETICAL = re.compile(r'\(([^()]*)\)')
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_SYNONYM = re.compile(r'\b(?:' + '|'.join(re.escape(key) for key in sorted(SYNONYMS, key=len, reverse=True)) + r')\b')
+
+
+def grading_mode() -> str:
+    """The configured grading mode ("llm" unless MULTI_MED_GRADING says otherwise)."""
+    mode = os.getenv('MULTI_MED_GRADING', 'llm')
+    if mode not in GRADING_MODES:
+        raise ValueError(f"Unknown MULTI_MED_GRADING {mode}, expected one of {', '.join(GRADING_MODES)}")
+    return mode
+
+
+def normalize_diagnosis(text: str) -> str:
+    """
+    Normalize a diagnosis for comparison.
+
+    Lowercases, drops possessives and punctuation (hyphens and slashes become spaces),
+    rewrites British spellings and SYNONYMS, and collapses whitespace. Parentheses are
+    kept out of the result; split them off first with _PARENTHETICAL.
+    """
+    text = _POSSESSIVE.sub("", text.lower())
+    for british, american in SPELLINGS:
+        text = text.replace(british, american)
+    text = " ".join(_NON_WORD.sub(" ", text).split())
+    return _SYNONYM.sub(lambda match: SYNONYMS[match.group(0)], text)
+
+
+@lru_cache(maxsize=4096)
+def diagnosis_names(correct_diagnosis: str) -> tuple:
+    """
+    The names a correct diagnosis is matched against, cached per diagnosis.
+
+    Returns:
+        The normalized diagnosis without its category prefix and parentheticals, the
+        diagnosis with its prefix, and the first name in each parenthetical that is not
+        a qualifier ("(Idiopathic Intracranial Hypertension, likely
+        ...)" gives "idiopathic intracranial hypertension", "(i.e. cervicitis)" gives
+        "cervicitis")
+    """
+    text = correct_diagnosis.strip().lower()
+    aliases = []
+    for inner in _PARENTHETICAL.findall(text):
+        alias = _ALIAS_LEAD.sub("", normalize_diagnosis(re.split(r'[,;]', inner)[0]))
+        words = set(alias.split())
+        if alias and not any(c.isdigit() for c in alias) and not words & (QUALIFIER_WORDS | AMBIGUOUS_WORDS):
+            aliases.append(alias)
+    without_parentheticals = _PARENTHETICAL.sub(" ", text)
+    prefixed = normalize_diagnosis(without_parentheticals)
+    main = normalize_diagnosis(_CATEGORY_PREFIX.sub("", without_parentheticals))
+    return tuple(dict.fromkeys([main, prefixed] + aliases))
+
+
+def doctor_diagnosis_text(doctor_diagnosis: str) -> str:
+    """The diagnosis itself: the text before any reasoning on the same line, normalized."""
+    stated = re.split(r'\.\s|;|\s-\s|\breasoning\b', doctor_diagnosis.lower().strip(' *_'), maxsplit=1)[0]
+    return normalize_diagnosis(_PARENTHETICAL.sub(" ", stated))
+
+
+def match_diagnosis(doctor_diagnosis: Optional[str], correct_diagnosis: str) -> Optional[Dict[str, Any]]:
+    """
+    Decide locally whether the doctor's diagnosis clearly matches the correct diagnosis.
+
+    Args:
+        doctor_diagnosis: The text after "DIAGNOSIS READY:"
+        correct_diagnosis: The case's Correct_Diagnosis
+
+    Returns:
+        {"rule", "alias"} for a clear match, where rule is "exact" (the correct diagnosis
+        without parentheticals or prefix) or "alias" (another of its names) and alias is
+        the name that matched; None when the Grader has to decide
+    """
+    if not doctor_diagnosis:
+        return None
+    doctor = doctor_diagnosis_text(doctor_diagnosis)
+    aliases = diagnosis_names(correct_diagnosis)
+    if not doctor or doctor not in aliases:
+        return None
+    # Cues anywhere on the line, parentheticals and reasoning included, unless the name itself has them ("non ...")
+    line_words = set(normalize_diagnosis(doctor_diagnosis).split())
+    if AMBIGUOUS_WORDS.intersection(line_words - set(doctor.split())):
+        return None
+    return {'rule': 'exact' if doctor == aliases[0] else 'alias', 'alias': doctor}
+
+
+def local_grade_reply(match: Dict[str, Any]) -> str:
+    """The Grader reply for a case graded locally, in the format of the Grader LLM."""
+    return (f"YES. The doctor's diagnosis matches the correct diagnosis "
+            f"(graded locally: {match['rule']} match on '{match['alias']}').\nTERMINATE")
+
+
+def grader_path(messages: List[Dict[str, Any]]) -> Optional[str]:
+    """How a consultation was graded: "local", "llm", or None if the Grader never replied (e.g. deferred)."""
+    for message in reversed(messages):
+        if message.get("name") == "Grader":
+            return 'local' if message.get("local") else 'llm'
+    return None
+
+
+def add_grading_counts(totals: Dict[str, int], result: Dict[str, Any]):
+    """Add one case's grading path (result['grader']) to run totals."""
+    path = result.get('grader')
+    if path:
+        totals[path] = totals.get(path, 0) + 1
+
+
+def format_grading_counts(totals: Dict[str, int]) -> str:
+    """One-line summary of how the cases of a run were graded."""
+    local, llm, deferred = totals.get('local', 0), totals.get('llm', 0), totals.get('deferred', 0)
+    graded = local + llm + deferred
+    share = 100 * (local + deferred) / graded if graded else 0.0
+    summary = f"Grading: {local} cases matched locally, {llm} graded by the Grader LLM"
+    if deferred:
+        summary += f", {deferred} queued for batch grading"
+    return summary + f" ({share:.0f}% of live Grader calls saved)"
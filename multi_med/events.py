@@ -0,0 +1,157 @@
+"""
+Structured events extracted from a consultation in one pass over its turns.
+
+Each turn ({"name", "content"} dict) is scanned once with a single compiled pattern and
+turned into typed events:
+
+    question       Doctor turn that is not a request or a diagnosis
+    exam_request   Doctor "REQUEST EXAMINATION FINDING: ..." (text)
+    test_request   Doctor "REQUEST TESTS: ..." (text, and the first cost quoted for it)
+    cost           "COST: $x" quoted by the MeasurementAssistant (cost, request_turn)
+    diagnosis      Doctor "DIAGNOSIS READY: ..." (text)
+    grade          Grader verdict (correct)
+
+Every event also has "type", "turn" (index in the turn list) and "agent". The same
+EventExtractor is fed turn by turn during a run and over stored conversation logs
+(parse_conversation_log splits a case_results.conversation_log back into turns).
+"""
+
+import re
+from typing import Dict, Any, List, Optional
+
+EVENT_TYPES = ('question', 'exam_request', 'test_request', 'cost', 'diagnosis', 'grade')
+
+AGENT_NAMES = ('Doctor', 'Patient', 'MeasurementAssistant', 'Grader')
+
+# Every marker in one pattern, matched against the lowercased turn so no IGNORECASE scan is
+# needed. A test request stops at the first full stop, like the old log scan.
+_MARKERS = re.compile(r'request (?:examination finding:\s*(?P<exam>[^\n]+)|tests:\s*(?P<test>[^.\n]+))'
+                      r'|cost:\s*\$(?P<cost>\d+\.?\d*)'
+                      r'|diagnosis ready:\s*(?P<diagnosis>[^\n]*)')
+_MARKERS_ANY_CASE = re.compile(_MARKERS.pattern, re.IGNORECASE)
+
+# A turn in a stored log starts with "Name: " at the start of a line that follows a blank line
+_LOG_TURN = re.compile(r'^(%s|Unknown): ' % '|'.join(AGENT_NAMES), re.MULTILINE)
+
+
+class EventExtractor:
+    """
+    Turns consultation turns into events, one turn at a time.
+
+    Costs are attributed to the most recent test request that has no cost yet, so a
+    request whose first quoted cost is $0.00 is one the MeasurementAssistant did not know.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.turns = 0
+        self._pending_request = None
+
+    def feed(self, name: str, content: str) -> List[Dict[str, Any]]:
+        """
+        Extract the events of the next turn.
+
+        Args:
+            name: Name of the agent that spoke
+            content: Text of the turn
+
+        Returns:
+            The turn's events (also appended to self.events)
+        """
+        turn = self.turns
+        self.turns += 1
+        events = []
+
+        # Most turns (all Patient answers) have no marker; skip the regex for them
+        lowered = content.lower()
+        matches = ()
+        if 'request' in lowered or 'cost:' in lowered or 'diagnosis ready' in lowered:
+            # Lowercasing can change the length of non-ASCII text, and then offsets would not line up
+            matches = _MARKERS.finditer(lowered) if len(lowered) == len(content) else _MARKERS_ANY_CASE.finditer(content)
+
+        diagnosis_found = False
+        for match in matches:
+            kind = match.lastgroup
+            value = content[match.start(kind):match.end(kind)].strip()
+            if kind == 'cost':
+                cost = float(value)
+                request = self._pending_request
+                events.append({'type': 'cost', 'turn': turn, 'agent': name, 'cost': cost,
+                               'request_turn': request['turn'] if request else None})
+                if request is not None and request['cost'] is None:
+                    request['cost'] = cost
+            elif name != "Doctor":
+                continue
+            elif kind == 'exam':
+                events.append({'type': 'exam_request', 'turn': turn, 'agent': name, 'text': value})
+            elif kind == 'test':
+                event = {'type': 'test_request', 'turn': turn, 'agent': name, 'text': value, 'cost': None}
+                events.append(event)
+                self._pending_request = event
+            elif kind == 'diagnosis' and not diagnosis_found:
+                # Only the first diagnosis counts, and empty or placeholder ("***") ones do not, as in extract_diagnosis
+                diagnosis_found = True
+                if value and not all(c == '*' for c in value):
+                    events.append({'type': 'diagnosis', 'turn': turn, 'agent': name, 'text': value})
+
+        if name == "Doctor" and not any(event['type'] != 'cost' for event in events):
+            events.insert(0, {'type': 'question', 'turn': turn, 'agent': name, 'text': content.strip()})
+        elif name == "Grader":
+            events.insert(0, {'type': 'grade', 'turn': turn, 'agent': name, 'correct': "YES" in content.upper()})
+
+        self.events.extend(events)
+        return events
+
+
+def extract_events(turns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Extract the events of a whole consultation.
+
+    Args:
+        turns: Consultation turns as {"name", "content"} dicts
+
+    Returns:
+        Events in turn order
+    """
+    extractor = EventExtractor()
+    for turn in turns:
+        extractor.feed(turn.get("name", "Unknown"), turn.get("content") or "")
+    return extractor.events
+
+
+def parse_conversation_log(conversation_log: str) -> List[Dict[str, str]]:
+    """Split a stored conversation_log ("Name: content" turns separated by blank lines) into turns."""
+    matches = [match for match in _LOG_TURN.finditer(conversation_log)
+               if match.start() == 0 or conversation_log.endswith('\n\n', 0, match.start())]
+    turns = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(conversation_log)
+        turns.append({'name': match.group(1), 'content': conversation_log[match.end():end].strip()})
+    return turns
+
+
+def summarise_events(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Case-level results from a consultation's events.
+
+    Returns:
+        Dictionary with doctor_diagnosis (the last diagnosis, or None), is_correct (the
+        last grade, and only if there was a diagnosis), quoted_cost (sum of all quoted
+        costs) and zero_cost_requests (test requests whose first quoted cost was $0.00)
+    """
+    doctor_diagnosis: Optional[str] = None
+    is_correct = False
+    quoted_cost = 0.0
+    zero_cost_requests = []
+    for event in events:
+        kind = event['type']
+        if kind == 'diagnosis':
+            doctor_diagnosis = event['text']
+        elif kind == 'grade':
+            is_correct = event['correct'] and doctor_diagnosis is not None
+        elif kind == 'cost':
+            quoted_cost += event['cost']
+        elif kind == 'test_request' and event['cost'] == 0.0 and event['text'] not in zero_cost_requests:
+            zero_cost_requests.append(event['text'])
+    return {'doctor_diagnosis': doctor_diagnosis, 'is_correct': is_correct,
+            'quoted_cost': quoted_cost, 'zero_cost_requests': zero_cost_requests}
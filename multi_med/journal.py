@@ -0,0 +1,57 @@
+"""
+Completion journal for resumable runs.
+
+Every finished case is recorded under (run id, case file, case index, doctor model) in
+the same transaction as its case_results row, so a crash can never leave a stored result
+without its journal entry or the other way round. Runners load the finished keys for a
+run once at start-up and skip those cases before any LLM call is made.
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import List, Optional, Set, Tuple
+
+
+def init_journal(conn):
+    """Create the run_journal table if it does not exist."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS run_journal
+                    (run_id TEXT,
+                     case_file TEXT,
+                     case_index INTEGER,
+                     doctor_model TEXT,
+                     finished_at REAL,
+                     PRIMARY KEY (run_id, case_file, case_index, doctor_model)) WITHOUT ROWID''')
+    conn.commit()
+
+
+def make_run_id(cases_files: List[str], doctor_models: List[str], other_model: str, notes: str = '',
+                start: int = 0, end: Optional[int] = None) -> str:
+    """
+    Derive a stable run id from the run's settings, so re-running the same command resumes it.
+
+    Returns:
+        A short hex digest of the settings
+    """
+    settings = json.dumps([sorted(os.path.normpath(path) for path in cases_files), sorted(doctor_models), other_model, notes, start, end])
+    return hashlib.sha1(settings.encode('utf-8')).hexdigest()[:12]
+
+
+def completed_keys(conn, run_id: str) -> Set[Tuple[str, int, str]]:
+    """
+    Load every finished (case file, case index, doctor model) for a run.
+
+    The set is built with a single primary-key range scan, after which each
+    "already done?" check is a constant-time set lookup.
+    """
+    rows = conn.execute('SELECT case_file, case_index, doctor_model FROM run_journal WHERE run_id = ?', (run_id,))
+    return {(case_file, case_index, doctor_model) for case_file, case_index, doctor_model in rows}
+
+
+def mark_completed(conn, run_id: str, case_file: str, case_index: int, doctor_model: str):
+    """
+    Record a finished case. Does not commit; the caller commits together with the result row.
+    """
+    conn.execute('INSERT OR REPLACE INTO run_journal (run_id, case_file, case_index, doctor_model, finished_at) VALUES (?, ?, ?, ?, ?)',
+                 (run_id, case_file, case_index, doctor_model, time.time()))
@@ -0,0 +1,146 @@
+"""
+AssistantAgent subclass used for the Doctor, Patient, MeasurementAssistant and Grader.
+
+An optional CaseTransport (see replay.py) records every request/response pair or, when
+replaying, serves recorded replies without any network access. Otherwise every reply
+made through generate_reply is first looked up in the optional response cache (see
+llm_cache.py). Cache misses draw from the shared rate limiter of the agent's
+provider (see rate_limit.py), and transient provider errors such as 429s and 503s are
+retried with exponential backoff.
+"""
+
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import autogen
+
+from .llm_config import get_rate_limit
+from .rate_limit import get_limiter
+from .llm_cache import get_cache, make_cache_key
+
+# Completion budget assumed when the config does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 512
+
+# Error class names that indicate the provider is throttling or temporarily unavailable
+RETRYABLE_ERRORS = ('RateLimitError', 'ResourceExhausted', 'ServiceUnavailable', 'TooManyRequests', 'APITimeoutError')
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], system_message: str = "") -> int:
+    """Rough token estimate (about four characters per token) used before a request is sent."""
+    chars = len(system_message or "")
+    for message in messages or []:
+        content = message.get("content") or ""
+        chars += len(content) if isinstance(content, str) else len(str(content))
+    return chars // 4 + 4 * len(messages or [])
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Check whether an exception is a provider throttling or availability error."""
+    name = type(error).__name__
+    return any(retryable in name for retryable in RETRYABLE_ERRORS) or getattr(error, 'status_code', None) in (429, 503)
+
+
+class MedicalAgent(autogen.AssistantAgent):
+    """
+    AssistantAgent whose replies are cached and rate limited per provider.
+
+    Args:
+        max_retries: Number of times a throttled request is retried before giving up
+        transport: Optional CaseTransport that records or replays this case's LLM calls
+        All other arguments are passed to autogen.AssistantAgent.
+    """
+
+    def __init__(self, *args, max_retries: int = 5, transport=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_retries = max_retries
+        self.transport = transport
+        self.limiter = get_limiter(get_rate_limit(self.llm_config)) if self.llm_config else None
+        # Prompt and completion tokens the provider reported for the latest reply (None if it
+        # was cached, replayed or the provider did not report usage)
+        self.last_usage: Optional[Dict[str, int]] = None
+
+    def _usage_totals(self) -> Optional[Tuple[int, int]]:
+        """Prompt and completion tokens reported by the autogen client so far, if available."""
+        client = getattr(self, 'client', None)
+        if client is None:
+            return None
+        summary = getattr(client, 'actual_usage_summary', None) or {}
+        usages = [usage for usage in summary.values() if isinstance(usage, dict)]
+        return sum(u.get('prompt_tokens', 0) for u in usages), sum(u.get('completion_tokens', 0) for u in usages)
+
+    def model_name(self) -> Optional[str]:
+        """Model of the agent's first config_list entry."""
+        config_list = (self.llm_config or {}).get('config_list', [])
+        return config_list[0].get('model') if config_list else None
+
+    def _request_key(self, history: List[Dict[str, Any]]) -> str:
+        return make_cache_key(self.model_name(), self.system_message, history, (self.llm_config or {}).get('temperature'))
+
+    def generate_reply(self, messages: Optional[List[Dict[str, Any]]] = None, sender=None, **kwargs):
+        self.last_usage = None
+        history = messages if messages is not None else self.chat_messages.get(sender, [])
+        if self.transport is None:
+            return self._cached_reply(messages, sender, history, **kwargs)
+        if self.transport.replaying:
+            return self.transport.next_reply(self.name, self._request_key(history))
+
+        started = time.time()
+        reply = self._cached_reply(messages, sender, history, **kwargs)
+        self.transport.record(self.name, self.model_name(), self._request_key(history), reply, time.time() - started)
+        return reply
+
+    def _cached_reply(self, messages, sender, history, **kwargs):
+        cache = get_cache()
+        if cache is None or not self.llm_config or not cache.enabled_for(self.name):
+            return self._rate_limited_reply(messages, sender, history, **kwargs)
+
+        key = self._request_key(history)
+        cached = cache.get(key, self.name)
+        if cached is not None:
+            return cached
+        reply = self._rate_limited_reply(messages, sender, history, **kwargs)
+        if reply:
+            try:
+                cache.put(key, self.name, self.model_name(), reply)
+            except (TypeError, ValueError) as e:
+                print(f"{self.name}: reply could not be cached: {e}")
+        return reply
+
+    def _provider_reply(self, messages, sender, **kwargs):
+        """Ask the provider for a reply and keep the usage it reported in last_usage."""
+        usage_before = self._usage_totals()
+        reply = super().generate_reply(messages=messages, sender=sender, **kwargs)
+        usage_after = self._usage_totals()
+        if usage_before is not None and usage_after is not None and usage_after != usage_before:
+            self.last_usage = {'prompt_tokens': usage_after[0] - usage_before[0],
+                               'completion_tokens': usage_after[1] - usage_before[1]}
+        return reply
+
+    def _rate_limited_reply(self, messages, sender, history, **kwargs):
+        if self.limiter is None:
+            return self._provider_reply(messages, sender, **kwargs)
+
+        completion_tokens = self.llm_config.get('max_tokens') or DEFAULT_COMPLETION_TOKENS
+        estimated = estimate_tokens(history, self.system_message) + completion_tokens
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(estimated)
+            try:
+                reply = self._provider_reply(messages, sender, **kwargs)
+            except Exception as e:
+                # A failed request used no tokens; give back the estimate so retries are not throttled twice
+                self.limiter.settle(estimated, 0)
+                if attempt == self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = 2 ** attempt
+                print(f"{self.name}: provider throttled ({type(e).__name__}), retrying in {delay}s (attempt {attempt + 1} of {self.max_retries})")
+                time.sleep(delay)
+                continue
+
+            if self.last_usage:
+                actual = self.last_usage['prompt_tokens'] + self.last_usage['completion_tokens']
+            else:
+                content = reply.get('content', '') if isinstance(reply, dict) else (reply or '')
+                actual = estimated - completion_tokens + estimate_tokens([{"content": content}])
+            self.limiter.settle(estimated, actual)
+            return reply
@@ -0,0 +1,183 @@
+"""
+Opt-in, content-addressed cache of LLM replies.
+
+Replies are stored in SQLite under a hash of (model, system message, message list,
+temperature), so re-running a case with a different doctor model reuses identical
+Patient, MeasurementAssistant and Grader calls. The cache is bounded in size and evicts
+the least recently used entries. Hit and miss counters are kept per role in the same
+file, so they add up across threads and worker processes.
+
+The cache is configured through environment variables so that spawned worker processes
+pick up the same settings as the parent:
+    MULTI_MED_LLM_CACHE           Path of the cache database (unset = cache disabled)
+    MULTI_MED_LLM_CACHE_MAX_MB    Maximum size of cached replies in MB (default 512)
+    MULTI_MED_LLM_CACHE_ROLES     Comma-separated agent names to cache (default all)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+DEFAULT_MAX_MB = 512
+
+
+def make_cache_key(model: str, system_message: str, messages: List[Dict[str, Any]], temperature: Optional[float]) -> str:
+    """
+    Build the content address of an LLM request.
+
+    Args:
+        model: Model name from the agent's config_list
+        system_message: The agent's system message
+        messages: Message history sent to the model
+        temperature: Sampling temperature
+
+    Returns:
+        Hex SHA-256 digest identifying the request
+    """
+    payload = json.dumps({
+        "model": model,
+        "system": system_message,
+        "messages": [{"role": m.get("role"), "name": m.get("name"), "content": m.get("content")} for m in messages],
+        "temperature": temperature,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed LRU cache of LLM replies.
+
+    Args:
+        db_path: Path of the cache database
+        max_bytes: Maximum total size of cached replies; least recently used entries are evicted
+        roles: Agent names whose replies are cached, or None for all agents
+    """
+
+    def __init__(self, db_path: str, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024, roles: Optional[List[str]] = None):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.roles = set(roles) if roles else None
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('''CREATE TABLE IF NOT EXISTS responses
+                            (key TEXT PRIMARY KEY,
+                             role TEXT,
+                             model TEXT,
+                             response TEXT,
+                             size INTEGER,
+                             last_used REAL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)')
+            # Running total of cached bytes, so eviction never has to scan the whole table
+            conn.execute('''CREATE TABLE IF NOT EXISTS cache_size
+                            (id INTEGER PRIMARY KEY CHECK (id = 0),
+                             bytes INTEGER)''')
+            conn.execute('INSERT OR IGNORE INTO cache_size (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM responses')
+            conn.execute('''CREATE TABLE IF NOT EXISTS cache_stats
+                            (role TEXT PRIMARY KEY,
+                             hits INTEGER DEFAULT 0,
+                             misses INTEGER DEFAULT 0)''')
+            self._local.conn = conn
+        return conn
+
+    def enabled_for(self, role: str) -> bool:
+        """Check whether replies from this agent are cached."""
+        return self.roles is None or role in self.roles
+
+    def _count(self, conn, role: str, column: str):
+        conn.execute(f'INSERT INTO cache_stats (role, {column}) VALUES (?, 1) '
+                     f'ON CONFLICT(role) DO UPDATE SET {column} = {column} + 1', (role,))
+
+    def get(self, key: str, role: str):
+        """
+        Look up a cached reply and record a hit or miss for the role.
+
+        Returns:
+            The cached reply (str or dict), or None on a miss
+        """
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self._count(conn, role, 'misses')
+            else:
+                conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), key))
+                self._count(conn, role, 'hits')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, role: str, model: str, response):
+        """Store a reply, then evict least recently used entries until the cache fits max_bytes."""
+        data = json.dumps(response, ensure_ascii=False)
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            existing = conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            conn.execute('INSERT OR REPLACE INTO responses (key, role, model, response, size, last_used) VALUES (?, ?, ?, ?, ?, ?)',
+                         (key, role, model, data, len(data), time.time()))
+            total = conn.execute('SELECT bytes FROM cache_size WHERE id = 0').fetchone()[0]
+            total += len(data) - (existing[0] if existing else 0)
+            # Evict from the oldest end of the last_used index until we fit
+            while total > self.max_bytes:
+                oldest = conn.execute('SELECT key, size FROM responses ORDER BY last_used LIMIT 64').fetchall()
+                if not oldest:
+                    break
+                for old_key, size in oldest:
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute('DELETE FROM responses WHERE key = ?', (old_key,))
+                    total -= size
+            conn.execute('UPDATE cache_size SET bytes = ? WHERE id = 0', (total,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Hit and miss counts per role."""
+        rows = self._connection().execute('SELECT role, hits, misses FROM cache_stats ORDER BY role')
+        return {role: {'hits': hits, 'misses': misses} for role, hits, misses in rows}
+
+
+_cache: Optional[ResponseCache] = None
+_cache_settings = None
+_cache_lock = threading.Lock()
+
+
+def configure_cache(db_path: Optional[str], max_mb: float = DEFAULT_MAX_MB, roles: Optional[List[str]] = None):
+    """
+    Enable (or, with db_path=None, disable) the response cache for this process and any
+    worker processes it starts.
+    """
+    if db_path:
+        os.environ['MULTI_MED_LLM_CACHE'] = db_path
+        os.environ['MULTI_MED_LLM_CACHE_MAX_MB'] = str(max_mb)
+        os.environ['MULTI_MED_LLM_CACHE_ROLES'] = ','.join(roles or [])
+    else:
+        os.environ.pop('MULTI_MED_LLM_CACHE', None)
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """Get the process-wide response cache, or None if caching is disabled."""
+    global _cache, _cache_settings
+    settings = (os.getenv('MULTI_MED_LLM_CACHE'),
+                os.getenv('MULTI_MED_LLM_CACHE_MAX_MB', str(DEFAULT_MAX_MB)),
+                os.getenv('MULTI_MED_LLM_CACHE_ROLES', ''))
+    with _cache_lock:
+        if settings != _cache_settings:
+            db_path, max_mb, roles = settings
+            _cache = ResponseCache(db_path, int(float(max_mb) * 1024 * 1024),
+                                   [role.strip() for role in roles.split(',') if role.strip()]) if db_path else None
+            _cache_settings = settings
+        return _cache
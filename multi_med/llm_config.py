@@ -9,8 +9,11 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 OPEN_ROUTER_KEY = os.getenv('OPEN_ROUTER_KEY')
 DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
+STUB_LLM_URL = os.getenv('STUB_LLM_URL', 'http://127.0.0.1:8001/v1')
 
 # Model configurations dictionary
+# "rate_limit" declares the provider budget shared by every model with the same provider.
+# It is not part of the autogen llm_config and is stripped by get_model_config.
 MODEL_CONFIGS = {
     "gpt-4o": {
         "config_list": [{
@@ -19,6 +22,7 @@ MODEL_CONFIGS = {
             "base_url": "https://api.openai.com/v1",
         }],
         "temperature": 0.1,
+        "rate_limit": {"provider": "openai", "requests_per_minute": 500, "tokens_per_minute": 30000},
     },
     "gpt-4o-mini": {
         "config_list": [{
@@ -27,6 +31,7 @@ MODEL_CONFIGS = {
             "base_url": "https://api.openai.com/v1",
         }],
         "temperature": 0.1,
+        "rate_limit": {"provider": "openai", "requests_per_minute": 500, "tokens_per_minute": 30000},
     },
     "gemini-2.0-flash": {
         "config_list": [{
@@ -35,6 +40,7 @@ MODEL_CONFIGS = {
             "api_type": "google",
         }],
         "temperature": 0.1,
+        "rate_limit": {"provider": "google", "requests_per_minute": 1000, "tokens_per_minute": 1000000},
     },
         "gemini-2.5-flash": {
         "config_list": [{
@@ -43,6 +49,7 @@ MODEL_CONFIGS = {
             "api_type": "google",
         }],
         "temperature": 0.1,
+        "rate_limit": {"provider": "google", "requests_per_minute": 1000, "tokens_per_minute": 1000000},
     },
     "deepseek-V3": {
         "config_list": [{
@@ -52,6 +59,16 @@ MODEL_CONFIGS = {
             "api_key": DEEPSEEK_API_KEY,
         }],
         "temperature": 0.1,
+        "rate_limit": {"provider": "deepseek", "requests_per_minute": 600, "tokens_per_minute": None},
+    },
+    # Local stand-in server for load testing (python -m multi_med.stub_server)
+    "local-stub": {
+        "config_list": [{
+            "model": "stub-model",
+            "api_key": "stub",
+            "base_url": STUB_LLM_URL,
+        }],
+        "temperature": 0.1,
     },
 }
 
@@ -67,4 +84,23 @@ def get_model_config(model_name):
     """
     if model_name not in MODEL_CONFIGS:
         raise ValueError(f"Model {model_name} not found in configurations")
-    return MODEL_CONFIGS[model_name] 
\ No newline at end of file
+    return {key: value for key, value in MODEL_CONFIGS[model_name].items() if key != "rate_limit"}
+
+def get_rate_limit(llm_config):
+    """
+    Get the provider rate limit for an llm_config returned by get_model_config.
+    
+    Args:
+        llm_config (dict): Configuration passed to an agent
+        
+    Returns:
+        dict: The "rate_limit" entry of the matching model, or None if it has none
+    """
+    config_list = (llm_config or {}).get("config_list", [])
+    if not config_list:
+        return None
+    model = config_list[0].get("model")
+    for config in MODEL_CONFIGS.values():
+        if config["config_list"][0]["model"] == model:
+            return config.get("rate_limit")
+    return None 
\ No newline at end of file
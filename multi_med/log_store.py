@@ -0,0 +1,291 @@
+"""
+Compressed storage of conversation logs.
+
+Conversation logs make up almost all of case_results, so every score query paged
+through them. They are now kept compressed in their own table,
+
+    conversation_logs (result_id INTEGER PRIMARY KEY, codec TEXT, dictionary_id INTEGER, data BLOB)
+
+keyed by the rowid of the case's case_results row, and case_results.conversation_log
+stays NULL. Queries over case_results never read a log page. Read logs through
+load_conversation_log and iter_conversation_logs, which decompress on access. Both
+also fall back to the text column, for rows a migration has not moved yet.
+
+Consultations share a lot of text: the agents' fixed phrases, and the same case's
+findings and patient answers across models. Logs are therefore compressed with a
+preset dictionary trained on stored logs and kept in log_dictionaries. New logs use
+the newest dictionary. Older rows keep the dictionary they were written with until
+they are recompressed. The codec is zstd when the optional zstandard package is
+installed and zlib otherwise. zlib uses its 32 KB preset dictionary, filled with the
+lines that recur most across logs.
+
+Migrating an existing database compresses its logs with a dictionary trained on
+them, then VACUUMs it: SQLite keeps freed pages in the file, so without it the file
+would grow instead of shrinking. To retrain on a database that has grown, recompress
+every log and reclaim the freed pages:
+
+    python compress_logs.py --db medical_cases.db --train --vacuum
+"""
+
+import hashlib
+import zlib
+from collections import Counter
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Dictionary size for each codec; zlib can use at most 32 KB of preset dictionary
+DICTIONARY_SIZES = {'zlib': 32 * 1024, 'zstd': 112 * 1024}
+
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 19
+
+# Logs sampled to train a dictionary, and the fewest worth training on
+TRAINING_SAMPLES = 2000
+MIN_TRAINING_LOGS = 20
+
+# Shortest line the zlib trainer considers; shorter ones cost more to reference than they save
+MIN_DICTIONARY_LINE = 8
+
+# Cases whose logs are rewritten per commit when compressing a database
+COMPRESS_BATCH = 200
+
+# Dictionaries per (codec, checksum), loaded once per process and shared by all connections
+_dictionary_cache = {}
+
+
+def default_codec() -> str:
+    """zstd if the zstandard package is installed, otherwise zlib."""
+    return 'zstd' if zstandard is not None else 'zlib'
+
+
+def init_conversation_logs(conn):
+    """Create the conversation_logs and log_dictionaries tables if they do not exist."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS conversation_logs
+                    (result_id INTEGER PRIMARY KEY,
+                     codec TEXT,
+                     dictionary_id INTEGER,
+                     data BLOB)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS log_dictionaries
+                    (id INTEGER PRIMARY KEY,
+                     codec TEXT,
+                     checksum TEXT,
+                     dictionary BLOB,
+                     trained_on INTEGER)''')
+    conn.commit()
+
+
+def train_zlib_dictionary(logs: List[str], size: int = DICTIONARY_SIZES['zlib']) -> bytes:
+    """
+    A zlib preset dictionary from the lines that occur in the most logs.
+
+    Lines are scored by the bytes they would save (length times the number of other logs
+    that contain them). The best ones go last, because zlib reaches the end of the
+    dictionary with the shortest distances.
+    """
+    seen = Counter()
+    for log in logs:
+        seen.update({line.strip() for line in log.split('\n') if len(line.strip()) >= MIN_DICTIONARY_LINE})
+    scored = sorted(((count - 1) * len(line.encode()), line) for line, count in seen.items() if count > 1)
+    chosen = []
+    used = 0
+    for score, line in reversed(scored):
+        encoded = (line + '\n').encode()
+        if used + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        used += len(encoded)
+    return b''.join(reversed(chosen))
+
+
+def train_dictionary(logs: List[str], codec: Optional[str] = None) -> bytes:
+    """
+    Train a compression dictionary on sample logs.
+
+    Args:
+        logs: Sample conversation logs
+        codec: "zlib" or "zstd"; defaults to default_codec()
+    """
+    codec = codec or default_codec()
+    if codec == 'zstd':
+        samples = [log.encode() for log in logs]
+        return zstandard.train_dictionary(DICTIONARY_SIZES['zstd'], samples).as_bytes()
+    return train_zlib_dictionary(logs)
+
+
+def save_dictionary(conn, dictionary: bytes, codec: str, trained_on: int) -> int:
+    """Store a trained dictionary, making it the one new logs are compressed with. Returns its id."""
+    cursor = conn.execute('INSERT INTO log_dictionaries (codec, checksum, dictionary, trained_on) VALUES (?, ?, ?, ?)',
+                          (codec, hashlib.sha1(dictionary).hexdigest(), dictionary, trained_on))
+    return cursor.lastrowid
+
+
+def _codec_state(conn, codec: str, dictionary_id: Optional[int], checksum: Optional[str]) -> Dict[str, Any]:
+    """
+    A dictionary ready to use, loaded from the database once per process.
+
+    Only the dictionary is cached. Compressor objects are not thread-safe, so each
+    call makes its own.
+    """
+    key = (codec, checksum)
+    if key not in _dictionary_cache:
+        dictionary = None
+        if dictionary_id is not None:
+            dictionary = conn.execute('SELECT dictionary FROM log_dictionaries WHERE id = ?', (dictionary_id,)).fetchone()[0]
+        if codec == 'zstd':
+            if zstandard is None:
+                raise RuntimeError("This log is compressed with zstd; install the zstandard package to read it")
+            state = {'dictionary': zstandard.ZstdCompressionDict(dictionary) if dictionary else None}
+        else:
+            state = {'dictionary': dictionary}
+        _dictionary_cache[key] = state
+    return _dictionary_cache[key]
+
+
+def _state_for_id(conn, codec: str, dictionary_id: Optional[int]) -> Dict[str, Any]:
+    checksum = None
+    if dictionary_id is not None:
+        checksum = conn.execute('SELECT checksum FROM log_dictionaries WHERE id = ?', (dictionary_id,)).fetchone()[0]
+    return _codec_state(conn, codec, dictionary_id, checksum)
+
+
+def compress_log(conn, text: str) -> Tuple[str, Optional[int], bytes]:
+    """
+    Compress a log with the newest dictionary (or none, before one has been trained).
+
+    Returns:
+        (codec, dictionary_id, data)
+    """
+    row = conn.execute('SELECT id, codec, checksum FROM log_dictionaries ORDER BY id DESC LIMIT 1').fetchone()
+    dictionary_id, codec, checksum = row if row else (None, default_codec(), None)
+    if codec == 'zstd' and zstandard is None:
+        # The newest dictionary needs zstandard; plain zlib keeps the log readable here
+        dictionary_id, codec, checksum = None, 'zlib', None
+    state = _codec_state(conn, codec, dictionary_id, checksum)
+    raw = text.encode()
+    if codec == 'zstd':
+        return codec, dictionary_id, zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=state['dictionary']).compress(raw)
+    if state['dictionary']:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zdict=state['dictionary'])
+    else:
+        compressor = zlib.compressobj(ZLIB_LEVEL)
+    return codec, dictionary_id, compressor.compress(raw) + compressor.flush()
+
+
+def decompress_log(conn, codec: str, dictionary_id: Optional[int], data: bytes) -> str:
+    """Decompress a conversation_logs row's data."""
+    state = _state_for_id(conn, codec, dictionary_id)
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor(dict_data=state['dictionary']).decompress(data).decode()
+    decompressor = zlib.decompressobj(zdict=state['dictionary']) if state['dictionary'] else zlib.decompressobj()
+    return (decompressor.decompress(data) + decompressor.flush()).decode()
+
+
+def save_conversation_log(conn, result_id: int, text: Optional[str]):
+    """
+    Store a case's log compressed. Does not commit; the caller commits together with the result row.
+
+    Args:
+        conn: Open sqlite3 connection
+        result_id: rowid of the case's case_results row
+        text: The conversation log
+    """
+    if text is None:
+        return
+    codec, dictionary_id, data = compress_log(conn, text)
+    conn.execute('INSERT OR REPLACE INTO conversation_logs (result_id, codec, dictionary_id, data) VALUES (?, ?, ?, ?)',
+                 (result_id, codec, dictionary_id, data))
+
+
+def _has_log_table(conn) -> bool:
+    """Whether the database has been migrated to conversation_logs (read-only callers may open older files)."""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversation_logs'").fetchone() is not None
+
+
+def load_conversation_log(conn, result_id: int) -> Optional[str]:
+    """The conversation log of a case_results row, or None if it has none."""
+    row = _has_log_table(conn) and conn.execute('SELECT codec, dictionary_id, data FROM conversation_logs WHERE result_id = ?', (result_id,)).fetchone()
+    if row:
+        return decompress_log(conn, *row)
+    row = conn.execute('SELECT conversation_log FROM case_results WHERE rowid = ?', (result_id,)).fetchone()
+    return row[0] if row else None
+
+
+def iter_conversation_logs(conn, where: str = '', params: tuple = ()) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (result_id, log) for every case_results row that has a log.
+
+    Args:
+        conn: Open sqlite3 connection
+        where: Optional SQL condition on case_results (e.g. "llm = ?")
+        params: Parameters for where
+    """
+    condition = f'AND ({where})' if where else ''
+    if not _has_log_table(conn):
+        yield from conn.execute(f'SELECT rowid, conversation_log FROM case_results WHERE conversation_log IS NOT NULL {condition} ORDER BY rowid', params)
+        return
+    rows = conn.execute(f'''SELECT case_results.rowid, case_results.conversation_log, l.codec, l.dictionary_id, l.data
+                            FROM case_results LEFT JOIN conversation_logs l ON l.result_id = case_results.rowid
+                            WHERE (l.data IS NOT NULL OR case_results.conversation_log IS NOT NULL) {condition}
+                            ORDER BY case_results.rowid''', params)
+    for result_id, text, codec, dictionary_id, data in rows:
+        yield result_id, decompress_log(conn, codec, dictionary_id, data) if data is not None else text
+
+
+def train_from_stored_logs(conn, codec: Optional[str] = None, samples: int = TRAINING_SAMPLES) -> Optional[int]:
+    """
+    Train a dictionary on up to `samples` stored logs and save it.
+
+    Returns:
+        The new dictionary's id, or None if fewer than MIN_TRAINING_LOGS logs are stored
+    """
+    logs = [log for _, log in iter_conversation_logs(conn, 'case_results.rowid IN (SELECT rowid FROM case_results ORDER BY RANDOM() LIMIT ?)', (samples,))]
+    if len(logs) < MIN_TRAINING_LOGS:
+        return None
+    codec = codec or default_codec()
+    return save_dictionary(conn, train_dictionary(logs, codec), codec, len(logs))
+
+
+def compress_stored_logs(conn, recompress: bool = False, batch: int = COMPRESS_BATCH) -> int:
+    """
+    Move text logs out of case_results into conversation_logs, compressed with the newest dictionary.
+
+    Args:
+        conn: Open sqlite3 connection
+        recompress: Also rewrite logs already compressed with an older dictionary
+        batch: Cases per commit
+
+    Returns:
+        Number of logs written
+    """
+    newest = conn.execute('SELECT MAX(id) FROM log_dictionaries').fetchone()[0]
+    condition = 'case_results.conversation_log IS NOT NULL'
+    params = ()
+    if recompress and newest is not None:
+        condition += ' OR (l.data IS NOT NULL AND l.dictionary_id IS NOT ?)'
+        params = (newest,)
+    ids = [row[0] for row in conn.execute(f'''SELECT case_results.rowid FROM case_results
+                                              LEFT JOIN conversation_logs l ON l.result_id = case_results.rowid
+                                              WHERE {condition}''', params)]
+    for done, result_id in enumerate(ids, 1):
+        save_conversation_log(conn, result_id, load_conversation_log(conn, result_id))
+        conn.execute('UPDATE case_results SET conversation_log = NULL WHERE rowid = ?', (result_id,))
+        if done % batch == 0:
+            conn.commit()
+            print(f"Compressed {done}/{len(ids)} conversation logs")
+    conn.commit()
+    return len(ids)
+
+
+def migrate_conversation_logs(conn):
+    """Schema migration: create the tables, train a dictionary on the stored logs, compress them and VACUUM."""
+    init_conversation_logs(conn)
+    if conn.execute('SELECT 1 FROM log_dictionaries').fetchone() is None:
+        train_from_stored_logs(conn)
+    if compress_stored_logs(conn):
+        # compress_stored_logs has committed; VACUUM cannot run inside a transaction
+        print("Reclaiming the space of the uncompressed logs (VACUUM)")
+        conn.execute('VACUUM')
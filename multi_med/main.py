@@ -1,107 +1,82 @@
-import json
-import sqlite3
+import argparse
+import os
 import time
+import uuid
 from multi_med import get_model_config, process_single_case
+from multi_med.journal import completed_keys, mark_completed
+from multi_med.runner import load_jobs
+from multi_med.storage import open_db, save_case_result
 from google.api_core.exceptions import ServiceUnavailable
 
-# Initialize database
-def init_db():
-    conn = sqlite3.connect('medical_cases.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS case_results
-                 (llm TEXT,
-                  presentation TEXT,
-                  correct_diagnosis TEXT,
-                  doctor_diagnosis TEXT,
-                  is_correct INTEGER,
-                  tag TEXT,
-                  conversation_log TEXT,
-                  total_investigation_cost REAL)''')
-    conn.commit()
-    return conn
-
-def process_cases(doctor_model, cases_file, max_retries=3):
+def process_cases(doctor_model, cases_file, max_retries=3, run_id=None):
     # Initialize configurations
     doctor_config = get_model_config(doctor_model)
     other_config = get_model_config("gemini-2.0-flash")
     
     # Initialize database
-    conn = init_db()
-    c = conn.cursor()
+    conn = open_db()
     
-    # Read and process cases from JSONL file
-    with open(cases_file, 'r') as f:
-        for line in f:
-            test_case = json.loads(line)
-            
-            # Process the case with retry logic
-            retry_count = 0
-            while retry_count <= max_retries:
-                try:
-                    # Process the case
-                    result = process_single_case(test_case, doctor_config, other_config)
-                    
-                    # Check if identical row already exists
-                    c.execute('''SELECT COUNT(*) FROM case_results 
-                                WHERE llm = ? AND presentation = ? AND correct_diagnosis = ? 
-                                AND doctor_diagnosis = ? AND is_correct = ? AND tag = ?''',
-                             (doctor_model,
-                              cases_file[6:],
-                              result['correct_diagnosis'],
-                              result['doctor_diagnosis'],
-                              1 if result['is_correct'] else 0,
-                              test_case.get('tag', '')))
-                    
-                    row_exists = c.fetchone()[0] > 0
-                    
-                    # Store results in database only if not a duplicate
-                    if not row_exists:
-                        c.execute('''INSERT INTO case_results 
-                                    (llm, presentation, correct_diagnosis, doctor_diagnosis, is_correct, tag, conversation_log)
-                                    VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                                 (doctor_model,
-                                  cases_file[6:],
-                                  result['correct_diagnosis'],
-                                  result['doctor_diagnosis'],
-                                  1 if result['is_correct'] else 0,
-                                  test_case.get('tag', ''),
-                                  result['conversation_log']))
-                        conn.commit()
-                        print(f"Added new case with diagnosis: {result['correct_diagnosis']}")
-                    else:
-                        print(f"Skipped duplicate case with diagnosis: {result['correct_diagnosis']}")
-                    
-                    # Print progress
-                    print(f"Doctor's diagnosis: {result['doctor_diagnosis']}")
-                    print(f"Correct: {'Yes' if result['is_correct'] else 'No'}")
-                    print("-" * 50)
-                    
-                    # Successfully processed this case, break the retry loop
-                    break
-                    
-                except ServiceUnavailable as e:
-                    retry_count += 1
-                    if retry_count <= max_retries:
-                        print(f"Google API service unavailable. Error: {e}")
-                        print(f"Retrying case... Attempt {retry_count} of {max_retries}")
-                        time.sleep(2)  # Add a small delay before retrying
-                    else:
-                        print(f"Maximum retry attempts reached for this case. Skipping.")
-                        break
-                except Exception as e:
-                    print(f"An error occurred while processing the case: {e}")
+    # Cases already finished in this run are skipped before any LLM call is made.
+    # The default run id is the same every time, so a rerun resumes; pass a new one to start afresh
+    cases_file = os.path.normpath(cases_file)
+    run_id = run_id or f"{doctor_model}:{cases_file}"
+    done = completed_keys(conn, run_id)
+    
+    # Read and process cases from JSONL file, indexed as run_benchmark.py does (blank lines skipped)
+    for job in load_jobs([cases_file], [doctor_model]):
+        cases_file, case_index, test_case = job['cases_file'], job['case_index'], job['test_case']
+        if (cases_file, case_index, doctor_model) in done:
+            print(f"Skipped case {case_index + 1}, already completed in run {run_id}")
+            continue
+        
+        # Process the case with retry logic
+        retry_count = 0
+        while retry_count <= max_retries:
+            try:
+                # Process the case
+                result = process_single_case(test_case, doctor_config, other_config)
+                
+                # Store the result and its journal entry in one transaction
+                save_case_result(conn, doctor_model, cases_file, result, commit=False, tag=test_case.get('tag', ''))
+                mark_completed(conn, run_id, cases_file, case_index, doctor_model)
+                conn.commit()
+                print(f"Added new case with diagnosis: {result['correct_diagnosis']}")
+                
+                # Print progress
+                print(f"Doctor's diagnosis: {result['doctor_diagnosis']}")
+                print(f"Correct: {'Yes' if result['is_correct'] else 'No'}")
+                print("-" * 50)
+                
+                # Successfully processed this case, break the retry loop
+                break
+                
+            except ServiceUnavailable as e:
+                retry_count += 1
+                if retry_count <= max_retries:
+                    print(f"Google API service unavailable. Error: {e}")
+                    print(f"Retrying case... Attempt {retry_count} of {max_retries}")
+                    time.sleep(2)  # Add a small delay before retrying
+                else:
+                    print(f"Maximum retry attempts reached for this case. Skipping.")
                     break
+            except Exception as e:
+                print(f"An error occurred while processing the case: {e}")
+                break
     
     # Close database connection
     conn.close()
 
 def main():
-    # Default values
-    doctor_model = "gpt-4.1-nano"
-    cases_file = 'cases/Back pain, lower_all_cases.jsonl'
-    
+    parser = argparse.ArgumentParser(description='Run one case file with one doctor model, resuming an interrupted run')
+    parser.add_argument('--doctor-model', type=str, default="gpt-4.1-nano", help='Doctor model to evaluate')
+    parser.add_argument('--cases', type=str, default='cases/Back pain, lower_all_cases.jsonl', help='Case file to run')
+    parser.add_argument('--run-id', type=str, default=None, help='Journal id of the run to resume (default: "MODEL:CASES", so reruns skip finished cases)')
+    parser.add_argument('--fresh', action='store_true', help='Start a new run under a new id instead of skipping cases finished before')
+    args = parser.parse_args()
+
+    run_id = f"fresh-{uuid.uuid4().hex[:12]}" if args.fresh else args.run_id
     # Process cases with built-in retry
-    process_cases(doctor_model, cases_file)
+    process_cases(args.doctor_model, args.cases, run_id=run_id)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
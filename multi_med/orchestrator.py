@@ -0,0 +1,188 @@
+"""
+Deterministic turn-taking engine for a consultation.
+
+Speaker order in this benchmark never needs an LLM: the Doctor talks to the Patient,
+REQUEST EXAMINATION FINDING / REQUEST TESTS go to the MeasurementAssistant, and
+DIAGNOSIS READY from the Doctor goes to the Grader, whose reply ends the case.
+Consultation drives the four agents directly with these rules. Unlike autogen's
+GroupChat/GroupChatManager it does not broadcast every message to every agent, keep a
+message store per agent pair, or build an extra LLM client for the manager on each case.
+It is shared by the batch (process_single_case) and streaming
+(process_single_case_streaming) paths.
+"""
+
+import time
+from typing import Dict, Any, Callable, List, Optional
+
+OPENING_MESSAGE = "Hello, I'm Dr. Agent. What can I do to help you today?"
+
+# Maximum number of replies after the Doctor's opening message
+MAX_TURNS = 50
+
+
+def is_termination(content: str) -> bool:
+    """Check whether a message ends the consultation."""
+    return "TERMINATE" in content.upper() or content.lower().strip() == "exit"
+
+
+def select_next_speaker(sender: Optional[str], content: str) -> Optional[str]:
+    """
+    Route the conversation to the next agent.
+
+    Args:
+        sender: Name of the agent that sent the last message (None before the first message)
+        content: Content of the last message
+
+    Returns:
+        Name of the agent that speaks next, or None to end the consultation
+    """
+    if sender is None:
+        return "Patient"
+    if is_termination(content):
+        return None
+    if "REQUEST EXAMINATION FINDING:" in content or "REQUEST TESTS:" in content:
+        return "MeasurementAssistant"
+    if sender == "Doctor" and "DIAGNOSIS READY:" in content:
+        return "Grader"
+    if sender == "Doctor":
+        return "Patient"
+    if sender in ("Patient", "MeasurementAssistant"):
+        return "Doctor"
+    # The Grader (or an unknown sender) ends the consultation
+    return None
+
+
+class Consultation:
+    """
+    Runs one consultation between the Doctor, Patient, MeasurementAssistant and Grader.
+
+    Args:
+        agents: Agents keyed by name; each must provide generate_reply(messages=...)
+        max_turns: Maximum number of replies after the opening message
+        on_request: Optional callback, called with (speaker name, consultation) just before
+            the speaker is asked for a reply (e.g. to adjust its system message for this turn).
+            If it returns a string, that is used as the reply and the speaker is not asked
+        context: Optional context policies keyed by agent name, {"view", "window"} dicts as
+            returned by context.context_policies(); agents without one see everything
+        stop_before: Agents whose turn ends the consultation instead, unless on_request
+            returned a reply for them (e.g. ("Grader",) to grade after the run)
+
+    Attributes:
+        messages: The conversation so far as {"name", "content"} dicts
+        histories: The conversation from each agent's point of view, as sent to its
+            generate_reply: its own messages are 'assistant', all others 'user'
+        views: For each agent, the index in messages of every entry of its history
+        sent_view: Indices of the messages sent with the latest request, or None if the
+            speaker was sent the whole conversation
+        speaker: Name of the agent currently being asked for a reply
+        stop_reason: Why the consultation ended, once it has
+        stopped_before: The agent in stop_before whose turn ended the consultation, if any
+    """
+
+    def __init__(self, agents: Dict[str, Any], max_turns: int = MAX_TURNS,
+                 on_request: Optional[Callable[[str, 'Consultation'], None]] = None,
+                 context: Optional[Dict[str, Dict[str, Any]]] = None, stop_before: tuple = ()):
+        self.agents = agents
+        self.max_turns = max_turns
+        self.on_request = on_request
+        self.context = context or {}
+        self.messages: List[Dict[str, str]] = []
+        self.histories: Dict[str, List[Dict[str, str]]] = {name: [] for name in agents}
+        self.views: Dict[str, List[int]] = {name: [] for name in agents}
+        self.sent_view: Optional[List[int]] = None
+        self.speaker: Optional[str] = None
+        self.stop_reason: Optional[str] = None
+        self.stop_before = stop_before
+        self.stopped_before: Optional[str] = None
+        # Agents that are only sent their own exchanges
+        self._own_view = {name for name, policy in self.context.items() if policy['view'] == 'own'}
+
+    def _append(self, name: str, content: str) -> Optional[str]:
+        """
+        Record a message once and extend every agent's history with its role-mapped entry.
+
+        Returns:
+            The agent the message is addressed to (the next speaker), or None if it ends the consultation
+        """
+        addressee = select_next_speaker(name, content)
+        index = len(self.messages)
+        self.messages.append({"name": name, "content": content})
+        # Each history only grows, so the role-mapped entries are built once per message
+        # and the 'user' entry is shared by every agent other than the sender
+        as_user = {"role": "user", "content": content}
+        for agent_name, history in self.histories.items():
+            if agent_name in self._own_view and agent_name != name and agent_name != addressee:
+                continue
+            history.append({"role": "assistant", "content": content} if agent_name == name else as_user)
+            self.views[agent_name].append(index)
+        return addressee
+
+    def _request_history(self, speaker: str) -> List[Dict[str, str]]:
+        """The part of the speaker's history its context policy sends, and set sent_view to match."""
+        history = self.histories[speaker]
+        policy = self.context.get(speaker)
+        if policy is None:
+            self.sent_view = None
+            return history
+        window = 1 if policy['view'] == 'last' else policy['window']
+        if window:
+            self.sent_view = self.views[speaker][-window:]
+            return history[-window:]
+        # A copy: the live view grows with the reply, which was not part of the request
+        self.sent_view = list(self.views[speaker])
+        return history
+
+    def run(self, opening_message: str = OPENING_MESSAGE):
+        """
+        Drive the consultation to the end.
+
+        Args:
+            opening_message: The Doctor's first message
+
+        Yields:
+            Each message as a {"name", "content"} dict, starting with the opening message.
+            Replies also have "latency", the seconds generate_reply took, and replies
+            returned by on_request have "local": True.
+            Errors raised by an agent propagate to the caller.
+        """
+        addressee = self._append("Doctor", opening_message)
+        yield self.messages[-1]
+
+        for _ in range(self.max_turns):
+            last = self.messages[-1]
+            self.speaker = addressee
+            if self.speaker is None:
+                if last["name"] == "Grader" and "TERMINATE" in last["content"].upper():
+                    self.stop_reason = "Grader signaled termination."
+                else:
+                    self.stop_reason = "Simulation ended by speaker selection."
+                return
+
+            local_reply = self.on_request(self.speaker, self) if self.on_request else None
+            if local_reply is None and self.speaker in self.stop_before:
+                self.stopped_before = self.speaker
+                self.stop_reason = f"Simulation stopped before {self.speaker}'s turn."
+                return
+            started = time.perf_counter()
+            if local_reply is not None:
+                reply = local_reply
+            else:
+                reply = self.agents[self.speaker].generate_reply(messages=self._request_history(self.speaker))
+            latency = time.perf_counter() - started
+            if reply is None:
+                self.stop_reason = f"{self.speaker} did not provide a reply. Ending simulation."
+                return
+            if isinstance(reply, dict):
+                content = reply.get("content") or ""
+            elif isinstance(reply, str):
+                content = reply
+            else:
+                raise TypeError(f"Unexpected reply format from {self.speaker}: {type(reply).__name__}")
+
+            addressee = self._append(self.speaker, content)
+            self.messages[-1]["latency"] = latency
+            if local_reply is not None:
+                self.messages[-1]["local"] = True
+            yield self.messages[-1]
+
+        self.stop_reason = "Simulation reached maximum turns."
@@ -0,0 +1,196 @@
+"""
+Incremental Parquet export of results, turns and events for analysis.
+
+Reading case_results into pandas drags every conversation log along. The export
+writes three Parquet datasets instead, each partitioned by llm and presentation in
+hive layout (llm=.../presentation=.../part-*.parquet):
+
+    results  one row per case: the case_results columns without the log
+    turns    one row per turn: speaker, action, content, tokens, latency and cost
+    events   one row per extracted event (see events.py): type, agent, text, cost,
+             request_turn and correct
+
+Parquet is columnar, so a score-only analysis reads just the columns it asks for,
+and a filter on llm or presentation skips whole directories:
+
+    import pyarrow.dataset as ds
+    results = ds.dataset('exports/parquet/results', format='parquet', partitioning='hive')
+    results.to_table(columns=['llm', 'presentation', 'is_correct']).to_pandas()
+
+Exports are incremental. _export_state.json in the output directory records the
+highest case_results rowid exported. Each run appends new part files with only the
+rows added since then. Cases still waiting for deferred grading are held back and
+exported once they have a grade, so an exported is_correct never changes later. The
+state is saved only after all of an export's files are written. An interrupted export
+is run again under the same number, after deleting the files it had written, so rows
+are never duplicated.
+
+pyarrow is optional: it is only needed here (pip install pyarrow).
+"""
+
+import json
+import os
+from typing import Dict, Any, List, Optional
+
+from .events import extract_events, parse_conversation_log
+from .log_store import iter_conversation_logs
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+    ds = None
+
+STATE_FILE = '_export_state.json'
+
+# Cases read, and written per part file, at a time
+EXPORT_BATCH = 5000
+
+PARTITION_FIELDS = ('llm', 'presentation')
+
+# (column, pyarrow type factory name) per dataset; the partition columns come first in every one
+DATASET_COLUMNS = {
+    'results': (('llm', 'string'), ('presentation', 'string'), ('result_id', 'int64'), ('notes', 'string'), ('tag', 'string'),
+                ('correct_diagnosis', 'string'), ('doctor_diagnosis', 'string'), ('is_correct', 'bool_'),
+                ('total_investigation_cost', 'float64'), ('turn_count', 'int32'), ('total_tokens', 'int64'),
+                ('unknown_investigations', 'string'), ('grader', 'string')),
+    'turns': (('llm', 'string'), ('presentation', 'string'), ('result_id', 'int64'), ('turn', 'int32'), ('speaker', 'string'),
+              ('action', 'string'), ('content', 'string'), ('input_tokens', 'int64'), ('output_tokens', 'int64'),
+              ('latency', 'float64'), ('cost', 'float64')),
+    'events': (('llm', 'string'), ('presentation', 'string'), ('result_id', 'int64'), ('turn', 'int32'), ('agent', 'string'),
+               ('type', 'string'), ('text', 'string'), ('cost', 'float64'), ('request_turn', 'int32'), ('correct', 'bool_')),
+}
+
+_RESULT_COLUMNS = ('llm', 'presentation', 'notes', 'tag', 'correct_diagnosis', 'doctor_diagnosis', 'is_correct',
+                   'total_investigation_cost', 'turn_count', 'total_tokens', 'unknown_investigations', 'grader')
+
+
+def load_state(out_dir: str) -> Dict[str, Any]:
+    """The export state of an output directory: exports so far, last exported rowid and held-back rowids."""
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {'exports': 0, 'last_result_id': 0, 'held_back': []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(out_dir: str, state: Dict[str, Any]):
+    """Write the export state atomically, so an interrupted export leaves the previous one."""
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def collect_rows(conn, result_ids: List[int]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    The results, turns and events rows of some case_results rows.
+
+    Args:
+        conn: Open sqlite3 connection
+        result_ids: rowids to export
+
+    Returns:
+        Rows per dataset name
+    """
+    placeholders = ', '.join('?' * len(result_ids))
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(case_results)')}
+    select = ', '.join(name if name in existing else f'NULL AS {name}' for name in _RESULT_COLUMNS)
+    results = {}
+    for row in conn.execute(f'SELECT rowid, {select} FROM case_results WHERE rowid IN ({placeholders})', result_ids):
+        result = dict(zip(('result_id',) + _RESULT_COLUMNS, row))
+        if result['is_correct'] is not None:
+            result['is_correct'] = bool(result['is_correct'])
+        results[result['result_id']] = result
+
+    turns = []
+    has_turns = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'turns'").fetchone()
+    if has_turns:
+        query = f'''SELECT result_id, turn, speaker, action, content, input_tokens, output_tokens, latency, cost
+                    FROM turns WHERE result_id IN ({placeholders}) ORDER BY result_id, turn'''
+        for row in conn.execute(query, result_ids):
+            if row[0] not in results:
+                continue
+            turn = dict(zip(('result_id', 'turn', 'speaker', 'action', 'content', 'input_tokens', 'output_tokens', 'latency', 'cost'), row))
+            turn.update({name: results[turn['result_id']][name] for name in PARTITION_FIELDS})
+            turns.append(turn)
+
+    events = []
+    for result_id, log in iter_conversation_logs(conn, f'case_results.rowid IN ({placeholders})', tuple(result_ids)):
+        if result_id not in results:
+            continue
+        for event in extract_events(parse_conversation_log(log)):
+            events.append({'result_id': result_id, 'llm': results[result_id]['llm'], 'presentation': results[result_id]['presentation'],
+                           'turn': event['turn'], 'agent': event['agent'], 'type': event['type'], 'text': event.get('text'),
+                           'cost': event.get('cost'), 'request_turn': event.get('request_turn'), 'correct': event.get('correct')})
+
+    return {'results': list(results.values()), 'turns': turns, 'events': events}
+
+
+def _remove_parts(out_dir: str, export: int):
+    """Delete the part files written by an export, in every dataset and partition."""
+    prefix = f'part-{export:05d}-'
+    for name in DATASET_COLUMNS:
+        for directory, _, files in os.walk(os.path.join(out_dir, name)):
+            for file_name in files:
+                if file_name.startswith(prefix):
+                    os.remove(os.path.join(directory, file_name))
+
+
+def _write_dataset(out_dir: str, name: str, rows: List[Dict[str, Any]], basename: str):
+    """Append rows to a partitioned dataset as part files named after basename."""
+    if not rows:
+        return
+    schema = pa.schema([(column, getattr(pa, type_name)()) for column, type_name in DATASET_COLUMNS[name]])
+    table = pa.Table.from_pylist(rows, schema=schema)
+    partitioning = ds.partitioning(pa.schema([(field, pa.string()) for field in PARTITION_FIELDS]), flavor='hive')
+    # overwrite_or_ignore: the directories already hold earlier exports' files
+    ds.write_dataset(table, os.path.join(out_dir, name), format='parquet', partitioning=partitioning,
+                     basename_template=basename + '-{i}.parquet', existing_data_behavior='overwrite_or_ignore')
+
+
+def export_parquet(conn, out_dir: str, batch: int = EXPORT_BATCH, limit: Optional[int] = None) -> Dict[str, int]:
+    """
+    Append the rows added since the last export to the Parquet datasets in out_dir.
+
+    Args:
+        conn: Open sqlite3 connection
+        out_dir: Output directory (created if needed), holding results/, turns/, events/ and the state file
+        batch: Cases per part file
+        limit: Export at most this many cases (the rest are picked up by the next run)
+
+    Returns:
+        Rows written per dataset, and "held_back" (cases waiting for a grade)
+    """
+    if pa is None:
+        raise RuntimeError("The Parquet export needs pyarrow: pip install pyarrow")
+    os.makedirs(out_dir, exist_ok=True)
+    state = load_state(out_dir)
+    export = state['exports'] + 1
+
+    # Cases queued for deferred grading wait until they have a grade; other rows without one are exported as they are
+    ungraded = set()
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'grading_queue'").fetchone():
+        ungraded = {row[0] for row in conn.execute('SELECT result_id FROM grading_queue WHERE is_correct IS NULL')}
+    new_ids = [row[0] for row in conn.execute('SELECT rowid FROM case_results WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                                              (state['last_result_id'], -1 if limit is None else limit))]
+    candidates = state['held_back'] + new_ids
+    to_export = [result_id for result_id in candidates if result_id not in ungraded]
+    held_back = [result_id for result_id in candidates if result_id in ungraded]
+
+    # Files of an earlier attempt at this export that was interrupted; its rows are all in to_export again
+    _remove_parts(out_dir, export)
+    counts = {'results': 0, 'turns': 0, 'events': 0}
+    for start in range(0, len(to_export), batch):
+        rows = collect_rows(conn, to_export[start:start + batch])
+        for name, dataset_rows in rows.items():
+            _write_dataset(out_dir, name, dataset_rows, f'part-{export:05d}-{start // batch:04d}')
+            counts[name] += len(dataset_rows)
+        print(f"Exported {min(start + batch, len(to_export))}/{len(to_export)} cases")
+
+    save_state(out_dir, {'exports': export if to_export else state['exports'],
+                         'last_result_id': new_ids[-1] if new_ids else state['last_result_id'],
+                         'held_back': held_back})
+    counts['held_back'] = len(held_back)
+    return counts
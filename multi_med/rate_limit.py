@@ -0,0 +1,151 @@
+"""
+Per-provider token-bucket rate limiting.
+
+Bucket state lives in a small SQLite file so that every thread and every process on the
+host draws from the same budget. Each bucket holds up to one minute's worth of requests
+and tokens and refills continuously at the configured per-minute rate.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+DEFAULT_DB_PATH = os.getenv('MULTI_MED_RATE_LIMIT_DB', 'rate_limits.db')
+
+
+class TokenBucketLimiter:
+    """
+    A requests-per-minute and tokens-per-minute budget shared through SQLite.
+
+    Args:
+        name: Bucket name, usually the provider (e.g. "openai")
+        requests_per_minute: Request budget, or None for no request limit
+        tokens_per_minute: Token budget, or None for no token limit
+        db_path: Path of the SQLite file holding bucket state
+    """
+
+    def __init__(self, name: str, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, db_path: str = DEFAULT_DB_PATH):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads, so keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('''CREATE TABLE IF NOT EXISTS buckets
+                            (name TEXT PRIMARY KEY,
+                             requests REAL,
+                             tokens REAL,
+                             updated REAL)''')
+            self._local.conn = conn
+        return conn
+
+    def _refill(self, requests: float, tokens: float, elapsed: float):
+        if self.requests_per_minute:
+            requests = min(self.requests_per_minute, requests + elapsed * self.requests_per_minute / 60.0)
+        if self.tokens_per_minute:
+            tokens = min(self.tokens_per_minute, tokens + elapsed * self.tokens_per_minute / 60.0)
+        return requests, tokens
+
+    def _wait_time(self, requests: float, tokens: float, needed_tokens: float) -> float:
+        wait = 0.0
+        if self.requests_per_minute and requests < 1:
+            wait = max(wait, (1 - requests) * 60.0 / self.requests_per_minute)
+        if self.tokens_per_minute and tokens < needed_tokens:
+            wait = max(wait, (needed_tokens - tokens) * 60.0 / self.tokens_per_minute)
+        return wait
+
+    def _update(self, request_cost: float, token_cost: float, acquire: bool) -> float:
+        """
+        Atomically refill the bucket and, if there is room (or acquire is False), deduct the costs.
+
+        Returns:
+            0.0 if the costs were deducted, otherwise the number of seconds to wait
+        """
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute('SELECT requests, tokens, updated FROM buckets WHERE name = ?', (self.name,)).fetchone()
+            if row is None:
+                requests, tokens = self.requests_per_minute or 0.0, self.tokens_per_minute or 0.0
+            else:
+                requests, tokens = self._refill(row[0], row[1], max(0.0, now - row[2]))
+            wait = self._wait_time(requests, tokens, token_cost) if acquire else 0.0
+            if wait == 0.0:
+                requests -= request_cost
+                tokens -= token_cost
+            conn.execute('INSERT OR REPLACE INTO buckets (name, requests, tokens, updated) VALUES (?, ?, ?, ?)',
+                         (self.name, requests, tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+    def acquire(self, tokens: float = 0) -> float:
+        """
+        Block until one request and the estimated number of tokens are available.
+
+        Args:
+            tokens: Estimated tokens the request will consume (prompt plus completion)
+
+        Returns:
+            Total seconds spent waiting
+        """
+        if self.tokens_per_minute:
+            # A single request larger than the whole budget would otherwise wait forever
+            tokens = min(tokens, self.tokens_per_minute)
+        else:
+            tokens = 0
+        waited = 0.0
+        while True:
+            wait = self._update(1, tokens, acquire=True)
+            if wait == 0.0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def settle(self, estimated_tokens: float, actual_tokens: float):
+        """
+        Correct the bucket once the real token usage of a request is known.
+
+        A request that used more than its estimate drives the bucket negative, which
+        makes later callers wait; one that used less refunds the difference.
+        """
+        if self.tokens_per_minute and actual_tokens != estimated_tokens:
+            self._update(0, actual_tokens - min(estimated_tokens, self.tokens_per_minute), acquire=False)
+
+
+_limiters: Dict[str, TokenBucketLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(rate_limit: Optional[Dict]) -> Optional[TokenBucketLimiter]:
+    """
+    Get the shared limiter for a rate_limit entry from MODEL_CONFIGS.
+
+    Args:
+        rate_limit: Dictionary with provider, requests_per_minute and tokens_per_minute
+
+    Returns:
+        The limiter for that provider, or None if rate_limit is empty
+    """
+    if not rate_limit:
+        return None
+    name = rate_limit['provider']
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = TokenBucketLimiter(name,
+                                         rate_limit.get('requests_per_minute'),
+                                         rate_limit.get('tokens_per_minute'))
+            _limiters[name] = limiter
+        return limiter
@@ -0,0 +1,113 @@
+"""
+Record/replay transport for full consultations.
+
+A CaseTransport is handed to the agents of one case. In record mode it captures every
+LLM request/response pair the agents make; in replay mode it serves the recorded
+responses back in the same order without touching the network, so the orchestration
+layer (speaker selection, message formatting, cost extraction, DB writes) can be
+benchmarked, profiled and debugged on real traffic.
+
+A run archive is a gzip-compressed JSONL file with one line per case:
+    {"case": "<case file>#<case index>#<doctor model>", "calls": [{"agent", "model", "request", "reply", "latency"}, ...]}
+where "request" is the content hash of the request (see llm_cache.make_cache_key).
+"""
+
+import gzip
+import json
+import threading
+from typing import Dict, Any, List, Optional
+
+
+class ReplayError(Exception):
+    """Raised when a replayed case asks for a response that was not recorded."""
+
+
+def case_key(cases_file: str, case_index: int, doctor_model: str) -> str:
+    """Identify a case within a run archive."""
+    return f"{cases_file}#{case_index}#{doctor_model}"
+
+
+class CaseTransport:
+    """
+    Records or replays the LLM calls of a single case.
+
+    Args:
+        calls: Recorded calls to replay, or None to record
+    """
+
+    def __init__(self, calls: Optional[List[Dict[str, Any]]] = None):
+        self.replaying = calls is not None
+        self.calls = list(calls) if calls is not None else []
+        self._position = 0
+
+    def record(self, agent: str, model: Optional[str], request: str, reply, latency: float):
+        """Append a finished LLM call to the recording."""
+        self.calls.append({"agent": agent, "model": model, "request": request, "reply": reply, "latency": round(latency, 4)})
+
+    def next_reply(self, agent: str, request: str):
+        """
+        Serve the next recorded reply.
+
+        Args:
+            agent: Name of the agent asking for a reply
+            request: Content hash of the request it is about to make
+
+        Returns:
+            The recorded reply (str or dict)
+        """
+        if self._position >= len(self.calls):
+            raise ReplayError(f"{agent} asked for call {self._position + 1} but only {len(self.calls)} were recorded")
+        call = self.calls[self._position]
+        if call["agent"] != agent:
+            raise ReplayError(f"Call {self._position + 1} was recorded for {call['agent']} but replayed for {agent}")
+        if call["request"] != request:
+            # The conversation has diverged from the recording (e.g. a prompt changed);
+            # keep serving in order so the run can still be profiled.
+            print(f"WARNING: replayed request {self._position + 1} for {agent} differs from the recording")
+        self._position += 1
+        return call["reply"]
+
+
+class RunArchive:
+    """
+    A per-run archive of recorded cases.
+
+    Args:
+        path: Path of the .jsonl.gz archive
+        mode: "record" to append cases, "replay" to load them
+    """
+
+    def __init__(self, path: str, mode: str = "record"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown archive mode {mode}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._cases: Dict[str, List[Dict[str, Any]]] = {}
+        if mode == "replay":
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._cases[entry["case"]] = entry["calls"]
+
+    def transport_for(self, key: str) -> CaseTransport:
+        """Create the transport for one case: empty when recording, preloaded when replaying."""
+        if self.mode == "record":
+            return CaseTransport()
+        if key not in self._cases:
+            raise ReplayError(f"Case {key} is not in {self.path}")
+        return CaseTransport(self._cases[key])
+
+    def save(self, key: str, calls: List[Dict[str, Any]]):
+        """Append a recorded case to the archive (thread-safe; gzip members can be concatenated)."""
+        if self.mode != "record":
+            return
+        line = json.dumps({"case": key, "calls": calls}, ensure_ascii=False) + "\n"
+        with self._lock:
+            with gzip.open(self.path, 'at', encoding='utf-8') as f:
+                f.write(line)
+
+    def keys(self) -> List[str]:
+        """Cases available for replay."""
+        return list(self._cases)
@@ -0,0 +1,164 @@
+"""
+Single-writer queue for finished cases.
+
+Concurrent runs must not have every worker open its own connection and commit per
+row: all of them then wait on SQLite's single write lock. run_cases and run_sharded
+instead hand each finished case to a ResultWriter. Its thread owns the only write
+connection, drains the queue and commits the writes in grouped transactions. A
+transaction ends once the flush interval has passed since its first write, or once
+it holds MAX_PENDING_CASES cases. The interval is FLUSH_INTERVAL, or the
+MULTI_MED_FLUSH_INTERVAL environment variable or --flush-interval on
+run_benchmark.py. The timer keeps running while the queue is idle, so a case
+finished just before a quiet period is committed on time instead of waiting for the
+next one.
+
+The queue holds at most MAX_QUEUED_WRITES cases. If the writer falls that far
+behind, submit() blocks until there is room (backpressure), so memory use stays
+bounded. Otherwise workers never wait on the database.
+
+close() writes everything still queued, commits it and checkpoints the WAL into the
+database file, so the run's results are on disk when it returns. Each case is
+written inside its own savepoint. A case whose write fails is rolled back on its
+own, is left out of the journal and reruns next time. The other cases in the same
+transaction are kept.
+"""
+
+import queue
+import threading
+import time
+from typing import Dict, Any, Callable, Optional
+
+from .storage import open_db, flush_interval, DEFAULT_DB_PATH, MAX_PENDING_CASES
+
+# Cases waiting for the writer before submit() blocks
+MAX_QUEUED_WRITES = 1000
+
+# Seconds between checks that the writer thread is still alive while submit() waits
+_PUT_POLL = 1.0
+
+_STOP = object()
+
+
+class ResultWriter:
+    """
+    Background thread that owns the write connection and commits queued writes in batches.
+
+    Args:
+        db_path: Path of the results database
+        interval: Seconds a transaction stays open after its first write; defaults to
+            flush_interval(), 0 commits every case
+        max_pending: Commit after this many cases even within the interval
+        max_queued: Queued cases at most before submit() blocks
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, interval: Optional[float] = None,
+                 max_pending: int = MAX_PENDING_CASES, max_queued: int = MAX_QUEUED_WRITES):
+        self.interval = flush_interval() if interval is None else interval
+        self.max_pending = max_pending
+        self.stats = {'written': 0, 'failed': 0, 'commits': 0, 'max_queued': 0, 'blocked_seconds': 0.0}
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_queued)
+        # Migrate here so a bad path or failed migration raises in the caller, not the thread
+        open_db(db_path).close()
+        self._db_path = db_path
+        self._thread = threading.Thread(target=self._run, name='result-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, write: Callable, *args, **kwargs):
+        """
+        Queue write(conn, *args, **kwargs) for the writer thread.
+
+        write must not commit; the writer commits it with the rest of its batch. Blocks
+        while the queue is full.
+        """
+        if self.error is not None:
+            raise RuntimeError(f"Result writer stopped: {self.error}") from self.error
+        item = (write, args, kwargs)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            started = time.perf_counter()
+            while True:
+                if not self._thread.is_alive():
+                    raise RuntimeError(f"Result writer stopped: {self.error}") from self.error
+                try:
+                    self._queue.put(item, timeout=_PUT_POLL)
+                    break
+                except queue.Full:
+                    pass
+            self.stats['blocked_seconds'] += time.perf_counter() - started
+        self.stats['max_queued'] = max(self.stats['max_queued'], self._queue.qsize())
+
+    def close(self) -> Dict[str, Any]:
+        """
+        Write and commit everything queued, checkpoint the WAL and stop the thread.
+
+        Returns:
+            The writer's stats: written, failed, commits, max_queued, blocked_seconds
+        """
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        if self.error is not None:
+            raise RuntimeError(f"Result writer stopped: {self.error}") from self.error
+        return self.stats
+
+    def _run(self):
+        conn = open_db(self._db_path)
+        pending = 0
+        deadline = 0.0
+        try:
+            while True:
+                timeout = max(0.0, deadline - time.monotonic()) if pending else None
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+                if item is _STOP:
+                    break
+                if item is not None:
+                    pending += self._write(conn, *item)
+                    if pending == 1:
+                        deadline = time.monotonic() + self.interval
+                if pending and (pending >= self.max_pending or time.monotonic() >= deadline):
+                    conn.commit()
+                    self.stats['commits'] += 1
+                    pending = 0
+            # Also ends a transaction left open by writes that were all rolled back
+            conn.commit()
+            if pending:
+                self.stats['commits'] += 1
+            # Move the committed pages into the database file and sync it
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        except Exception as e:
+            self.error = e
+            print(f"Result writer failed: {e}")
+        finally:
+            conn.close()
+
+    def _write(self, conn, write: Callable, args: tuple, kwargs: dict) -> int:
+        """Run one queued write in a savepoint; returns 1 if it was written, 0 if it was rolled back."""
+        if not conn.in_transaction:
+            # Releasing a savepoint outside a transaction would commit it on its own
+            conn.execute('BEGIN')
+        conn.execute('SAVEPOINT queued_write')
+        try:
+            write(conn, *args, **kwargs)
+        except Exception as e:
+            conn.execute('ROLLBACK TO queued_write')
+            conn.execute('RELEASE queued_write')
+            self.stats['failed'] += 1
+            print(f"Could not store a result, it will rerun next time: {e}")
+            return 0
+        conn.execute('RELEASE queued_write')
+        self.stats['written'] += 1
+        return 1
+
+
+def format_writer_stats(stats: Dict[str, Any]) -> str:
+    """One-line summary of a ResultWriter's stats for the end of a run."""
+    line = (f"Result writer: {stats['written']} cases in {stats['commits']} transactions, "
+            f"queue peaked at {stats['max_queued']}, workers waited {stats['blocked_seconds']:.1f}s")
+    if stats['failed']:
+        line += f", {stats['failed']} cases could not be stored"
+    return line
@@ -0,0 +1,148 @@
+"""
+Queries behind the /api/results endpoint of app.py.
+
+Results are served in rowid order with keyset pagination: a page is the first `limit`
+rows with rowid greater than `after`, and the response carries the rowid to pass as
+`after` for the next page. A page costs the same however deep into the table it is,
+unlike OFFSET, and a row inserted while a client pages through is never skipped or
+repeated. The NDJSON export walks the same pages internally and streams them row by
+row, so memory stays at one page whatever the size of the table.
+
+llm, presentation, notes and grader filters may be given several times (matching any of the
+values). Conversation logs are only read, and decompressed, when asked for with
+include=log.
+
+ETags come from results_version, a fingerprint of the results_changes counter, the
+highest rowid and the case_summary rows, so checking one reads a handful of rows
+whatever the size of the table. Triggers bump the counter on every insert, update and
+delete of case_results and conversation_logs, so an edited doctor_diagnosis, tag,
+unknown_investigations or log changes the ETag too. A client polling with
+If-None-Match gets 304 before any result is read.
+"""
+
+import hashlib
+from typing import Dict, Any, Iterator, List, Optional
+
+from .log_store import load_conversation_log
+
+# case_results columns returned for every result, in order; "id" is the rowid
+RESULT_FIELDS = ('llm', 'presentation', 'notes', 'tag', 'correct_diagnosis', 'doctor_diagnosis', 'is_correct',
+                 'total_investigation_cost', 'turn_count', 'total_tokens', 'unknown_investigations', 'grader')
+
+FILTER_FIELDS = ('llm', 'presentation', 'notes', 'grader')
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows fetched per query while streaming NDJSON
+EXPORT_CHUNK = 500
+
+# Tables whose every change bumps results_changes
+CHANGE_TABLES = ('case_results', 'conversation_logs')
+
+
+def init_results_changes(conn):
+    """Create the results_changes counter and the triggers on CHANGE_TABLES that bump it, if they do not exist."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS results_changes
+                    (id INTEGER PRIMARY KEY CHECK (id = 1),
+                     changes INTEGER NOT NULL)''')
+    conn.execute('INSERT OR IGNORE INTO results_changes (id, changes) VALUES (1, 0)')
+    for table in CHANGE_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_changes AFTER {event} ON {table}
+                             BEGIN UPDATE results_changes SET changes = changes + 1 WHERE id = 1; END''')
+    conn.commit()
+
+
+def results_version(conn) -> str:
+    """
+    Fingerprint of the stored results, cheap enough to compute on every request.
+
+    It covers the results_changes counter, which any write to case_results or
+    conversation_logs bumps, the highest rowid and every case_summary row. Databases
+    from before results_changes existed (opened read-only, so never migrated) only
+    notice inserts, deletes, grades and notes changes; those from before case_summary
+    existed fall back to a count over case_results.
+    """
+    digest = hashlib.sha1()
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'results_changes'").fetchone():
+        digest.update(repr(conn.execute('SELECT changes FROM results_changes').fetchone()).encode())
+    digest.update(repr(conn.execute('SELECT MAX(rowid) FROM case_results').fetchone()).encode())
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'case_summary'").fetchone():
+        rows = conn.execute('SELECT * FROM case_summary ORDER BY llm, presentation, notes')
+    else:
+        rows = conn.execute('SELECT COUNT(*), COUNT(is_correct), TOTAL(is_correct) FROM case_results')
+    for row in rows:
+        digest.update(repr(row).encode())
+    return digest.hexdigest()
+
+
+def results_etag(conn, query: str = '') -> str:
+    """
+    ETag for a results response: changes with results_version and differs per query string.
+
+    Args:
+        conn: Open sqlite3 connection
+        query: The request's query string, so different filters and pages get different tags
+    """
+    return hashlib.sha1(f"{results_version(conn)}|{query}".encode()).hexdigest()
+
+
+def _select_list(conn) -> str:
+    """RESULT_FIELDS as a select list; columns an older database lacks come back as NULL."""
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(case_results)')}
+    return ', '.join(name if name in existing else f'NULL AS {name}' for name in RESULT_FIELDS)
+
+
+def query_results(conn, filters: Optional[Dict[str, List[str]]] = None, after: int = 0,
+                  limit: int = DEFAULT_PAGE_SIZE, include_log: bool = False) -> List[Dict[str, Any]]:
+    """
+    One page of results.
+
+    Args:
+        conn: Open sqlite3 connection (read-only is enough)
+        filters: Allowed values per field of FILTER_FIELDS; a field without values is not filtered
+        after: Return rows with a rowid greater than this
+        limit: Rows per page
+        include_log: Add each result's decompressed conversation_log
+
+    Returns:
+        Results as dicts with "id" and RESULT_FIELDS (and "conversation_log")
+    """
+    conditions = ['rowid > ?']
+    params = [after]
+    for name in FILTER_FIELDS:
+        values = (filters or {}).get(name)
+        if values:
+            conditions.append(f"{name} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+    rows = conn.execute(f"SELECT rowid, {_select_list(conn)} FROM case_results WHERE {' AND '.join(conditions)} ORDER BY rowid LIMIT ?",
+                        params + [limit]).fetchall()
+    results = []
+    for row in rows:
+        result = dict(zip(('id',) + RESULT_FIELDS, row))
+        if result['is_correct'] is not None:
+            result['is_correct'] = bool(result['is_correct'])
+        if include_log:
+            result['conversation_log'] = load_conversation_log(conn, result['id'])
+        results.append(result)
+    return results
+
+
+def iter_results(conn, filters: Optional[Dict[str, List[str]]] = None, after: int = 0,
+                 limit: Optional[int] = None, include_log: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Every result after `after` (at most `limit`), fetched EXPORT_CHUNK rows at a time.
+
+    Each chunk is its own query, so no read transaction stays open while the client
+    consumes the stream.
+    """
+    sent = 0
+    while limit is None or sent < limit:
+        size = EXPORT_CHUNK if limit is None else min(EXPORT_CHUNK, limit - sent)
+        page = query_results(conn, filters, after, size, include_log)
+        yield from page
+        sent += len(page)
+        if len(page) < size:
+            return
+        after = page[-1]['id']
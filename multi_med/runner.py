@@ -0,0 +1,247 @@
+"""
+Concurrent case runner for the benchmark.
+
+`process_single_case` is a blocking call that spends almost all of its time waiting
+on LLM APIs, so cases are run in worker threads driven by an asyncio event loop.
+The number of cases in flight is capped globally and, optionally, per model.
+"""
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable
+
+from .llm_config import get_model_config
+from .agents import process_single_case
+from .journal import make_run_id, completed_keys, mark_completed
+from .storage import open_db, save_case_result, DEFAULT_DB_PATH
+from .result_writer import ResultWriter, format_writer_stats
+from .replay import case_key
+from .cost_retrieval import add_cost_savings, format_cost_savings
+from .case_prompts import add_case_prompt_savings, format_case_prompt_savings
+from .context import add_context_savings, format_context_savings
+from .diagnosis_match import add_grading_counts, format_grading_counts
+
+
+class RunStats:
+    """
+    Run totals of the per-case statistics that the runners print at the end of a run:
+    cost prompt and case prompt savings, context savings and grading paths.
+    """
+
+    def __init__(self):
+        self.cost_savings = {}
+        self.case_prompt_savings = {}
+        self.context_savings = {}
+        self.grading_counts = {}
+
+    def add(self, result: Dict[str, Any]):
+        """Add one finished case's statistics."""
+        add_cost_savings(self.cost_savings, result)
+        add_case_prompt_savings(self.case_prompt_savings, result)
+        add_context_savings(self.context_savings, result)
+        add_grading_counts(self.grading_counts, result)
+
+    def format(self) -> str:
+        """One line per statistic the run produced, or an empty string."""
+        lines = []
+        if self.cost_savings:
+            lines.append(format_cost_savings(self.cost_savings))
+        if self.case_prompt_savings:
+            lines.append(format_case_prompt_savings(self.case_prompt_savings))
+        if self.context_savings:
+            lines.append(format_context_savings(self.context_savings))
+        if self.grading_counts:
+            lines.append(format_grading_counts(self.grading_counts))
+        return '\n'.join(lines)
+
+
+def save_and_journal(conn, run_id: str, job: Dict[str, Any], result: Dict[str, Any], notes: str = '', commit: bool = True):
+    """Store a finished case and its journal entry in one transaction (left open with commit=False, e.g. for ResultWriter)."""
+    save_case_result(conn, job['doctor_model'], job['cases_file'], result, notes, commit=False, tag=job['test_case'].get('tag', ''))
+    mark_completed(conn, run_id, job['cases_file'], job['case_index'], job['doctor_model'])
+    if commit:
+        conn.commit()
+
+
+def pending_jobs(conn, run_id: str, jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop jobs that the journal says already finished in this run."""
+    done = completed_keys(conn, run_id)
+    remaining = [job for job in jobs if (job['cases_file'], job['case_index'], job['doctor_model']) not in done]
+    if len(remaining) < len(jobs):
+        print(f"Run {run_id}: skipping {len(jobs) - len(remaining)} cases already completed")
+    return remaining
+
+
+def load_jobs(cases_files: List[str], doctor_models: List[str], start: int = 0, end: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Expand case files and doctor models into a flat list of work units.
+
+    Args:
+        cases_files: Paths of the JSONL case files
+        doctor_models: Doctor models to run every case with
+        start: First case index to run in each file (inclusive)
+        end: Last case index to run in each file (exclusive), or None for all
+
+    Returns:
+        List of jobs, each a dict with cases_file, case_index, doctor_model and test_case
+    """
+    jobs = []
+    for cases_file in cases_files:
+        cases_file = os.path.normpath(cases_file)
+        with open(cases_file, 'r') as f:
+            lines = [line for line in f if line.strip()]
+        for case_index in range(max(0, start), min(len(lines), end if end is not None else len(lines))):
+            test_case = json.loads(lines[case_index])
+            for doctor_model in doctor_models:
+                jobs.append({
+                    'cases_file': cases_file,
+                    'case_index': case_index,
+                    'doctor_model': doctor_model,
+                    'test_case': test_case,
+                })
+    return jobs
+
+
+async def run_jobs(jobs: List[Dict[str, Any]],
+                   other_model: str,
+                   on_result: Callable[[Dict[str, Any], Dict[str, Any]], None],
+                   max_concurrent_cases: int = 8,
+                   model_limits: Optional[Dict[str, int]] = None,
+                   on_error: Optional[Callable[[Dict[str, Any], Exception], None]] = None,
+                   archive=None) -> Dict[str, int]:
+    """
+    Run jobs concurrently, calling on_result in the event loop thread as each case finishes.
+
+    Args:
+        jobs: Work units as returned by load_jobs
+        other_model: Model used for the Patient, MeasurementAssistant and Grader agents
+        on_result: Called with (job, result) for every finished case
+        max_concurrent_cases: Maximum number of cases in flight at once
+        model_limits: Optional maximum number of in-flight cases per model name.
+            A case counts against both its doctor model and other_model.
+        on_error: Optional callback for cases that raised an exception
+        archive: Optional RunArchive to record every case's LLM calls into, or replay them from
+
+    Returns:
+        Dictionary with counts of completed and failed cases
+    """
+    model_limits = model_limits or {}
+    case_semaphore = asyncio.Semaphore(max_concurrent_cases)
+    model_semaphores = {name: asyncio.Semaphore(limit) for name, limit in model_limits.items()}
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_concurrent_cases)
+    counts = {'completed': 0, 'failed': 0}
+
+    async def run_one(job):
+        # Always take model semaphores in sorted order so two cases can never deadlock.
+        # They are taken before a global slot, so a case waiting on a busy model does not
+        # hold a slot that a case for another model could use.
+        models = sorted({job['doctor_model'], other_model})
+        held = [model_semaphores[name] for name in models if name in model_semaphores]
+        acquired = []
+        try:
+            for semaphore in held:
+                await semaphore.acquire()
+                acquired.append(semaphore)
+            async with case_semaphore:
+                key = case_key(job['cases_file'], job['case_index'], job['doctor_model'])
+                transport = None
+                try:
+                    doctor_config = get_model_config(job['doctor_model'])
+                    other_config = get_model_config(other_model)
+                    transport = archive.transport_for(key) if archive else None
+                    result = await loop.run_in_executor(
+                        executor, process_single_case, job['test_case'], doctor_config, other_config, transport)
+                except Exception as e:
+                    counts['failed'] += 1
+                    if on_error:
+                        on_error(job, e)
+                    else:
+                        print(f"An error occurred while processing case {job['case_index']} of {job['cases_file']}: {e}")
+                    return
+                finally:
+                    # Failed cases are recorded too, so they can be replayed and debugged
+                    if transport is not None and not transport.replaying:
+                        archive.save(key, transport.calls)
+        finally:
+            for semaphore in reversed(acquired):
+                semaphore.release()
+        counts['completed'] += 1
+        on_result(job, result)
+
+    try:
+        await asyncio.gather(*(run_one(job) for job in jobs))
+    finally:
+        executor.shutdown(wait=True)
+    return counts
+
+
+def run_cases(cases_files: List[str],
+              doctor_models: List[str],
+              other_model: str,
+              notes: str = '',
+              max_concurrent_cases: int = 8,
+              model_limits: Optional[Dict[str, int]] = None,
+              start: int = 0,
+              end: Optional[int] = None,
+              db_path: str = DEFAULT_DB_PATH,
+              run_id: Optional[str] = None,
+              archive=None) -> Dict[str, int]:
+    """
+    Run every case in cases_files with every doctor model concurrently and store the results.
+
+    Finished cases are journaled under run_id, so running the same command again skips
+    them and only runs what is left.
+
+    Args:
+        cases_files: Paths of the JSONL case files
+        doctor_models: Doctor models to evaluate
+        other_model: Model used for the Patient, MeasurementAssistant and Grader agents
+        notes: Notes about this run, stored with each result
+        max_concurrent_cases: Maximum number of cases in flight at once
+        model_limits: Optional maximum number of in-flight cases per model name
+        start: First case index to run in each file (inclusive)
+        end: Last case index to run in each file (exclusive), or None for all
+        db_path: Path of the results database
+        run_id: Journal run id; defaults to one derived from the run's settings
+        archive: Optional RunArchive to record LLM calls into, or replay them from
+
+    Returns:
+        Dictionary with counts of completed and failed cases
+    """
+    run_id = run_id or make_run_id(cases_files, doctor_models, other_model, notes, start, end)
+    conn = open_db(db_path)
+    jobs = pending_jobs(conn, run_id, load_jobs(cases_files, doctor_models, start, end))
+    conn.close()
+    writer = ResultWriter(db_path)
+    started = time.time()
+    stats = RunStats()
+    print(f"Run {run_id}: running {len(jobs)} cases with up to {max_concurrent_cases} in flight")
+
+    def on_result(job, result):
+        # The writer thread stores the case, so the event loop never waits on SQLite
+        writer.submit(save_and_journal, run_id, job, result, notes, commit=False)
+        stats.add(result)
+        print(f"[{job['doctor_model']}] {os.path.basename(job['cases_file'])} case {job['case_index'] + 1}")
+        print(f"Correct diagnosis: {result['correct_diagnosis']}")
+        print(f"Doctor's diagnosis: {result['doctor_diagnosis']}")
+        print(f"Correct: {'Pending (deferred grading)' if result['is_correct'] is None else 'Yes' if result['is_correct'] else 'No'}")
+        print(f"Total investigation cost: ${result.get('total_investigation_cost', 0.0):.2f}")
+        if result.get('fuzzy_investigation_cost'):
+            print(f"Fuzzy matched investigations (not in the total): ${result['fuzzy_investigation_cost']:.2f}")
+        print("-" * 50)
+
+    try:
+        counts = asyncio.run(run_jobs(jobs, other_model, on_result, max_concurrent_cases, model_limits, archive=archive))
+    finally:
+        writer_stats = writer.close()
+
+    print(f"Finished {counts['completed']} cases ({counts['failed']} failed) in {time.time() - started:.1f}s")
+    print(format_writer_stats(writer_stats))
+    summary = stats.format()
+    if summary:
+        print(summary)
+    return counts
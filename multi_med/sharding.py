@@ -0,0 +1,172 @@
+"""
+Process-pool sharding of benchmark work units.
+
+Each (case file, case index, doctor model) work unit runs in a worker process that
+builds its own autogen agents, so tokenisation, regex parsing and JSON handling are
+spread over all cores. The coordinator process is the only one that touches the
+results database. It also applies the same limits as the threaded runner: at most
+max_concurrent_cases (and at most one per process) cases in flight, and at most
+model_limits[name] per model, so a sharded run cannot exceed a provider's rate limit
+that a threaded run respects.
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Optional
+
+from .llm_config import get_model_config
+from .agents import process_single_case
+from .runner import RunStats, save_and_journal, load_jobs, pending_jobs
+from .storage import open_db, DEFAULT_DB_PATH
+from .result_writer import ResultWriter, format_writer_stats
+from .journal import make_run_id
+from .replay import CaseTransport, ReplayError, case_key
+
+
+def _run_work_unit(job: Dict[str, Any], other_model: str, record: bool = False, replay_calls=None):
+    """
+    Run one work unit inside a worker process.
+
+    Args:
+        job: Work unit as returned by load_jobs
+        other_model: Model used for the Patient, MeasurementAssistant and Grader agents
+        record: Whether to record the case's LLM calls
+        replay_calls: Recorded calls to replay instead of calling the LLMs
+
+    Returns:
+        Tuple of (job key, result or None, error message or None, recorded calls or None).
+        Exceptions are returned as strings because autogen/client errors are not always picklable.
+    """
+    key = {k: job[k] for k in ('cases_file', 'case_index', 'doctor_model')}
+    transport = CaseTransport(replay_calls) if (record or replay_calls is not None) else None
+    recorded = transport.calls if record else None
+    try:
+        result = process_single_case(job['test_case'],
+                                     get_model_config(job['doctor_model']),
+                                     get_model_config(other_model),
+                                     transport)
+        return key, result, None, recorded
+    except Exception as e:
+        return key, None, f"{type(e).__name__}: {e}", recorded
+
+
+def run_sharded(cases_files: List[str],
+                doctor_models: List[str],
+                other_model: str,
+                notes: str = '',
+                processes: Optional[int] = None,
+                max_concurrent_cases: Optional[int] = None,
+                model_limits: Optional[Dict[str, int]] = None,
+                start: int = 0,
+                end: Optional[int] = None,
+                db_path: str = DEFAULT_DB_PATH,
+                run_id: Optional[str] = None,
+                archive=None) -> Dict[str, int]:
+    """
+    Spread work units over a process pool and merge the results into the database.
+
+    Args:
+        cases_files: Paths of the JSONL case files
+        doctor_models: Doctor models to evaluate
+        other_model: Model used for the Patient, MeasurementAssistant and Grader agents
+        notes: Notes about this run, stored with each result
+        processes: Number of worker processes (defaults to the CPU count)
+        max_concurrent_cases: Maximum number of cases in flight at once (defaults to processes)
+        model_limits: Optional maximum number of in-flight cases per model name.
+            A case counts against both its doctor model and other_model.
+        start: First case index to run in each file (inclusive)
+        end: Last case index to run in each file (exclusive), or None for all
+        db_path: Path of the results database
+        run_id: Journal run id; defaults to one derived from the run's settings
+        archive: Optional RunArchive to record LLM calls into, or replay them from.
+            Only the coordinator touches the archive; workers receive and return call lists.
+
+    Returns:
+        Dictionary with counts of completed and failed cases
+    """
+    run_id = run_id or make_run_id(cases_files, doctor_models, other_model, notes, start, end)
+    conn = open_db(db_path)
+    jobs = pending_jobs(conn, run_id, load_jobs(cases_files, doctor_models, start, end))
+    conn.close()
+    writer = ResultWriter(db_path)
+    processes = processes or os.cpu_count() or 1
+    max_in_flight = min(processes, max_concurrent_cases or processes)
+    model_limits = model_limits or {}
+    # Cases in flight per limited model
+    running = {name: 0 for name in model_limits}
+
+    # Per-presentation progress: presentation -> [done, failed, total]
+    progress = {}
+    for job in jobs:
+        progress.setdefault(os.path.basename(job['cases_file']), [0, 0, 0])[2] += 1
+
+    counts = {'completed': 0, 'failed': 0}
+    stats = RunStats()
+    started = time.time()
+    print(f"Run {run_id}: running {len(jobs)} cases across {processes} processes")
+
+    def limited_models(job):
+        return [name for name in {job['doctor_model'], other_model} if name in model_limits]
+
+    def finish(job, result, error):
+        presentation = os.path.basename(job['cases_file'])
+        if error is None:
+            writer.submit(save_and_journal, run_id, job, result, notes, commit=False)
+            stats.add(result)
+            counts['completed'] += 1
+        else:
+            print(f"An error occurred while processing case {job['case_index']} of {presentation} with {job['doctor_model']}: {error}")
+            counts['failed'] += 1
+            progress[presentation][1] += 1
+        progress[presentation][0] += 1
+        done, failed, total = progress[presentation]
+        print(f"[{presentation}] {done}/{total} done ({failed} failed)")
+
+    try:
+        # spawn gives every worker a clean interpreter regardless of platform
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {}
+            waiting = jobs
+            while waiting or futures:
+                # Start every waiting case that fits within the limits, in job order
+                still_waiting = []
+                for job in waiting:
+                    models = limited_models(job)
+                    if len(futures) >= max_in_flight or any(running[name] >= model_limits[name] for name in models):
+                        still_waiting.append(job)
+                        continue
+                    key = case_key(job['cases_file'], job['case_index'], job['doctor_model'])
+                    replaying = archive is not None and archive.mode == 'replay'
+                    record = archive is not None and not replaying
+                    try:
+                        replay_calls = archive.transport_for(key).calls if replaying else None
+                    except ReplayError as e:
+                        # Only this case cannot run; the rest of the replay goes on
+                        finish(job, None, str(e))
+                        continue
+                    for name in models:
+                        running[name] += 1
+                    futures[pool.submit(_run_work_unit, job, other_model, record, replay_calls)] = job
+                waiting = still_waiting
+                if not futures:
+                    break
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = futures.pop(future)
+                    for name in limited_models(job):
+                        running[name] -= 1
+                    key, result, error, recorded = future.result()
+                    if recorded is not None:
+                        archive.save(case_key(key['cases_file'], key['case_index'], key['doctor_model']), recorded)
+                    finish(job, result, error)
+    finally:
+        writer_stats = writer.close()
+
+    print(f"Finished {counts['completed']} cases ({counts['failed']} failed) in {time.time() - started:.1f}s")
+    print(format_writer_stats(writer_stats))
+    summary = stats.format()
+    if summary:
+        print(summary)
+    return counts
@@ -0,0 +1,247 @@
+"""
+Results database: connections, schema migrations and batched commits.
+
+Every entry point (run_benchmark.py, main.py, main1.py, multi_med/main.py, the
+backfills) opens medical_cases.db through open_db, which
+
+- enables WAL, so readers such as the Flask app see committed results while a run is
+  writing, and waits up to BUSY_TIMEOUT seconds for a lock instead of failing with
+  "database is locked";
+- brings the schema up to date. The schema version is kept in PRAGMA user_version and
+  each entry of MIGRATIONS moves it up by one. Databases written by the older entry
+  points get the columns they lack (main.py had notes/unknown_investigations,
+  multi_med/main.py had tag). Every migration is idempotent, so two processes opening
+  an old database at the same time both succeed.
+
+Runs hand finished cases to a ResultWriter (result_writer.py), whose thread commits
+them in batches: a case and its journal entry are still written together, but the
+transaction is committed every FLUSH_INTERVAL seconds or MAX_PENDING_CASES cases
+rather than once per case. A crash loses at most the uncommitted cases, which the
+journal then reruns. Set the interval with the MULTI_MED_FLUSH_INTERVAL environment
+variable or --flush-interval on run_benchmark.py (0 commits every case).
+BatchedCommits does the same for a single-threaded writer that owns its connection.
+"""
+
+import os
+import sqlite3
+import time
+from typing import Dict, Any, Optional
+
+from .journal import init_journal
+from .tokens import init_turn_tokens, save_turn_tokens
+from .turns import init_turns, save_turns
+from .batch_grading import init_grading_queue, queue_grading
+from .log_store import migrate_conversation_logs, save_conversation_log
+from .summary import init_case_summary, rebuild_case_summary, backfill_case_counts, case_counts
+from .results_api import init_results_changes
+
+DEFAULT_DB_PATH = 'medical_cases.db'
+
+# Seconds a connection waits for another writer's lock before giving up
+BUSY_TIMEOUT = 30
+
+# Default seconds between commits of a run's results, and cases per commit at most
+FLUSH_INTERVAL = 2.0
+MAX_PENDING_CASES = 100
+
+# case_results columns in the order of the current schema, with their declarations
+CASE_RESULT_COLUMNS = (
+    ('llm', 'TEXT'),
+    ('presentation', 'TEXT'),
+    ('correct_diagnosis', 'TEXT'),
+    ('doctor_diagnosis', 'TEXT'),
+    ('is_correct', 'INTEGER'),
+    ('conversation_log', 'TEXT'),
+    ('total_investigation_cost', 'REAL DEFAULT 0.0'),
+    ('notes', "TEXT DEFAULT ''"),
+    ('unknown_investigations', "TEXT DEFAULT ''"),
+    ('tag', "TEXT DEFAULT ''"),
+    ('turn_count', 'INTEGER'),
+    ('total_tokens', 'INTEGER'),
+    ('grader', 'TEXT'),
+)
+
+
+def _create_case_results(conn):
+    columns = ",\n".join(f"{name} {declaration}" for name, declaration in CASE_RESULT_COLUMNS)
+    conn.execute(f'CREATE TABLE IF NOT EXISTS case_results\n({columns})')
+    # Databases created by the older entry points lack some of the columns
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(case_results)')}
+    for name, declaration in CASE_RESULT_COLUMNS:
+        if name not in existing:
+            conn.execute(f'ALTER TABLE case_results ADD COLUMN {name} {declaration}')
+
+
+def _create_companion_tables(conn):
+    init_journal(conn)
+    init_turn_tokens(conn)
+    init_turns(conn)
+    init_grading_queue(conn)
+
+
+def _create_indexes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS case_results_llm ON case_results (llm, presentation, notes)')
+    conn.execute('CREATE INDEX IF NOT EXISTS case_results_notes ON case_results (notes)')
+
+
+def _create_case_summary(conn):
+    # Adds turn_count and total_tokens, and fills them for rows that have turns or token counts
+    _create_case_results(conn)
+    backfill_case_counts(conn)
+    init_case_summary(conn)
+    rebuild_case_summary(conn)
+
+
+# (description, function) per schema version, starting at version 1. Append new
+# migrations at the end; never edit or reorder the ones already released.
+MIGRATIONS = (
+    ('case_results with the columns of every entry point', _create_case_results),
+    ('run_journal, turn_tokens, turns and grading_queue', _create_companion_tables),
+    ('indexes on case_results (llm, presentation, notes) and (notes)', _create_indexes),
+    ('conversation logs compressed into conversation_logs, then VACUUM', migrate_conversation_logs),
+    ('case_summary scores per (llm, presentation, notes), kept by triggers', _create_case_summary),
+    ('results_changes counter for /api/results ETags, kept by triggers', init_results_changes),
+    ('case_results.grader, the path that graded each case', _create_case_results),
+)
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def connect(db_path: str = DEFAULT_DB_PATH, readonly: bool = False) -> sqlite3.Connection:
+    """
+    Open a connection to the results database in WAL mode, without migrating it.
+
+    Args:
+        db_path: Path of the results database
+        readonly: Open read-only (for readers such as the Flask app)
+    """
+    if readonly:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=BUSY_TIMEOUT)
+    else:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+        # Persistent for the database file; readers then never block the writer or each other
+        conn.execute('PRAGMA journal_mode=WAL')
+        # With WAL, NORMAL only risks the last commits on power loss, never corruption
+        conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def schema_version(conn) -> int:
+    """The schema version of an open database (0 for a new or pre-migration database)."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn) -> int:
+    """
+    Apply the migrations the database has not had yet.
+
+    Returns:
+        The schema version the database was at before
+    """
+    version = schema_version(conn)
+    for number, (description, apply) in enumerate(MIGRATIONS, 1):
+        if number > version:
+            apply(conn)
+            conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+            print(f"Migrated results database to schema version {number}: {description}")
+    return version
+
+
+def open_db(db_path: str = DEFAULT_DB_PATH) -> sqlite3.Connection:
+    """Open the results database for writing, migrated to the current schema."""
+    conn = connect(db_path)
+    migrate(conn)
+    return conn
+
+
+def flush_interval() -> float:
+    """The configured seconds between commits (FLUSH_INTERVAL unless MULTI_MED_FLUSH_INTERVAL says otherwise)."""
+    value = os.getenv('MULTI_MED_FLUSH_INTERVAL', str(FLUSH_INTERVAL))
+    try:
+        interval = float(value)
+    except ValueError:
+        interval = -1
+    if interval < 0:
+        raise ValueError(f"Invalid MULTI_MED_FLUSH_INTERVAL {value}, expected a number of seconds >= 0")
+    return interval
+
+
+class BatchedCommits:
+    """
+    Groups the writes of several finished cases into one transaction.
+
+    Call written() after each case's writes and flush() when the run ends. Commits
+    happen on a write, so a result written during a pause is committed with the next
+    one, or by flush().
+
+    Args:
+        conn: Open sqlite3 connection the cases are written to
+        interval: Seconds between commits; defaults to flush_interval(), 0 commits every case
+        max_pending: Commit after this many cases even within the interval
+    """
+
+    def __init__(self, conn, interval: Optional[float] = None, max_pending: int = MAX_PENDING_CASES):
+        self.conn = conn
+        self.interval = flush_interval() if interval is None else interval
+        self.max_pending = max_pending
+        self.pending = 0
+        self.commits = 0
+        self._last_commit = time.monotonic()
+
+    def written(self):
+        """Record one case's writes and commit if the interval has passed or enough cases are pending."""
+        self.pending += 1
+        if self.pending >= self.max_pending or time.monotonic() - self._last_commit >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """Commit any pending cases."""
+        if self.pending:
+            self.conn.commit()
+            self.commits += 1
+            self.pending = 0
+        self._last_commit = time.monotonic()
+
+
+def save_case_result(conn, doctor_model: str, cases_file: str, result: Dict[str, Any], notes: str = '',
+                     commit: bool = True, tag: str = ''):
+    """
+    Store a finished case in case_results (whose triggers update case_summary), its
+    compressed log in conversation_logs, its per-turn token counts in turn_tokens and its
+    turns in turns. grader records how the case was graded (result['grader']). A case whose
+    grading was deferred is stored with is_correct NULL and queued in grading_queue.
+
+    Args:
+        conn: Open sqlite3 connection
+        doctor_model: Name of the doctor model that ran the case
+        cases_file: Path of the JSONL file the case came from
+        result: Dictionary returned by process_single_case
+        notes: Notes about this run
+        commit: Whether to commit immediately; pass False to commit together with a journal entry
+        tag: The case's tag, if its case file has one
+    """
+    counts = case_counts(result)
+    cursor = conn.execute('''INSERT INTO case_results
+                    (llm, presentation, correct_diagnosis, doctor_diagnosis, is_correct, conversation_log, total_investigation_cost, notes, unknown_investigations, tag, turn_count, total_tokens, grader)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                 (doctor_model,
+                  os.path.basename(cases_file),
+                  result['correct_diagnosis'],
+                  result['doctor_diagnosis'],
+                  None if result['is_correct'] is None else 1 if result['is_correct'] else 0,
+                  None,
+                  result.get('total_investigation_cost', 0.0),
+                  notes,
+                  ','.join(result.get('unknown_investigations') or []),
+                  tag,
+                  counts['turn_count'],
+                  counts['total_tokens'],
+                  result.get('grader')))
+    save_conversation_log(conn, cursor.lastrowid, result['conversation_log'])
+    save_turn_tokens(conn, cursor.lastrowid, result.get('turn_tokens') or [])
+    save_turns(conn, cursor.lastrowid, result.get('turns') or [])
+    if result.get('grading_request'):
+        queue_grading(conn, cursor.lastrowid, result['grading_request'])
+    if commit:
+        conn.commit()
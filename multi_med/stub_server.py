@@ -0,0 +1,231 @@
+"""
+Local OpenAI-compatible stand-in LLM server for load testing.
+
+Serves POST /v1/chat/completions (plain and streamed) with scripted behaviour for each
+agent, recognised from its system message:
+    Doctor               asks N questions, requests an examination and a test, then
+                         emits "DIAGNOSIS READY: ..."
+    Patient              answers briefly
+    MeasurementAssistant returns findings, plus "COST: $x" for test requests
+    Grader               answers YES or NO, then "TERMINATE"
+    BatchGrader          answers "<n>: YES" or "<n>: NO" for each numbered pair
+
+Latency, streaming speed and error rate are configurable, so the batch runners and the
+/run SSE stream of app.py can be driven at hundreds of concurrent cases with no network.
+Point a model at it with the "local-stub" entry in llm_config.py.
+
+Usage:
+    python -m multi_med.stub_server --port 8001 --latency-dist lognormal --latency-mean 0.8 \\
+        --tokens-per-second 60 --error-rate 0.01 --doctor-questions 6
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+
+# Server settings, filled in from the command line by main()
+SETTINGS = {
+    "latency_dist": "fixed",
+    "latency_mean": 0.0,
+    "latency_sigma": 0.5,
+    "tokens_per_second": 0.0,
+    "error_rate": 0.0,
+    "doctor_questions": 5,
+    "grader_yes_rate": 0.5,
+    "seed": None,
+}
+
+_stats = {"requests": 0, "errors": 0, "completion_tokens": 0}
+_stats_lock = threading.Lock()
+
+QUESTIONS = [
+    "When did your symptoms start?",
+    "Can you describe the pain?",
+    "Does anything make it better or worse?",
+    "Have you had anything like this before?",
+    "Do you take any regular medications?",
+    "Is there any relevant family history?",
+    "Have you noticed any fever or weight loss?",
+    "Do you smoke or drink alcohol?",
+]
+
+
+def detect_role(system_message: str) -> str:
+    """Work out which agent is calling from its system message."""
+    text = system_message or ""
+    if "The correct diagnosis is" in text:
+        return "Grader"
+    if "numbered pairs of diagnoses" in text:
+        return "BatchGrader"
+    if "clinical assistant" in text:
+        return "MeasurementAssistant"
+    if "Act as a patient" in text:
+        return "Patient"
+    if "Dr Agent" in text or "Dr. Agent" in text:
+        return "Doctor"
+    return "Unknown"
+
+
+def scripted_reply(role: str, messages: list) -> str:
+    """Produce the scripted reply for a role given the conversation so far."""
+    last = messages[-1].get("content", "") if messages else ""
+    if role == "Doctor":
+        asked = sum(1 for m in messages if m.get("role") == "assistant")
+        questions = SETTINGS["doctor_questions"]
+        if asked < questions:
+            return QUESTIONS[asked % len(QUESTIONS)]
+        if asked == questions:
+            return "REQUEST EXAMINATION FINDING: vital signs"
+        if asked == questions + 1:
+            return "REQUEST TESTS: Full Blood Count"
+        return "DIAGNOSIS READY: Tension-type headache\nReasoning: the history and normal investigations are consistent with this."
+    if role == "Patient":
+        return "It started a few days ago and it has been getting a bit worse."
+    if role == "MeasurementAssistant":
+        if "REQUEST TESTS:" in last:
+            return f"All values within normal limits. COST: ${random.choice([9.70, 16.95, 17.70, 42.50]):.2f}"
+        return "Findings are within normal limits."
+    if role == "Grader":
+        verdict = "YES" if random.random() < SETTINGS["grader_yes_rate"] else "NO"
+        return f"{verdict}. The doctor's diagnosis was compared with the correct diagnosis.\nTERMINATE"
+    if role == "BatchGrader":
+        pairs = len(re.findall(r'^\d+\. Correct diagnosis:', last, re.MULTILINE))
+        return "\n".join(f"{number}: {'YES' if random.random() < SETTINGS['grader_yes_rate'] else 'NO'}. Compared with the correct diagnosis."
+                         for number in range(1, pairs + 1))
+    return "OK."
+
+
+def sample_latency() -> float:
+    """Sample the time to first token from the configured distribution."""
+    mean = SETTINGS["latency_mean"]
+    if mean <= 0:
+        return 0.0
+    dist = SETTINGS["latency_dist"]
+    if dist == "uniform":
+        return random.uniform(0, 2 * mean)
+    if dist == "exponential":
+        return random.expovariate(1 / mean)
+    if dist == "lognormal":
+        # Parameterised so that the distribution mean equals latency_mean
+        sigma = SETTINGS["latency_sigma"]
+        return random.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+    return mean
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+@app.route('/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    body = request.get_json(force=True)
+    messages = body.get("messages", [])
+    model = body.get("model", "stub-model")
+    system_message = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    conversation = [m for m in messages if m.get("role") != "system"]
+
+    with _stats_lock:
+        _stats["requests"] += 1
+
+    time.sleep(sample_latency())
+
+    if random.random() < SETTINGS["error_rate"]:
+        with _stats_lock:
+            _stats["errors"] += 1
+        status = random.choice([429, 500, 503])
+        return jsonify({"error": {"message": f"Stub error {status}", "type": "stub_error", "code": status}}), status
+
+    content = scripted_reply(detect_role(system_message), conversation)
+    prompt_tokens = sum(count_tokens(m.get("content") or "") for m in messages)
+    completion_tokens = count_tokens(content)
+    with _stats_lock:
+        _stats["completion_tokens"] += completion_tokens
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    if not body.get("stream"):
+        if SETTINGS["tokens_per_second"] > 0:
+            time.sleep(completion_tokens / SETTINGS["tokens_per_second"])
+        return jsonify({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def stream():
+        # Split into word-sized pieces and pace them at tokens_per_second
+        pieces = re.findall(r'\S+\s*', content)
+        delay = 1 / SETTINGS["tokens_per_second"] if SETTINGS["tokens_per_second"] > 0 else 0
+        for i, piece in enumerate(pieces):
+            delta = {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            if delay:
+                time.sleep(delay * max(1, count_tokens(piece)))
+        final = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return Response(stream(), mimetype='text/event-stream')
+
+
+@app.route('/v1/models')
+def list_models():
+    return jsonify({"object": "list", "data": [{"id": "stub-model", "object": "model", "owned_by": "multi-med"}]})
+
+
+@app.route('/stats')
+def stats():
+    """Request, error and token counters, for checking throughput during a load test."""
+    with _stats_lock:
+        return jsonify(dict(_stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local OpenAI-compatible stand-in LLM server')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency-dist', choices=['fixed', 'uniform', 'exponential', 'lognormal'], default='fixed', help='Distribution of time to first token')
+    parser.add_argument('--latency-mean', type=float, default=0.0, help='Mean time to first token in seconds')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='Shape parameter for the lognormal distribution')
+    parser.add_argument('--tokens-per-second', type=float, default=0.0, help='Generation speed (0 = instant)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with a 429/500/503')
+    parser.add_argument('--doctor-questions', type=int, default=5, help='Questions the Doctor asks before examining, testing and diagnosing')
+    parser.add_argument('--grader-yes-rate', type=float, default=0.5, help='Fraction of diagnoses the Grader marks correct')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible runs')
+    args = parser.parse_args()
+
+    SETTINGS.update({
+        "latency_dist": args.latency_dist,
+        "latency_mean": args.latency_mean,
+        "latency_sigma": args.latency_sigma,
+        "tokens_per_second": args.tokens_per_second,
+        "error_rate": args.error_rate,
+        "doctor_questions": args.doctor_questions,
+        "grader_yes_rate": args.grader_yes_rate,
+        "seed": args.seed,
+    })
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
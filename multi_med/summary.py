@@ -0,0 +1,129 @@
+"""
+Incrementally maintained scores per (llm, presentation, notes).
+
+Accuracy reports used to scan case_results with GROUP BY llm, presentation. The
+case_summary table instead keeps running sums for each (llm, presentation, notes):
+cases, graded cases, correct cases, investigation cost, turns and tokens. Triggers on
+case_results keep it current inside the same transaction as the row they follow:
+
+- an insert adds the new row's values;
+- a delete subtracts them;
+- an update subtracts the old values and adds the new ones. Deferred grading filling in
+  is_correct, a turns backfill setting turn_count, or an edited notes value moving a
+  row to another group are all updates.
+
+Report queries read the case_scores view, which divides the sums into means:
+
+    SELECT llm, presentation, cases, accuracy, mean_cost, mean_turns, mean_tokens
+    FROM case_scores WHERE notes = ''
+
+They touch one row per (llm, presentation, notes) however many runs are stored. A
+missing llm, presentation or notes is grouped as ''. Accuracy is over graded cases
+only, so cases still queued for deferred grading do not count as wrong. The turn and
+token means are over the cases that have those numbers: case_results.turn_count and
+total_tokens are NULL for rows stored before turns and token counting existed.
+
+rebuild_case_summary recomputes the table from case_results, for example after rows
+were changed with the triggers dropped. `python benchmarks/summary_bench.py` checks
+the summary against a full GROUP BY and times both.
+"""
+
+from typing import Dict, Any, List, Optional
+
+# Summed columns of case_summary and the expression for a case_results row (NEW or OLD) that each adds
+SUMMARY_SUMS = (
+    ('cases', '1'),
+    ('graded', '{row}.is_correct IS NOT NULL'),
+    ('correct', 'COALESCE({row}.is_correct, 0)'),
+    ('cost_sum', 'COALESCE({row}.total_investigation_cost, 0)'),
+    ('turn_cases', '{row}.turn_count IS NOT NULL'),
+    ('turn_sum', 'COALESCE({row}.turn_count, 0)'),
+    ('token_cases', '{row}.total_tokens IS NOT NULL'),
+    ('token_sum', 'COALESCE({row}.total_tokens, 0)'),
+)
+
+SUMMARY_KEY = ('llm', 'presentation', 'notes')
+
+# case_results columns the summary depends on; updates of other columns do not fire the trigger
+SUMMARY_SOURCE_COLUMNS = ('llm', 'presentation', 'notes', 'is_correct', 'total_investigation_cost', 'turn_count', 'total_tokens')
+
+
+def _apply_row(row: str, sign: int) -> str:
+    """Upsert adding (sign 1) or subtracting (sign -1) one case_results row to its summary row."""
+    columns = SUMMARY_KEY + tuple(name for name, _ in SUMMARY_SUMS)
+    key = [f"COALESCE({row}.{name}, '')" for name in SUMMARY_KEY]
+    sums = [f"{sign} * ({expression.format(row=row)})" for _, expression in SUMMARY_SUMS]
+    updates = ', '.join(f"{name} = {name} + excluded.{name}" for name, _ in SUMMARY_SUMS)
+    return (f"INSERT INTO case_summary ({', '.join(columns)}) VALUES ({', '.join(key + sums)}) "
+            f"ON CONFLICT ({', '.join(SUMMARY_KEY)}) DO UPDATE SET {updates};")
+
+
+def init_case_summary(conn):
+    """Create the case_summary table, its triggers on case_results and the case_scores view if they do not exist."""
+    sums = ',\n'.join(f"{name} {'REAL' if name == 'cost_sum' else 'INTEGER'} NOT NULL DEFAULT 0" for name, _ in SUMMARY_SUMS)
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS case_summary
+                     (llm TEXT NOT NULL,
+                      presentation TEXT NOT NULL,
+                      notes TEXT NOT NULL,
+                      {sums},
+                      PRIMARY KEY (llm, presentation, notes)) WITHOUT ROWID''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS case_summary_insert AFTER INSERT ON case_results
+                     BEGIN {_apply_row('NEW', 1)} END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS case_summary_delete AFTER DELETE ON case_results
+                     BEGIN {_apply_row('OLD', -1)} END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS case_summary_update AFTER UPDATE OF {', '.join(SUMMARY_SOURCE_COLUMNS)} ON case_results
+                     BEGIN {_apply_row('OLD', -1)} {_apply_row('NEW', 1)} END''')
+    conn.execute('''CREATE VIEW IF NOT EXISTS case_scores AS
+                    SELECT llm, presentation, notes, cases, graded, correct,
+                           CASE WHEN graded > 0 THEN 1.0 * correct / graded END AS accuracy,
+                           CASE WHEN cases > 0 THEN cost_sum / cases END AS mean_cost,
+                           CASE WHEN turn_cases > 0 THEN 1.0 * turn_sum / turn_cases END AS mean_turns,
+                           CASE WHEN token_cases > 0 THEN 1.0 * token_sum / token_cases END AS mean_tokens
+                    FROM case_summary WHERE cases > 0''')
+    conn.commit()
+
+
+def rebuild_case_summary(conn):
+    """Recompute case_summary from case_results. Does not commit."""
+    columns = SUMMARY_KEY + tuple(name for name, _ in SUMMARY_SUMS)
+    key = [f"COALESCE({name}, '')" for name in SUMMARY_KEY]
+    sums = [f"SUM({expression.format(row='case_results')})" for _, expression in SUMMARY_SUMS]
+    conn.execute('DELETE FROM case_summary')
+    conn.execute(f'''INSERT INTO case_summary ({', '.join(columns)})
+                     SELECT {', '.join(key + sums)} FROM case_results GROUP BY {', '.join(key)}''')
+
+
+def case_counts(result: Dict[str, Any]) -> Dict[str, Optional[int]]:
+    """
+    The turn_count and total_tokens stored on a finished case's case_results row.
+
+    Args:
+        result: Dictionary returned by process_single_case
+    """
+    turns = result.get('turns')
+    turn_tokens = result.get('turn_tokens')
+    return {'turn_count': len(turns) if turns else None,
+            'total_tokens': sum(t['input_tokens'] + t['output_tokens'] for t in turn_tokens) if turn_tokens else None}
+
+
+def backfill_case_counts(conn):
+    """Fill turn_count and total_tokens on case_results rows from their turns and turn_tokens rows. Does not commit."""
+    conn.execute('''UPDATE case_results SET turn_count = (SELECT COUNT(*) FROM turns WHERE turns.result_id = case_results.rowid)
+                    WHERE turn_count IS NULL AND EXISTS (SELECT 1 FROM turns WHERE turns.result_id = case_results.rowid)''')
+    conn.execute('''UPDATE case_results SET total_tokens = (SELECT SUM(input_tokens + output_tokens) FROM turn_tokens WHERE turn_tokens.case_id = case_results.rowid)
+                    WHERE total_tokens IS NULL AND EXISTS (SELECT 1 FROM turn_tokens WHERE turn_tokens.case_id = case_results.rowid)''')
+
+
+def case_scores(conn, llm: Optional[str] = None, presentation: Optional[str] = None, notes: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Scores per (llm, presentation, notes) from case_scores, optionally filtered.
+
+    Returns:
+        One dict per group with the columns of case_scores, ordered by llm and presentation
+    """
+    filters = [(name, value) for name, value in (('llm', llm), ('presentation', presentation), ('notes', notes)) if value is not None]
+    where = ' AND '.join(f'{name} = ?' for name, _ in filters)
+    cursor = conn.execute(f"SELECT * FROM case_scores {'WHERE ' + where if where else ''} ORDER BY llm, presentation, notes",
+                          tuple(value for _, value in filters))
+    names = [column[0] for column in cursor.description]
+    return [dict(zip(names, row)) for row in cursor]
@@ -0,0 +1,145 @@
+"""
+Per-turn token accounting for consultations.
+
+Every reply is recorded with its input and output token counts. Provider-reported usage
+is used when the reply came from the provider; otherwise (cached or replayed replies,
+providers that do not report usage) the counts come from tiktoken. Encoders are loaded
+once per model, and each message is encoded at most once per encoding: input counts are
+read from running prefix sums over the conversation, so a turn only encodes its new
+message. The counts are stored in the turn_tokens table, one row per reply, keyed on
+the rowid of the case's case_results row.
+"""
+
+import functools
+from typing import Dict, Any, List, Optional
+
+import tiktoken
+
+# Encoding used for models tiktoken does not know (Gemini, DeepSeek, local models)
+FALLBACK_ENCODING = 'cl100k_base'
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoder(model: Optional[str]):
+    """
+    Load the tiktoken encoder for a model, once per process.
+
+    Returns:
+        The encoder, or None if no encoding can be loaded (e.g. offline without a tiktoken cache)
+    """
+    try:
+        return tiktoken.encoding_for_model(model or '')
+    except Exception:
+        pass
+    try:
+        return tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as e:
+        print(f"WARNING: no tiktoken encoding available for {model} ({e}); estimating tokens from length")
+        return None
+
+
+def count_tokens(encoder, text: str) -> int:
+    """Count the tokens of a text, or estimate them at four characters per token without an encoder."""
+    if not text:
+        return 0
+    if encoder is None:
+        return len(text) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+class TurnTokenCounter:
+    """
+    Token counts for each reply of one consultation.
+
+    Attributes:
+        turns: One {"turn", "agent", "model", "input_tokens", "output_tokens", "source"} dict
+            per reply, where source is "provider", "tiktoken" or "estimate"
+    """
+
+    def __init__(self):
+        self.turns: List[Dict[str, Any]] = []
+        # Per encoding: prefix sums of the message token counts, prefix[i] = tokens of messages[:i]
+        self._prefix: Dict[str, List[int]] = {}
+        # Keyed on (encoding, system message), since a system message may change between turns
+        self._system_tokens: Dict[tuple, int] = {}
+
+    def _prefix_sums(self, encoder, messages: List[Dict[str, str]], length: int) -> List[int]:
+        prefix = self._prefix.setdefault(encoder.name if encoder else 'estimate', [0])
+        for message in messages[len(prefix) - 1:length]:
+            prefix.append(prefix[-1] + count_tokens(encoder, message['content']))
+        return prefix
+
+    def record(self, agent, messages: List[Dict[str, str]], view: Optional[List[int]] = None) -> Dict[str, Any]:
+        """
+        Record the latest reply of a consultation.
+
+        Args:
+            agent: The MedicalAgent that produced the reply
+            messages: The consultation messages, ending with the reply
+            view: Indices of the messages the agent was sent (Consultation.sent_view), or
+                None if it was sent all of them
+
+        Returns:
+            The recorded turn; with a view it also has "omitted_tokens", the tokens of the
+            earlier messages the agent was not sent
+        """
+        model = agent.model_name()
+        usage = getattr(agent, 'last_usage', None)
+        omitted_tokens = None
+        if usage is None or view is not None:
+            encoder = get_encoder(model)
+            prefix = self._prefix_sums(encoder, messages, len(messages))
+            if view is not None:
+                sent = sum(prefix[i + 1] - prefix[i] for i in view)
+                omitted_tokens = prefix[len(messages) - 1] - sent
+                if omitted_tokens < 0:
+                    raise ValueError(f"{agent.name} was sent {sent} tokens, more than the {prefix[len(messages) - 1]} of the whole conversation")
+        if usage:
+            input_tokens, output_tokens, source = usage['prompt_tokens'], usage['completion_tokens'], 'provider'
+        else:
+            key = (encoder.name if encoder else 'estimate', agent.system_message)
+            if key not in self._system_tokens:
+                self._system_tokens[key] = count_tokens(encoder, agent.system_message)
+            input_tokens = self._system_tokens[key] + prefix[len(messages) - 1] - (omitted_tokens or 0)
+            output_tokens = prefix[len(messages)] - prefix[len(messages) - 1]
+            source = 'tiktoken' if encoder else 'estimate'
+
+        turn = {
+            'turn': len(messages) - 1,
+            'agent': agent.name,
+            'model': model,
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'source': source,
+        }
+        if omitted_tokens is not None:
+            turn['omitted_tokens'] = omitted_tokens
+        self.turns.append(turn)
+        return turn
+
+
+def init_turn_tokens(conn):
+    """Create the turn_tokens table if it does not exist."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS turn_tokens
+                    (case_id INTEGER,
+                     turn INTEGER,
+                     agent TEXT,
+                     model TEXT,
+                     input_tokens INTEGER,
+                     output_tokens INTEGER,
+                     source TEXT,
+                     PRIMARY KEY (case_id, turn)) WITHOUT ROWID''')
+    conn.commit()
+
+
+def save_turn_tokens(conn, case_id: int, turns: List[Dict[str, Any]]):
+    """
+    Store the per-turn token counts of a case. Does not commit; the caller commits together with the result row.
+
+    Args:
+        conn: Open sqlite3 connection
+        case_id: rowid of the case's case_results row
+        turns: TurnTokenCounter.turns
+    """
+    conn.executemany('INSERT OR REPLACE INTO turn_tokens (case_id, turn, agent, model, input_tokens, output_tokens, source) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     [(case_id, t['turn'], t['agent'], t['model'], t['input_tokens'], t['output_tokens'], t['source']) for t in turns])
@@ -0,0 +1,149 @@
+"""
+Turn-level storage of consultations.
+
+case_results.conversation_log keeps each consultation as one text blob, so a question
+about individual turns ("how many exam requests did gpt-4o make per case?") means
+fetching and parsing every blob. The turns table stores one row per turn, written in
+the same transaction as the case_results row. Each row has the speaker, the turn's
+action (from the events in events.py), its content, token counts, reply latency and
+the resolved cost of any tests it requested. These questions then become SQL
+aggregates:
+
+    SELECT c.llm, COUNT(*) * 1.0 / COUNT(DISTINCT t.result_id)
+    FROM turns t JOIN case_results c ON c.rowid = t.result_id
+    WHERE t.action = 'exam_request' GROUP BY c.llm;
+
+Rows stored before the table existed are filled in with the backfill:
+
+    python backfill_turns.py --db medical_cases.db
+"""
+
+from typing import Dict, Any, List, Optional
+
+from .cost_index import fill_unresolved
+from .cost_resolver import resolve_test_request
+from .cost_retrieval import extract_test_requests
+from .events import extract_events, parse_conversation_log
+from .log_store import iter_conversation_logs
+
+# Turn actions, in order of precedence when a Doctor turn contains several markers
+DOCTOR_ACTIONS = ('diagnosis', 'test_request', 'exam_request', 'question')
+
+# Action of every turn by the other agents
+SPEAKER_ACTIONS = {'Patient': 'answer', 'MeasurementAssistant': 'result', 'Grader': 'grade'}
+
+# Cases backfilled per transaction
+BACKFILL_BATCH = 200
+
+
+def init_turns(conn):
+    """Create the turns table and its indexes if they do not exist."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS turns
+                    (result_id INTEGER,
+                     turn INTEGER,
+                     speaker TEXT,
+                     action TEXT,
+                     content TEXT,
+                     input_tokens INTEGER,
+                     output_tokens INTEGER,
+                     latency REAL,
+                     cost REAL,
+                     PRIMARY KEY (result_id, turn)) WITHOUT ROWID''')
+    conn.execute('CREATE INDEX IF NOT EXISTS turns_action ON turns (action, speaker)')
+    conn.execute('CREATE INDEX IF NOT EXISTS turns_speaker ON turns (speaker, action)')
+    conn.commit()
+
+
+def turn_action(speaker: str, kinds: set) -> str:
+    """The action of a turn, from its speaker and the types of its events."""
+    if speaker == "Doctor":
+        return next((action for action in DOCTOR_ACTIONS if action in kinds), 'question')
+    return SPEAKER_ACTIONS.get(speaker, 'other')
+
+
+def build_turn_rows(messages: List[Dict[str, Any]], events: Optional[List[Dict[str, Any]]] = None,
+                    turn_tokens: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    Build the turns rows of a consultation.
+
+    Args:
+        messages: Consultation messages; "latency" and "investigations" are used when present
+        events: The messages' events, extracted here if not given
+        turn_tokens: TurnTokenCounter.turns (or turn_tokens rows) for the token columns
+
+    Returns:
+        One {"turn", "speaker", "action", "content", "input_tokens", "output_tokens",
+        "latency", "cost"} dict per message
+    """
+    if events is None:
+        events = extract_events(messages)
+    kinds = {}
+    for event in events:
+        kinds.setdefault(event['turn'], set()).add(event['type'])
+    tokens = {t['turn']: t for t in turn_tokens or []}
+
+    rows = []
+    for turn, message in enumerate(messages):
+        speaker = message.get("name", "Unknown")
+        investigations = message.get("investigations")
+        counted = tokens.get(turn, {})
+        rows.append({
+            'turn': turn,
+            'speaker': speaker,
+            'action': turn_action(speaker, kinds.get(turn, set())),
+            'content': message.get("content", ""),
+            'input_tokens': counted.get('input_tokens'),
+            'output_tokens': counted.get('output_tokens'),
+            'latency': message.get("latency"),
+            'cost': sum(record['cost'] for record in investigations) if investigations is not None else None,
+        })
+    return rows
+
+
+def save_turns(conn, result_id: int, rows: List[Dict[str, Any]]):
+    """
+    Store the turns of a case. Does not commit; the caller commits together with the result row.
+
+    Args:
+        conn: Open sqlite3 connection
+        result_id: rowid of the case's case_results row
+        rows: Rows from build_turn_rows
+    """
+    conn.executemany('INSERT OR REPLACE INTO turns (result_id, turn, speaker, action, content, input_tokens, output_tokens, latency, cost) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     [(result_id, r['turn'], r['speaker'], r['action'], r['content'], r['input_tokens'], r['output_tokens'], r['latency'], r['cost']) for r in rows])
+
+
+def backfill_turns(conn, batch: int = BACKFILL_BATCH) -> int:
+    """
+    Parse the conversation_log of every case_results row without turns and store its turns.
+
+    Test requests are costed with the same resolver as live runs, and token counts are
+    taken from turn_tokens where the case has them. Latency is unknown for old rows.
+
+    Returns:
+        Number of case_results rows backfilled
+    """
+    init_turns(conn)
+    has_turn_tokens = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'turn_tokens'").fetchone()
+    pending = list(iter_conversation_logs(conn, 'NOT EXISTS (SELECT 1 FROM turns WHERE turns.result_id = case_results.rowid)'))
+    for done, (result_id, conversation_log) in enumerate(pending, 1):
+        messages = parse_conversation_log(conversation_log)
+        for turn, message in enumerate(messages):
+            if message['name'] == "Doctor":
+                requests = extract_test_requests(message['content'])
+                if requests:
+                    message['investigations'] = fill_unresolved([record for request in requests for record in resolve_test_request(request, turn)])
+        turn_tokens = None
+        if has_turn_tokens:
+            turn_tokens = [{'turn': turn, 'input_tokens': input_tokens, 'output_tokens': output_tokens} for turn, input_tokens, output_tokens in
+                           conn.execute('SELECT turn, input_tokens, output_tokens FROM turn_tokens WHERE case_id = ?', (result_id,))]
+        rows = build_turn_rows(messages, turn_tokens=turn_tokens)
+        save_turns(conn, result_id, rows)
+        # Keeps case_summary's mean turns in step (through its update trigger)
+        conn.execute('UPDATE case_results SET turn_count = ? WHERE rowid = ? AND turn_count IS NULL', (len(rows) or None, result_id))
+        if done % batch == 0:
+            conn.commit()
+            print(f"Backfilled {done}/{len(pending)} cases")
+    conn.commit()
+    return len(pending)
+
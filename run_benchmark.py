@@ -0,0 +1,112 @@
+import argparse
+import glob
+import os
+import uuid
+from multi_med.runner import run_cases
+from multi_med.sharding import run_sharded
+from multi_med.llm_cache import configure_cache, get_cache
+from multi_med.replay import RunArchive
+from multi_med.context import parse_context_policy
+
+def parse_model_limit(value):
+    """Parse a MODEL=N argument into a (model, limit) pair."""
+    name, _, limit = value.rpartition('=')
+    if not name or not limit.isdigit() or int(limit) < 1:
+        raise argparse.ArgumentTypeError(f"Invalid model limit '{value}', expected MODEL=N")
+    return name, int(limit)
+
+def context_policy(value):
+    """Parse a ROLE=VIEW[:WINDOW] argument, keeping it in MULTI_MED_CONTEXT form."""
+    try:
+        parse_context_policy(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+def main():
+    parser = argparse.ArgumentParser(description='Run medical cases concurrently')
+    parser.add_argument('--cases', nargs='+', default=['cases/*_all_cases.jsonl'], help='Case files or glob patterns to run')
+    parser.add_argument('--doctor-models', nargs='+', default=['gpt-4o-mini'], help='Doctor models to evaluate')
+    parser.add_argument('--other-model', type=str, default='gemini-2.5-flash', help='Model for the Patient, MeasurementAssistant and Grader agents')
+    parser.add_argument('--start', type=int, default=0, help='Start case number in each file (0-based index, inclusive)')
+    parser.add_argument('--end', type=int, default=None, help='End case number in each file (0-based index, exclusive)')
+    parser.add_argument('--max-concurrent-cases', type=int, default=None, help='Maximum number of cases in flight at once (default: 8, or the number of --processes)')
+    parser.add_argument('--model-limit', type=parse_model_limit, action='append', default=[], metavar='MODEL=N', help='Maximum in-flight cases for one model (repeatable)')
+    parser.add_argument('--processes', type=int, default=0, help='Spread cases over this many worker processes instead of threads (0 = threads)')
+    parser.add_argument('--run-id', type=str, default=None, help='Journal id of the run to start or resume (defaults to one derived from the other arguments)')
+    parser.add_argument('--cache', type=str, default=None, metavar='PATH', help='Cache LLM replies in this SQLite file (off by default)')
+    parser.add_argument('--cache-max-mb', type=float, default=512, help='Maximum size of the reply cache in MB')
+    parser.add_argument('--cache-roles', nargs='+', default=None, help='Only cache replies from these agents (e.g. Patient Grader)')
+    parser.add_argument('--record', type=str, default=None, metavar='PATH', help='Record every LLM request/response into this .jsonl.gz archive')
+    parser.add_argument('--replay', type=str, default=None, metavar='PATH', help='Serve LLM responses from a recorded archive instead of the network')
+    parser.add_argument('--cost-prompt', choices=['full', 'retrieval'], default=None, help='Give the MeasurementAssistant the full cost list, or only the entries matching each test request (default: MULTI_MED_COST_PROMPT or full)')
+    parser.add_argument('--case-prompt', choices=['compact', 'raw'], default=None, help='Render case data into agent prompts as compact labelled text, or as the raw dicts of earlier runs (default: MULTI_MED_CASE_PROMPT or raw)')
+    parser.add_argument('--grading', choices=['local', 'llm', 'deferred'], default=None, help='Grade exact diagnosis matches locally and call the Grader LLM only for the rest, always call the Grader, or grade the rest after the run with grade_deferred.py (default: MULTI_MED_GRADING or llm)')
+    parser.add_argument('--context', type=context_policy, action='append', default=[], metavar='ROLE=VIEW[:WINDOW]', help='What one agent is sent of the conversation: all, own (its own exchanges) or last (the message it replies to), optionally limited to its last WINDOW messages (repeatable; default: MULTI_MED_CONTEXT, or every role sees all)')
+    parser.add_argument('--flush-interval', type=float, default=None, metavar='SECONDS', help='Commit finished cases to the database at most this often (0 = every case; default: MULTI_MED_FLUSH_INTERVAL or 2)')
+    parser.add_argument('--db', type=str, default='medical_cases.db', help='Results database')
+    parser.add_argument('--notes', type=str, default='', help='Notes about this run (e.g., experimental conditions, changes made)')
+    args = parser.parse_args()
+
+    if args.cost_prompt:
+        # Set in the environment so --processes workers use the same mode
+        os.environ['MULTI_MED_COST_PROMPT'] = args.cost_prompt
+    if args.case_prompt:
+        os.environ['MULTI_MED_CASE_PROMPT'] = args.case_prompt
+    if args.grading:
+        os.environ['MULTI_MED_GRADING'] = args.grading
+    if args.context:
+        os.environ['MULTI_MED_CONTEXT'] = ','.join(args.context)
+    if args.flush_interval is not None:
+        os.environ['MULTI_MED_FLUSH_INTERVAL'] = str(args.flush_interval)
+    if args.cache:
+        configure_cache(args.cache, args.cache_max_mb, args.cache_roles)
+    cache = get_cache()
+    cache_stats_before = cache.stats() if cache else {}
+
+    cases_files = sorted({path for pattern in args.cases for path in (glob.glob(pattern) or [pattern])})
+
+    if args.record and args.replay:
+        parser.error('--record and --replay cannot be used together')
+    archive = None
+    if args.record:
+        archive = RunArchive(args.record, 'record')
+    elif args.replay:
+        archive = RunArchive(args.replay, 'replay')
+        # A replay is a fresh run of already-finished cases, so never resume a journal by default
+        args.run_id = args.run_id or f"replay-{uuid.uuid4().hex[:12]}"
+
+    if args.processes > 0:
+        run_sharded(cases_files,
+                    args.doctor_models,
+                    args.other_model,
+                    notes=args.notes,
+                    processes=args.processes,
+                    max_concurrent_cases=args.max_concurrent_cases,
+                    model_limits=dict(args.model_limit),
+                    start=args.start,
+                    end=args.end,
+                    db_path=args.db,
+                    run_id=args.run_id,
+                    archive=archive)
+    else:
+        run_cases(cases_files,
+                  args.doctor_models,
+                  args.other_model,
+                  notes=args.notes,
+                  max_concurrent_cases=args.max_concurrent_cases or 8,
+                  model_limits=dict(args.model_limit),
+                  start=args.start,
+                  end=args.end,
+                  db_path=args.db,
+                  run_id=args.run_id,
+                  archive=archive)
+
+    if cache:
+        # Counters are shared by every run using the cache file, so report this run's share
+        for role, counts in cache.stats().items():
+            before = cache_stats_before.get(role, {'hits': 0, 'misses': 0})
+            print(f"Cache {role}: {counts['hits'] - before['hits']} hits, {counts['misses'] - before['misses']} misses")
+
+if __name__ == "__main__":
+    main()